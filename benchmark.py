@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""Benchmark the parse and broadcast paths on any Linux box - no camera, Pi or Hailo needed
+
+Runs the monitor in this process on a replayed or synthetic detection stream, with
+load_generator.py's WebSocket clients in a separate process so their CPU isn't
+counted, and reports:
+
+- lines/s through the detection parser alone
+- lines/s and frames/s ingested, and frames/s broadcast, by the full pipeline
+- CPU time per frame in the monitor process
+- per-client delivery latency percentiles (monitor side, and as seen by the clients)
+
+Save a run with --output and compare a later run against it with --compare.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from itertools import islice
+
+from combined_monitor import CameraMonitor
+from detection_parser import DetectionParser
+from monitor_config import DETECTION_LABELS
+from monitor_logging import configure_logging
+from replay_source import synthetic_log_lines
+
+# Figures compared by --compare, and whether higher is better
+HEADLINE = {
+    "parser.lines_per_second": True,
+    "pipeline.lines_per_second": True,
+    "pipeline.frames_per_second": True,
+    "pipeline.frames_broadcast_per_second": True,
+    "pipeline.cpu_ms_per_frame": False,
+    "pipeline.server_latency.delivery.p99_ms": False,
+    "clients.delivery_latency.p99_ms": False,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def benchmark_parser(lines=100000):
+    """Parser throughput on synthetic log lines, outside the event loop"""
+    parser = DetectionParser(DETECTION_LABELS)
+    sample = [line.decode() for line in islice(synthetic_log_lines(DETECTION_LABELS), lines)]
+    parse = parser.parse
+    started = time.perf_counter()
+    for line in sample:
+        parse(line)
+    elapsed = time.perf_counter() - started
+    return {"lines": lines, "lines_per_second": round(lines / elapsed)}
+
+
+async def benchmark_pipeline(replay, clients, duration, warmup, url_options="", cameras=1, tracking=False,
+                             binary=False):
+    """Run the monitor on a replay with `clients` external WebSocket clients connected
+
+    Tracking is off by default so every frame is broadcast: with it on, a steady scene
+    is only republished when it changes, which measures the tracker rather than the
+    broadcast path.
+    """
+    port = free_port()
+    monitor = CameraMonitor(metrics_port=0, replay=replay, websocket_port=port, tracking=tracking,
+                            cameras=[{"name": f"cam{index}", "camera": index} for index in range(cameras)])
+    sources = list(monitor.sources.values())
+    tasks = [asyncio.create_task(monitor.start_websocket_server())]
+    await asyncio.sleep(0.5)  # server listening before the clients arrive
+
+    load = None
+    if clients:
+        command = [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_generator.py"),
+            "--url", f"ws://127.0.0.1:{port}/{url_options}",
+            "--clients", str(clients), "--duration", str(warmup + duration + 1), "--ramp", str(warmup / 2),
+        ]
+        if binary:
+            command.append("--binary")
+        load = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+    for source in sources:
+        tasks.append(asyncio.create_task(source.run()))
+        tasks.append(asyncio.create_task(monitor.distribute_scenes(source)))
+    await asyncio.sleep(warmup)
+
+    # Measure a steady window, with every client connected
+    lines = sum(source.lines_read for source in sources)
+    frames = sum(source.frame_count for source in sources)
+    broadcast = monitor.frames_broadcast
+    coalesced = sum(source.scene_queue.coalesced for source in sources)
+    cpu = time.process_time()
+    started = time.monotonic()
+    await asyncio.sleep(duration)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu
+    lines = sum(source.lines_read for source in sources) - lines
+    frames = sum(source.frame_count for source in sources) - frames
+    broadcast = monitor.frames_broadcast - broadcast
+    connected = len(monitor.hub)
+    server_latency = monitor.latency_summary()
+    coalesced = sum(source.scene_queue.coalesced for source in sources) - coalesced
+
+    result = {
+        "replay": replay["replay"],
+        "rate": replay["rate"],
+        "cameras": cameras,
+        "tracking": tracking,
+        "binary": binary,
+        "clients_connected": connected,
+        "seconds": round(elapsed, 2),
+        "lines_per_second": round(lines / elapsed, 1),
+        "frames_per_second": round(frames / elapsed, 1),
+        "frames_broadcast_per_second": round(broadcast / elapsed, 1),
+        "frames_coalesced": coalesced,
+        "cpu_ms_per_frame": round(cpu * 1000 / frames, 4) if frames else None,
+        "cpu_utilisation": round(cpu / elapsed, 3),
+        "client_drops": monitor.hub.dropped,
+        "server_latency": server_latency,
+    }
+    client_summary = None
+    if load is not None:
+        stdout, _ = await load.communicate()
+        client_summary = json.loads(stdout) if stdout else None
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return result, client_summary
+
+
+def problems(report, clients):
+    """Reasons a run didn't measure what it claims to, e.g. clients that never connected"""
+    found = []
+    pipeline = report["pipeline"]
+    if pipeline["clients_connected"] < clients:
+        found.append(f"only {pipeline['clients_connected']} of {clients} clients were connected")
+    summary = report["clients"]
+    if clients and summary is None:
+        found.append("the load generator reported nothing")
+    elif summary and summary["errors"]:
+        found.append(f"{summary['errors']} of {clients} clients failed")
+    if not pipeline["frames_per_second"]:
+        found.append("no frames were processed")
+    return found
+
+
+def headline(report, key):
+    value = report
+    for part in key.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(report, baseline):
+    """Print the headline figures next to a saved baseline run"""
+    print(f"{'metric':45} {'baseline':>12} {'now':>12} {'change':>8}")
+    for key, higher_is_better in HEADLINE.items():
+        before, after = headline(baseline, key), headline(report, key)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        flag = " !" if worse and abs(change) >= 5 else ""
+        print(f"{key:45} {before:>12g} {after:>12g} {change:>+7.1f}%{flag}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the camera monitor parse and broadcast paths')
+    parser.add_argument('--replay', default='synthetic',
+                       help='rpicam log or metadata file to replay, or "synthetic" (default: synthetic)')
+    parser.add_argument('--replay-format', default='log', help='Format of the --replay file (default: log)')
+    parser.add_argument('--rate', type=float, default=0,
+                       help='Frames per second per camera, 0 for as fast as possible (default: 0)')
+    parser.add_argument('--cameras', type=int, default=1, help='Replayed cameras (default: 1)')
+    parser.add_argument('--clients', type=int, default=200, help='WebSocket clients (default: 200)')
+    parser.add_argument('--tracking', action='store_true',
+                       help='Run with object tracking, so only changed scenes are broadcast (default: off)')
+    parser.add_argument('--binary', action='store_true', help='Clients request the binary subprotocol')
+    parser.add_argument('--url-options', default='', help='Query string for the clients, e.g. "?stream=delta"')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds measured (default: 10)')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Seconds before measuring (default: 3)')
+    parser.add_argument('--parser-lines', type=int, default=100000, help='Lines for the parser-only run')
+    parser.add_argument('--output', metavar='PATH', help='Save the report as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against a report saved with --output')
+    return parser
+
+
+async def main():
+    args = build_arg_parser().parse_args()
+    configure_logging(level=logging.ERROR)  # alert warnings would fire on most synthetic frames
+
+    report = {"parser": benchmark_parser(args.parser_lines)}
+    replay = {"replay": args.replay, "replay_format": args.replay_format, "rate": args.rate, "loop": True}
+    report["pipeline"], report["clients"] = await benchmark_pipeline(
+        replay, args.clients, args.duration, args.warmup, args.url_options, args.cameras, args.tracking,
+        args.binary
+    )
+    print(json.dumps(report, indent=2))
+
+    # A run where the clients never got through measures nothing - don't let it become a baseline
+    failed = problems(report, args.clients)
+    if failed:
+        for problem in failed:
+            print(f"❌ INVALID RUN: {problem}", file=sys.stderr)
+        if args.output:
+            print(f"Not saving {args.output}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
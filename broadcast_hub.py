@@ -0,0 +1,261 @@
+"""Broadcast hub: one encoded payload per frame, fanned out to every WebSocket client without blocking"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+import websockets
+
+from metrics import CLIENT_STAGES, stage_histograms
+
+# What to do when a client's outbound buffer is full
+SLOW_CLIENT_POLICIES = ("drop_oldest", "latest", "disconnect")
+
+
+class ClientChannel:
+    """Bounded outbound buffer plus a dedicated sender task for one WebSocket connection"""
+
+    def __init__(self, websocket, max_queue, policy, logger, view=(None, "full", "json", None, None)):
+        self.websocket = websocket
+        address = getattr(websocket, "remote_address", None)
+        self.name = f"{address[0]}:{address[1]}" if address else "unknown"
+        self.view = view  # clients with equal views share one encoded payload per frame
+        self.max_queue = max_queue
+        self.policy = policy
+        self.logger = logger
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.slow_disconnect = False
+        self.version = None  # scene version of the newest payload queued for this client
+        self.last_ack = 0  # newest trace id the client has acknowledged
+        self.camera = view[0]  # camera picked at connect time (None = merged scene)
+        self.min_interval = 0.0  # seconds between scene messages, from the client's max_rate
+        self.last_push = 0.0
+        self.throttled_count = 0
+        self.occupancy = False  # opted in to periodic occupancy messages
+        self.latency = stage_histograms(CLIENT_STAGES)
+        self.needs_keyframe = True  # set until a full scene is delivered, and again after any drop
+        self.behind = False  # skipped messages for max_rate; catches up from self.version at its next slot
+        self.last_keyframe = 0.0  # when a keyframe was last queued, for periodic resyncs
+        self.task = asyncio.create_task(self._run())
+
+    def push(self, payload, version=None, text=True, trace=None, control=False):
+        """Queue a payload without waiting; apply the slow-consumer policy if the buffer is full
+
+        Pre-encoded bytes go out as text frames unless text is False. trace is the snapshot
+        the payload was built from; when given, write and delivery latency are recorded.
+        control marks a message the client can't do without (the binary class table, a
+        reply to a request), which the slow-consumer policies never drop.
+        """
+        if self.closed:
+            return False
+        queue = self.queue
+        if len(queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                self.slow_disconnect = True
+                self.close(1013, "slow consumer")
+                return False
+            dropped = self.dropped
+            if self.policy == "latest":
+                # Every pending scene is stale now - coalesce to the newest payload
+                kept = [entry for entry in queue if entry[3]]
+                self.dropped += len(queue) - len(kept)
+                queue.clear()
+                queue.extend(kept)
+            else:
+                for index, entry in enumerate(queue):
+                    if not entry[3]:
+                        del queue[index]
+                        self.dropped += 1
+                        break
+            if self.dropped != dropped:
+                self.needs_keyframe = True
+        queue.append((payload, text, trace, control))
+        if version is not None:
+            self.version = version
+            self.last_push = time.monotonic()
+        self.ready.set()
+        return True
+
+    def close(self, code=1000, reason=""):
+        """Stop sending and close the connection in the background"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.task.cancel()
+        asyncio.create_task(self.websocket.close(code, reason))
+
+    def throttled(self, now):
+        """True if the client's max_rate doesn't allow another scene message yet"""
+        return now - self.last_push < self.min_interval
+
+    async def _run(self):
+        queue = self.queue
+        websocket = self.websocket
+        try:
+            while True:
+                if not queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                payload, text, trace, _control = queue.popleft()
+                await websocket.send(payload, text=text)
+                self.sent += 1
+                self.bytes_sent += len(payload)
+                if trace is not None:
+                    written = time.monotonic()
+                    self.latency["write"].record(written - trace.t_enqueued)
+                    self.latency["delivery"].record(written - trace.t_read)
+        except websockets.exceptions.ConnectionClosed:
+            self.closed = True
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.closed = True
+            self.logger.error(f"Error sending to WebSocket client: {e}")
+
+
+class LatestQueue:
+    """Single-slot handoff between the camera reader and the broadcasters - latest scene wins
+
+    put_nowait() never waits: a scene that hasn't been taken yet is replaced (and counted
+    as coalesced), so a slow distribution stage can never stall the reader.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._pending = False
+        self._ready = asyncio.Event()
+        self.put_count = 0
+        self.coalesced = 0
+
+    def put_nowait(self, item):
+        if self._pending:
+            self.coalesced += 1
+        self._item = item
+        self._pending = True
+        self.put_count += 1
+        self._ready.set()
+
+    async def get(self):
+        while not self._pending:
+            self._ready.clear()
+            await self._ready.wait()
+        item = self._item
+        self._item = None
+        self._pending = False
+        return item
+
+
+class BroadcastHub:
+    """Fan out pre-encoded payloads to all connected clients through per-client bounded buffers
+
+    publish() never awaits a socket, so one slow client can't delay the others or the
+    camera reader feeding the hub.
+    """
+
+    def __init__(self, max_queue=8, policy="drop_oldest", logger=None):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy {policy!r}, expected one of {SLOW_CLIENT_POLICIES}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.logger = logger or logging.getLogger(__name__)
+        self.channels = {}
+        self.closed_dropped = 0  # drops counted by clients that have since disconnected
+        self.slow_disconnects = 0
+
+    def __len__(self):
+        return len(self.channels)
+
+    def add(self, websocket, view=(None, "full", "json", None, None)):
+        """Register a connection and start its sender task"""
+        channel = ClientChannel(websocket, self.max_queue, self.policy, self.logger, view)
+        self.channels[websocket] = channel
+        return channel
+
+    def remove(self, websocket):
+        """Unregister a connection and stop its sender task"""
+        channel = self.channels.pop(websocket, None)
+        if channel is not None:
+            channel.closed = True
+            channel.task.cancel()
+            self.closed_dropped += channel.dropped
+            if channel.slow_disconnect:
+                self.slow_disconnects += 1
+        return channel
+
+    def send_to(self, websocket, payload, version=None, text=True):
+        """Queue a payload for a single client"""
+        channel = self.channels.get(websocket)
+        return channel is not None and channel.push(payload, version, text)
+
+    def publish(self, payload, version=None, text=True):
+        """Queue the same payload for every client; returns how many clients accepted it"""
+        delivered = 0
+        stale = []
+        for websocket, channel in self.channels.items():
+            if channel.push(payload, version, text):
+                delivered += 1
+            elif channel.closed:
+                stale.append(websocket)
+        for websocket in stale:
+            self.remove(websocket)
+        if stale:
+            self.logger.info(f"Removed {len(stale)} disconnected WebSocket clients")
+        return delivered
+
+    def publish_views(self, encode, version=None, trace=None):
+        """Queue one payload per client, encoding it once per distinct (view, needs_keyframe, since)
+
+        encode(view, keyframe, since) returns (payload, text), or None to send nothing to that
+        group. since is None for clients in sync, else the scene version a rate-limited client
+        last got, so delta clients can be sent everything they skipped as one merged delta.
+        Returns how many clients accepted a payload.
+        """
+        encoded = {}
+        delivered = 0
+        stale = []
+        now = time.monotonic()
+        for websocket, channel in self.channels.items():
+            throttled = channel.min_interval and channel.throttled(now)
+            if throttled and channel.behind:
+                channel.throttled_count += 1
+                continue
+            key = (channel.view, channel.needs_keyframe, channel.version if channel.behind else None)
+            if key in encoded:
+                message = encoded[key]
+            else:
+                message = encoded[key] = encode(*key)
+            if message is None:
+                continue
+            if throttled:
+                # Rate-limited clients skip this message and catch up at their next slot
+                channel.throttled_count += 1
+                if channel.version is None:
+                    channel.needs_keyframe = True
+                elif not channel.needs_keyframe:
+                    channel.behind = True
+                continue
+            if channel.push(message[0], version, message[1], trace):
+                delivered += 1
+                channel.behind = False
+                if key[1]:
+                    channel.needs_keyframe = False
+                    channel.last_keyframe = now
+            elif channel.closed:
+                stale.append(websocket)
+        for websocket in stale:
+            self.remove(websocket)
+        if stale:
+            self.logger.info(f"Removed {len(stale)} disconnected WebSocket clients")
+        return delivered
+
+    @property
+    def dropped(self):
+        """Total payloads dropped by the slow-consumer policy since startup"""
+        return self.closed_dropped + sum(channel.dropped for channel in self.channels.values())
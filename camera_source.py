@@ -0,0 +1,392 @@
+"""One rpicam pipeline: camera process, detection ingest and the scene snapshots it produces"""
+import asyncio
+import logging
+import os
+import subprocess
+import time
+from datetime import datetime
+
+from broadcast_hub import LatestQueue
+from detection_parser import DetectionParser, METADATA_PARSERS
+from monitor_config import (
+    DETECTION_LABELS, CAMERA_RESTART_DELAY, CLIP_INTRA_PERIOD,
+    TRACK_IOU_THRESHOLD, TRACK_CONFIRM_FRAMES, TRACK_DROP_FRAMES, ALERT_ON_FRAMES, ALERT_OFF_FRAMES,
+    TRACK_CONFIDENCE_STEP, TRACKING, ZONE_ANCHOR, ALERT_RULES, RULE_LEVEL_STEP
+)
+from monitor_logging import log_key
+from scene import SceneSnapshot, EMPTY_SCENE
+from tracker import ObjectTracker
+from rules import RuleEngine
+from zones import ZoneMap
+
+# Size of each read from the rpicam-vid video pipe (bytes)
+VIDEO_READ_SIZE = 64 * 1024
+# Size of each read from the detection metadata FIFO (bytes)
+METADATA_READ_SIZE = 16 * 1024
+# How many recent trace ids can still be matched to a client ack
+RECENT_TRACES = 256
+
+POST_PROCESS_FILE = "/home/pi/rpicam-apps/assets/hailo_yolov8_inference.json"
+
+# extra= for the rate-limited per-frame log lines (limits in monitor_config.LOG_RATE_LIMITS)
+FRAME_LOG = log_key("frame")
+RAW_DETECTION_LOG = log_key("raw_detection")
+FRAME_OBJECTS_LOG = log_key("frame_objects")
+
+
+def remember_snapshot(recent_snapshots, snapshot):
+    """Keep recent snapshots by trace id so client acks can be matched to their read time"""
+    recent_snapshots[snapshot.version] = snapshot
+    if len(recent_snapshots) > RECENT_TRACES:
+        del recent_snapshots[next(iter(recent_snapshots))]
+
+
+class CameraSource:
+    """A camera's own process, ingest tasks, parser state and latest scene
+
+    Each source hands its scenes to its own latest-scene queue, so a stalled camera
+    can't hold up another camera's frames.
+    """
+
+    def __init__(self, name="cam0", camera=0, show_preview=False, video_output="drop", metadata_fifo=None,
+                 metadata_format="jsonl", latency=None, recent_snapshots=None, logger=None, tracking=TRACKING,
+                 zones=None):
+        self.name = name
+        self.camera = camera  # rpicam --camera index
+        self.current_detection = {"person": 0, "cup": 0}
+        self.current_confidence = {"person": 0.0, "cup": 0.0}
+        self.all_objects = {}
+        self.detections = []  # (label, confidence, box) tuples for the current frame
+        self.detection_parser = DetectionParser(DETECTION_LABELS)
+        # Stable object identities across frames; scenes are only published when the tracked state changes
+        self.tracker = ObjectTracker(TRACK_IOU_THRESHOLD, TRACK_CONFIRM_FRAMES, TRACK_DROP_FRAMES, ALERT_ON_FRAMES,
+                                     ALERT_OFF_FRAMES, TRACK_CONFIDENCE_STEP) if tracking else None
+        self.frames_unchanged = 0  # frames whose tracked scene wasn't worth a broadcast
+        self.awaiting_detections = False  # a "#N" frame line was seen and no detection line yet
+        # Regions of the image (doorway, desk...) with their own object counts and alert rules
+        self.zone_map = ZoneMap(zones, ZONE_ANCHOR) if zones else None
+        self.rules = RuleEngine(ALERT_RULES, name, RULE_LEVEL_STEP)
+        self.snapshot = EMPTY_SCENE  # rebuilt once per frame
+        # Camera reader -> broadcasters handoff; the reader never waits on clients
+        self.scene_queue = LatestQueue()
+        self.latency = latency  # shared stage histograms ("parse" is recorded here)
+        self.recent_snapshots = recent_snapshots if recent_snapshots is not None else {}
+        self.camera_process = None
+        self.camera_restarts = 0
+        self.frame_count = 0
+        self.lines_read = 0
+        self.label_detections = {}  # label -> objects detected since start
+        self.last_detection_time = None
+        self.show_preview = show_preview
+        # "drop": no encoded video leaves rpicam-vid, "pipe": video on stdout for video_consumers
+        self.video_output = video_output
+        self.video_consumers = []
+        self.clip_recorder = None
+        # Called with every frame's snapshot, before the latest-scene queue coalesces them
+        self.scene_consumers = []
+        # Structured per-frame metadata from the post-processing stage (replaces log scraping)
+        self.metadata_fifo = metadata_fifo
+        self.metadata_format = metadata_format
+        self.last_frame_sequence = None
+        self.last_frame_timestamp = None
+        self.logger = logger or logging.getLogger(__name__)
+
+    def command(self):
+        """rpicam command line for this camera"""
+        # Detections are only scraped from verbose logs when no metadata FIFO is in use
+        verbosity = "1" if self.metadata_fifo else "2"
+
+        # Use different commands for preview vs headless mode
+        if self.show_preview:
+            # Use rpicam-hello for preview mode - it's designed for this
+            return [
+                "rpicam-hello", "--camera", str(self.camera), "-v", verbosity, "-t", "0",
+                "--post-process-file", POST_PROCESS_FILE,
+                "--lores-width", "640", "--lores-height", "640"
+            ]
+
+        # Use rpicam-vid for headless mode. Detection logs always arrive on stderr;
+        # encoded video only goes to stdout when a video consumer wants it.
+        cmd = [
+            "rpicam-vid", "--camera", str(self.camera), "-n", "-v", verbosity, "-t", "0", "--inline",
+            "--post-process-file", POST_PROCESS_FILE,
+            "--width", "640", "--height", "640",
+            "--framerate", "10"
+        ]
+        if self.video_output == "pipe":
+            cmd += ["-o", "-"]
+            if self.clip_recorder:
+                # Frequent keyframes so the pre-roll can start near the requested time
+                cmd += ["--intra", str(CLIP_INTRA_PERIOD)]
+        else:
+            # Skip H.264 encoding entirely - nothing would read it
+            cmd += ["--codec", "yuv420"]
+        return cmd
+
+    async def run(self):
+        """Start the camera process and monitor its output, restarting it whenever it exits"""
+        cmd = self.command()
+        mode = "with preview window (rpicam-hello)" if self.show_preview else "headless (rpicam-vid)"
+        self.logger.info(f"Starting camera {self.name} {mode}...")
+        self.logger.info(f"Command: {' '.join(cmd)}")
+
+        if self.show_preview:
+            self.logger.info("📺 Preview window should appear for testing")
+        else:
+            self.logger.info("🔒 Running headless - suitable for SSH connections")
+
+        pipe_video = not self.show_preview and self.video_output == "pipe"
+
+        # Supervise the camera: restart it whenever it exits
+        while True:
+            try:
+                # Keep the text and video channels apart so the parser never sees H.264 bytes
+                self.camera_process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=subprocess.PIPE if pipe_video else subprocess.DEVNULL,
+                    stderr=subprocess.PIPE
+                )
+
+                self.logger.info(f"Camera {self.name} process started successfully")
+                tasks = [self.process_camera_output()]
+                if pipe_video:
+                    tasks.append(self.process_video_output())
+                if self.metadata_fifo:
+                    tasks.append(self.process_metadata_output())
+                await asyncio.gather(*tasks)
+                returncode = await self.camera_process.wait()
+                self.logger.warning(f"Camera {self.name} process exited with code {returncode}")
+
+            except Exception as e:
+                self.logger.error(f"Error starting camera {self.name}: {e}")
+
+            await asyncio.sleep(CAMERA_RESTART_DELAY)
+            self.camera_restarts += 1
+            self.logger.info(f"🔄 Restarting camera {self.name} (restart #{self.camera_restarts})")
+
+    async def process_camera_output(self):
+        """Process camera log output (stderr) and detect objects"""
+        if not self.camera_process:
+            return
+
+        self.logger.info(f"Starting camera {self.name} output processing...")
+
+        async for line_bytes in self.camera_process.stderr:
+            self.ingest_log_line(line_bytes)
+
+    def ingest_log_line(self, line_bytes):
+        """Handle one line of camera log output; returns True if it completed a frame
+
+        rpicam prints a "#N (fps) ..." line for every frame but a detection line only for
+        frames with objects, so a frame line with no detection line since the previous one
+        is an empty frame - the tracker has to see those for its tracks to drop.
+        """
+        t_read = time.monotonic()
+        self.lines_read += 1
+        try:
+            line = line_bytes.decode('utf-8').strip()
+
+            # Log all output for debugging (you can reduce this later)
+            if line and not line.startswith('#'):
+                self.logger.debug("Camera %s output: %s", self.name, line)
+
+            # Detections come from the metadata FIFO instead; logs are only drained
+            if self.metadata_fifo:
+                return False
+
+            if line.startswith('#'):
+                empty_frame = self.awaiting_detections
+                self.awaiting_detections = True
+                # Without tracking an already empty scene has nothing to clear
+                if empty_frame and (self.tracker is not None or self.all_objects):
+                    self.frame_count += 1
+                    if self.update_scene([], t_read):
+                        self.scene_queue.put_nowait(self.snapshot)
+                    return True
+                return False
+
+            # Parse YOLO detection output (returns None for non-detection lines)
+            detections = self.detection_parser.parse(line)
+            if detections:
+                self.awaiting_detections = False
+                self.frame_count += 1
+                self.last_detection_time = datetime.now()
+
+                self.logger.info("[%s] Frame %d: Processing detection line", self.name, self.frame_count,
+                                 extra=FRAME_LOG)
+                if self.parse_detection_line(line, detections, t_read):
+                    self.scene_queue.put_nowait(self.snapshot)
+                return True
+
+        except UnicodeDecodeError as e:
+            self.logger.warning(f"Failed to decode line: {e}")
+        except Exception as e:
+            self.logger.error(f"Error processing camera {self.name} output: {e}")
+        return False
+
+    async def process_video_output(self):
+        """Drain encoded video from stdout and hand each chunk to the video consumers"""
+        if not self.camera_process:
+            return
+
+        self.logger.info(f"Starting camera {self.name} video output processing "
+                         f"({len(self.video_consumers)} consumers)...")
+
+        while True:
+            chunk = await self.camera_process.stdout.read(VIDEO_READ_SIZE)
+            if not chunk:
+                break
+            for consumer in self.video_consumers:
+                try:
+                    consumer(chunk)
+                except Exception as e:
+                    self.logger.error(f"Error in video consumer: {e}")
+
+        self.logger.info(f"Camera {self.name} video output ended")
+
+    async def process_metadata_output(self):
+        """Read structured per-frame detection metadata from the FIFO written by the post-processing stage"""
+        if not os.path.exists(self.metadata_fifo):
+            os.mkfifo(self.metadata_fifo)
+
+        loop = asyncio.get_running_loop()
+        self.logger.info(f"Reading {self.metadata_format} detection metadata from {self.metadata_fifo}")
+
+        while self.camera_process and self.camera_process.returncode is None:
+            metadata_parser = METADATA_PARSERS[self.metadata_format](DETECTION_LABELS)
+            reader = asyncio.StreamReader()
+            # O_NONBLOCK so opening the FIFO doesn't wait for the writer to appear
+            fifo = os.fdopen(os.open(self.metadata_fifo, os.O_RDONLY | os.O_NONBLOCK), 'rb', buffering=0)
+            transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), fifo)
+            try:
+                while True:
+                    chunk = await reader.read(METADATA_READ_SIZE)
+                    if not chunk:
+                        break
+                    t_read = time.monotonic()
+                    for sequence, timestamp, detections in metadata_parser.feed(chunk):
+                        self.ingest_metadata_frame(sequence, timestamp, detections, t_read)
+            except Exception as e:
+                self.logger.error(f"Error processing detection metadata: {e}")
+            finally:
+                transport.close()
+
+            # Writer went away - wait a moment before reopening the FIFO
+            await asyncio.sleep(0.5)
+
+        self.logger.info(f"Camera {self.name} detection metadata ended")
+
+    def ingest_metadata_frame(self, sequence, timestamp, detections, t_read):
+        """Handle one frame record from the metadata stream"""
+        self.frame_count += 1
+        self.last_detection_time = datetime.now()
+        self.last_frame_sequence = sequence
+        self.last_frame_timestamp = timestamp
+        if self.update_scene(detections, t_read):
+            self.scene_queue.put_nowait(self.snapshot)
+
+    def is_detection_line(self, line):
+        """Check if this line contains object detection info"""
+        return self.detection_parser.is_detection_line(line)
+
+    def parse_detection_line(self, line, detections=None, t_read=None):
+        """Parse a detection line and update object counts with confidence"""
+        if detections is None:
+            detections = self.detection_parser.parse(line) or []
+
+        # Log the raw detection line
+        self.logger.info("[%s] Raw detection: %s", self.name, line, extra=RAW_DETECTION_LOG)
+
+        return self.update_scene(detections, t_read)
+
+    def update_scene(self, detections, t_read=None):
+        """Replace the current scene with this frame's (label, confidence, box) detections
+
+        Returns True if the scene should be broadcast. With tracking, the scene comes from
+        the confirmed tracks and is only republished when the tracked state (or what is in
+        each zone) changes; scene consumers still see every frame.
+        """
+        # Reset for this frame
+        self.current_detection = {"person": 0, "cup": 0}
+        self.current_confidence = {"person": 0.0, "cup": 0.0}
+        self.detections = detections
+
+        # Single pass: per-label count and confidence sum
+        counts = {}
+        totals = {}
+        for label, confidence, _box in detections:
+            if label in counts:
+                counts[label] += 1
+                totals[label] += confidence
+            else:
+                counts[label] = 1
+                totals[label] = confidence
+
+        label_detections = self.label_detections
+        for label, count in counts.items():
+            label_detections[label] = label_detections.get(label, 0) + count
+
+        now = time.monotonic()
+        tracker = self.tracker
+        if tracker is None:
+            self.all_objects = {
+                label: {"count": count, "confidence": totals[label] / count}
+                for label, count in counts.items()
+            }
+        else:
+            tracker.update(detections, now)
+            self.all_objects = tracker.scene()
+
+        # Update legacy fields for backwards compatibility
+        for obj in ("person", "cup"):
+            if obj in self.all_objects:
+                self.current_detection[obj] = self.all_objects[obj]["count"]
+                self.current_confidence[obj] = self.all_objects[obj]["confidence"]
+
+        # Zones place the tracked objects when tracking, else this frame's detections
+        zones = None
+        zone_map = self.zone_map
+        if zone_map is not None:
+            placed = detections
+            if tracker is not None:
+                placed = [(track.label, track.confidence, track.box) for track in tracker.tracks if track.confirmed]
+            zones = zone_map.evaluate(placed)
+
+        # Alert rules (ALERT_RULES), or any zone's alert rule
+        rules = self.rules.evaluate(self.all_objects, zones, now)
+        alert = self.rules.alert
+        if zones and not alert:
+            alert = any(zone["alert"] for zone in zones.values())
+        publish = True
+        tracks = None
+        if tracker is not None:
+            alert = tracker.update_alert(alert)
+            publish = tracker.changed()
+            if zone_map is not None:
+                publish = zone_map.changed(zones) or publish
+            publish = self.rules.changed() or publish
+            if publish:
+                tracks = tracker.track_list(now)
+        snapshot = SceneSnapshot(self.frame_count, self.all_objects, self.current_detection,
+                                 self.current_confidence, alert=alert, t_read=t_read, camera=self.name,
+                                 tracks=tracks, zones=zones, rules=rules)
+        if self.latency is not None:
+            self.latency["parse"].record(snapshot.t_parsed - snapshot.t_read)
+        for consumer in self.scene_consumers:
+            try:
+                consumer(snapshot)
+            except Exception as e:
+                self.logger.error(f"Error in scene consumer: {e}")
+        if publish:
+            self.snapshot = snapshot
+            remember_snapshot(self.recent_snapshots, snapshot)
+        else:
+            self.frames_unchanged += 1
+
+        # Verbose logging
+        if self.all_objects:
+            self.logger.info("[%s] Frame %d objects: %s", self.name, self.frame_count, snapshot.summary,
+                             extra=FRAME_OBJECTS_LOG)
+        else:
+            self.logger.debug("[%s] Frame %d: No objects detected", self.name, self.frame_count)
+        return publish
@@ -0,0 +1,497 @@
+"""Pico client core: WebSocket framing, message decoding and the duty decision
+
+Everything here is independent of the needle, LED and buzzer hardware, so it can be
+imported on its own - by main.py on the Pico, and by pico_harness.py under CPython
+with stub MicroPython modules.
+"""
+import ubinascii
+import uasyncio as asyncio
+import os
+import time
+import micropython
+import re
+import ujson as json
+import math
+from array import array
+from config import *
+
+# Receive/transmit buffer sizes (bytes) - larger frames are skipped
+RX_BUFFER_SIZE = 2048
+TX_BUFFER_SIZE = 512
+
+# Binary wire format (peeperpam.bin.v1) - must match wire_format.py on the server
+BINARY_SUBPROTOCOL = b"peeperpam.bin.v1"
+MSG_CLASS_TABLE = 1
+MSG_SCENE = 2
+MSG_DUTY = 3
+FLAG_ALERT = 0x01
+FLAG_DELTA = 0x02
+FLAG_SOUND = 0x04
+SCENE_HEADER_SIZE = 8
+SCENE_ENTRY_SIZE = 3
+
+# Scene decoded from binary messages, preallocated so decoding doesn't allocate
+class_ids = {}                 # label -> class id, from the server's class table
+scene_count = bytearray(256)   # object count per class id
+scene_conf = bytearray(256)    # quantized confidence (0-255) per class id
+ZERO_TABLE = bytes(256)
+scene_alert = False
+scene_avg_conf = 0
+message_trace = 0              # trace id of the message being handled (0 = none), acked after the duty is applied
+message_sound = None           # server's sound decision for a JSON duty message (None = decide locally)
+
+# Preallocated frame buffers - frames are read and parsed in place, never regrown
+rx_buffer = bytearray(RX_BUFFER_SIZE)
+rx_view = memoryview(rx_buffer)
+header_buffer = bytearray(8)
+header_view = memoryview(header_buffer)
+mask_buffer = bytearray(4)
+mask_view = memoryview(mask_buffer)
+tx_buffer = bytearray(TX_BUFFER_SIZE)
+tx_view = memoryview(tx_buffer)
+
+@micropython.viper
+def xor_mask(buf: ptr8, length: int, key: ptr8):
+    """Apply a WebSocket masking key in place"""
+    i = 0
+    while i < length:
+        buf[i] = buf[i] ^ key[i & 3]
+        i += 1
+
+def build_sound_table(effect):
+    """Precompute an effect's buzzer frequency and duty for every UFO_STEP_MS step"""
+    fade_in = effect["fade_in"]
+    sustain_end = fade_in + effect["sustain"]
+    fade_out = effect["fade_out"]
+    total_time = sustain_end + fade_out
+    lfo = 2 * math.pi * effect["lfo_rate"]
+    volume_depth = effect["volume_depth"]
+    steps = int(total_time * 1000 / UFO_STEP_MS) + 1
+    freqs = array('H', bytes(2 * steps))
+    duties = array('H', bytes(2 * steps))
+
+    for i in range(steps):
+        t = i * UFO_STEP_MS / 1000
+
+        # Fade-in / sustain / fade-out scaling
+        if t < fade_in:
+            scale = t / fade_in
+        elif t < sustain_end:
+            scale = 1.0
+        else:
+            scale = max(0.0, (total_time - t) / fade_out)
+
+        # Pitch modulation (LFO)
+        freqs[i] = int(effect["base_freq"] + effect["freq_depth"] * math.sin(lfo * t))
+
+        # Volume modulation with global volume
+        vol_mod = (math.sin(lfo * t + math.pi / 4) * volume_depth + 1 - volume_depth) / 2
+        duties[i] = int(vol_mod * effect["volume"] * scale * 65535)
+
+    return freqs, duties
+
+def sound_for_duty(duty):
+    """Effect name for a PWM duty, or None if it's below every sound level"""
+    for threshold, name in SOUND_LEVELS:
+        if duty > threshold:
+            return name
+    return None
+
+class WebSocketClient:
+    """WebSocket client on uasyncio streams - every wait yields to the sound and LED tasks"""
+
+    def __init__(self, server_ip, port):
+        self.server_ip = server_ip
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.binary = False  # True once the server accepts the binary subprotocol
+        self.last_rx = time.ticks_ms()
+        self.ping_outstanding = False
+
+    async def connect(self, max_attempts=0):
+        """Connect and handshake, retrying every WEBSOCKET_RETRY_DELAY seconds
+
+        Gives up with OSError after max_attempts failures (0 = keep trying forever).
+        """
+        failures = 0
+        while True:
+            try:
+                print("Connecting to server...")
+                self.reader, self.writer = await asyncio.open_connection(self.server_ip, self.port)
+                print("Connected to", self.server_ip, ":", self.port)
+
+                # Handshake - use original working format
+                sec_websocket_key = ubinascii.b2a_base64(os.urandom(16)).strip()
+                protocol_header = b""
+                if USE_BINARY_PROTOCOL:
+                    protocol_header = b"Sec-WebSocket-Protocol: " + BINARY_SUBPROTOCOL + b"\r\n"
+                handshake = (b"GET / HTTP/1.1\r\n"
+                             b"Host: %s:%d\r\n"
+                             b"Upgrade: websocket\r\n"
+                             b"Connection: Upgrade\r\n"
+                             b"Sec-WebSocket-Key: %s\r\n"
+                             b"%s"
+                             b"Sec-WebSocket-Version: 13\r\n\r\n") % (self.server_ip.encode(), self.port, sec_websocket_key, protocol_header)
+                self.writer.write(handshake)
+                await self.writer.drain()
+
+                status = await self.reader.readline()
+                print("Handshake response:", status)
+                if b"101" not in status:
+                    raise ValueError("Handshake failed")
+                # Read the response headers up to the blank line
+                self.binary = False
+                while True:
+                    header = await self.reader.readline()
+                    if not header or header == b"\r\n":
+                        break
+                    if header.lower().startswith(b"sec-websocket-protocol:") and BINARY_SUBPROTOCOL in header:
+                        self.binary = True
+                print("Handshake successful (", "binary" if self.binary else "JSON", "format )")
+                self.last_rx = time.ticks_ms()
+                self.ping_outstanding = False
+                break
+            except (OSError, ValueError) as e:
+                print("Connection error:", e)
+                print("Error type:", type(e).__name__)
+                if hasattr(e, 'errno'):
+                    print("Error number:", e.errno)
+                await self.close_stream()
+                failures += 1
+                if max_attempts and failures >= max_attempts:
+                    raise OSError("Gave up connecting after %d attempts" % failures)
+                print("Retrying connection in", WEBSOCKET_RETRY_DELAY, "seconds...")
+                await asyncio.sleep(WEBSOCKET_RETRY_DELAY)
+
+    async def read_into(self, view, num_bytes):
+        """Fill the first num_bytes of a preallocated buffer from the stream"""
+        position = 0
+        while position < num_bytes:
+            count = await self.reader.readinto(view[position:num_bytes])
+            if not count:
+                raise OSError("Connection closed before receiving all data")
+            position += count
+
+    async def discard(self, num_bytes):
+        """Skip a payload too large for the receive buffer"""
+        while num_bytes > 0:
+            chunk = min(num_bytes, RX_BUFFER_SIZE)
+            await self.read_into(rx_view, chunk)
+            num_bytes -= chunk
+
+    async def recv(self):
+        """Read one frame; returns the message, or None for control frames
+
+        Binary messages come back as a memoryview into the shared receive buffer and are
+        only valid until the next recv(). Raises OSError/ValueError when the connection is gone.
+        """
+        await self.read_into(header_view, 2)
+        self.last_rx = time.ticks_ms()
+        self.ping_outstanding = False
+        opcode = header_buffer[0] & 0b00001111
+        masked = header_buffer[1] & 0b10000000
+        payload_length = header_buffer[1] & 0b01111111
+
+        if payload_length == 126:
+            await self.read_into(header_view, 2)
+            payload_length = (header_buffer[0] << 8) | header_buffer[1]
+        elif payload_length == 127:
+            await self.read_into(header_view, 8)
+            payload_length = 0
+            for i in range(8):
+                payload_length = (payload_length << 8) | header_buffer[i]
+
+        if masked:
+            await self.read_into(mask_view, 4)
+
+        if payload_length > RX_BUFFER_SIZE:
+            print("Skipping", payload_length, "byte frame (receive buffer is", RX_BUFFER_SIZE, ")")
+            await self.discard(payload_length)
+            return None
+
+        payload = rx_view[:payload_length]
+        await self.read_into(payload, payload_length)
+        if masked:
+            xor_mask(rx_buffer, payload_length, mask_buffer)
+
+        if opcode == 0x8:  # Close frame
+            print("Received close frame")
+            await self.send_close_frame()
+            raise OSError("Server closed the connection")
+
+        if opcode == 0x9:  # Ping frame
+            print("Received ping frame")
+            await self.send_frame(0xA, payload)
+            return None
+
+        if opcode == 0xA:  # Pong frame - answer to our keepalive ping
+            return None
+
+        if opcode == 0x2:  # Binary frame - compact scene or class table
+            return payload
+
+        message = str(payload, 'utf-8')
+        print("Received message:", message)
+        return message
+
+    async def keepalive(self):
+        """Ping the server when it goes quiet; drop the connection if the ping goes unanswered"""
+        while self.writer:
+            await asyncio.sleep(WEBSOCKET_PING_INTERVAL)
+            if time.ticks_diff(time.ticks_ms(), self.last_rx) < WEBSOCKET_PING_INTERVAL * 1000:
+                continue
+            if self.ping_outstanding:
+                print("Server not answering pings - reconnecting")
+                await self.close_stream()
+                break
+            self.ping_outstanding = True
+            await self.send_frame(0x9)
+
+    async def send_frame(self, opcode, payload=b''):
+        """Build and mask a client frame in the preallocated transmit buffer"""
+        payload_length = len(payload)
+        tx_buffer[0] = 0x80 | opcode
+        if payload_length < 126:
+            tx_buffer[1] = 0x80 | payload_length
+            position = 2
+        elif payload_length <= 0xFFFF:
+            tx_buffer[1] = 0x80 | 126
+            tx_buffer[2] = payload_length >> 8
+            tx_buffer[3] = payload_length & 0xFF
+            position = 4
+        else:
+            raise ValueError("Frame too large")
+        if position + 4 + payload_length > TX_BUFFER_SIZE:
+            raise ValueError("Frame larger than transmit buffer")
+        key = tx_view[position:position + 4]
+        key[:] = os.urandom(4)
+        position += 4
+        if payload_length:
+            body = tx_view[position:position + payload_length]
+            body[:] = payload
+            xor_mask(body, payload_length, key)
+        self.writer.write(tx_view[:position + payload_length])
+        await self.writer.drain()
+
+    async def send_close_frame(self):
+        await self.send_frame(0x8)
+        print("Close frame sent")
+
+    async def close_stream(self):
+        writer = self.writer
+        self.reader = None
+        self.writer = None
+        if writer:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def close(self):
+        if self.writer:
+            try:
+                await self.send_close_frame()
+            except Exception as e:
+                print("Error during close frame:", e)
+            await self.close_stream()
+        print("Socket closed")
+
+def select_duty(is_alert, avg_confidence, confidence_of):
+    """Priority ladder shared by the JSON and binary paths
+
+    confidence_of(label) returns the label's confidence, or None if it wasn't detected.
+    """
+    # Priority 1: the scene alert (person+cup by default)
+    if is_alert:
+        print("HIGH PRIORITY ALERT!")
+        conf_percent = avg_confidence * 100
+        print("Alert confidence:", avg_confidence, "(", conf_percent, "%)")
+        return avg_confidence
+
+    # Priority 2: Respond to person detection (medium priority)
+    person_conf = confidence_of("person")
+    if person_conf is not None:
+        print("Person detected - confidence:", person_conf)
+        # Scale down for person-only detection
+        return person_conf * PERSON_SCALE
+
+    # Priority 3: Respond to cup detection (lower priority)
+    cup_conf = confidence_of("cup")
+    if cup_conf is not None:
+        print("Cup detected - confidence:", cup_conf)
+        # Scale down for cup-only detection
+        return cup_conf * CUP_SCALE
+
+    # Priority 4: Other interesting objects (very low response)
+    for obj in INTERESTING_OBJECTS:
+        obj_conf = confidence_of(obj)
+        if obj_conf is not None:
+            print(obj + " detected - confidence:", obj_conf)
+            # Very low response for other objects
+            return obj_conf * OTHER_SCALE
+
+    print("Objects detected but no priority matches")
+    return 0.0
+
+def parse_detection_data(message):
+    """Parse detection data and return appropriate PWM duty cycle"""
+    global message_trace, message_sound
+    print("Parsing detection data...")
+    try:
+        data = json.loads(message)
+        print("Successfully parsed JSON data")
+        message_trace = data.get("trace", 0)
+        
+        # Server-computed response for our profile - nothing left to decide
+        if "duty" in data:
+            message_sound = bool(data.get("sound"))  # from our profile's sound_threshold
+            return data["duty"]
+
+        all_objects = data.get("all_objects", {})
+        avg_confidence = data.get("average_confidence", 0.0)
+        is_alert = data.get("alert", False)
+        
+        if all_objects:
+            print("All objects detected:", all_objects)
+
+            def confidence_of(label):
+                obj_data = all_objects.get(label)
+                if isinstance(obj_data, dict):
+                    return obj_data["confidence"]
+                return None
+
+            return select_duty(is_alert, avg_confidence, confidence_of)
+                
+        return 0.0  # No significant objects detected
+            
+    except (ValueError, KeyError):
+        
+        # Fallback to old string parsing for compatibility
+        return parse_string_legacy(message)
+    
+    return 0.0
+
+def load_class_table(payload):
+    """Load the server's class-id table (sent once after the handshake)"""
+    class_ids.clear()
+    count = payload[1]
+    offset = 2
+    for class_id in range(count):
+        length = payload[offset]
+        class_ids[bytes(payload[offset + 1:offset + 1 + length]).decode()] = class_id
+        offset += 1 + length
+    print("Loaded class table with", count, "labels")
+
+def decode_binary_scene(payload):
+    """Decode a binary scene into the preallocated scene buffers
+
+    Returns False if the payload isn't a scene message.
+    """
+    global scene_alert, scene_avg_conf
+    if payload[0] != MSG_SCENE:
+        return False
+    # Header fields read in place: type, flags, average confidence, entry count, u32 seq
+    flags = payload[1]
+    avg_q = payload[2]
+    entries = payload[3]
+    if not flags & FLAG_DELTA:
+        # Full scene replaces everything; deltas only touch the entries they carry
+        scene_count[:] = ZERO_TABLE
+        scene_conf[:] = ZERO_TABLE
+    offset = SCENE_HEADER_SIZE
+    for _ in range(entries):
+        class_id = payload[offset]
+        scene_count[class_id] = payload[offset + 1]
+        scene_conf[class_id] = payload[offset + 2]
+        offset += SCENE_ENTRY_SIZE
+    scene_alert = bool(flags & FLAG_ALERT)
+    scene_avg_conf = avg_q
+    return True
+
+def binary_confidence(label):
+    """Confidence of a label in the decoded binary scene, or None if it isn't present"""
+    class_id = class_ids.get(label)
+    if class_id is None or not scene_count[class_id]:
+        return None
+    return scene_conf[class_id] / 255
+
+def parse_binary_data(payload):
+    """Decode a binary scene message and return appropriate PWM duty cycle"""
+    if not decode_binary_scene(payload):
+        return 0.0
+    return select_duty(scene_alert, scene_avg_conf / 255, binary_confidence)
+
+def parse_string_legacy(input_string):
+    """Legacy string parsing for backward compatibility"""
+    # Check if the string contains the word 'person'
+    if 'person' in input_string:
+        # Use regex to find the number in parentheses
+        match = re.search(r'\(([\d.]+)\)', input_string)
+        if match:
+            number_in_parentheses = float(match.group(1))
+        else:
+            number_in_parentheses = 0
+    else:
+        number_in_parentheses = 0
+
+    return number_in_parentheses
+
+def build_profile_message():
+    """Response profile sent at connect time so the server can run the priority ladder for us"""
+    return json.dumps({"profile": {
+        "priorities": [["person", PERSON_SCALE], ["cup", CUP_SCALE]],
+        "interesting": INTERESTING_OBJECTS,
+        "other_scale": OTHER_SCALE,
+        "sound_threshold": SOUND_THRESHOLD,
+        "rules": USE_SERVER_RULES,
+    }}).encode()
+
+def binary_trace(signal):
+    """u32 trace id from a binary duty or full scene header (delta sequences aren't trace ids)"""
+    if signal[0] == MSG_SCENE and signal[1] & FLAG_DELTA:
+        return 0
+    return signal[4] | (signal[5] << 8) | (signal[6] << 16) | (signal[7] << 24)
+
+def build_subscription_message():
+    """Labels (and cameras) this needle reacts to, so the server skips everything else"""
+    subscribe = {"labels": PRIMARY_OBJECTS + INTERESTING_OBJECTS,
+                 "min_confidence": SUBSCRIBE_MIN_CONFIDENCE,
+                 "max_rate": SUBSCRIBE_MAX_RATE}
+    if SUBSCRIBE_CAMERAS:
+        subscribe["cameras"] = SUBSCRIBE_CAMERAS
+    return json.dumps({"subscribe": subscribe}).encode()
+
+def decide(signal):
+    """Decode one message and choose the response
+
+    Returns (duty, sound, trace id) for detection messages, or None for anything
+    else (the class table is loaded as a side effect).
+    """
+    global message_trace, message_sound
+    message_trace = 0
+    message_sound = None
+    # Binary messages: class table once, then compact scenes or server-computed duties
+    if isinstance(signal, memoryview):
+        if signal[0] == MSG_CLASS_TABLE:
+            load_class_table(signal)
+            return None
+        message_trace = binary_trace(signal)
+        if signal[0] == MSG_DUTY:
+            # u8 type, u8 flags, u16 duty, u32 trace - server already applied our profile
+            return ((signal[3] << 8) | signal[2]) / 65535, signal[1] & FLAG_SOUND, message_trace
+        duty = parse_binary_data(signal)
+    # Handle all JSON detection messages
+    elif signal.startswith('{'):
+        print("Detection message received")
+        duty = parse_detection_data(signal)
+    elif "Object" in signal or "person" in signal:
+        print("Legacy signal received:", signal)
+        duty = parse_detection_data(signal)
+    else:
+        print("Server message:", signal)
+        return None
+    if message_sound is not None:
+        return duty, message_sound, message_trace
+    return duty, sound_for_duty(duty) is not None, message_trace
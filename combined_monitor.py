@@ -1,288 +1,655 @@
 #!/usr/bin/env python3
 import asyncio
 import websockets
-import subprocess
-import re
 import signal
 import sys
 import json
 import time
 import logging
 import argparse
-from collections import defaultdict
-from datetime import datetime
+import os
+from urllib.parse import urlsplit, parse_qs
+
+from broadcast_hub import BroadcastHub
+from camera_source import CameraSource, remember_snapshot
+from detection_parser import METADATA_PARSERS
+from monitor_logging import configure_logging, log_key, TEXT_FORMAT, DATE_FORMAT
+from metrics import (
+    LatencyHistogram, MetricsServer, PrometheusText, RateMeter,
+    PIPELINE_STAGES, CLIENT_STAGES, stage_histograms
+)
+from monitor_config import (
+    DETECTION_LABELS, CAMERAS, WEBSOCKET_PORT, CLIENT_QUEUE_SIZE, SLOW_CLIENT_POLICY,
+    DELTA_CONFIDENCE_EPSILON, DELTA_HISTORY, DELTA_KEYFRAME_INTERVAL, TRACKING,
+    OCCUPANCY_WINDOWS, OCCUPANCY_SLOTS, OCCUPANCY_INTERVAL,
+    METRICS_PORT, METRICS_RATE_WINDOW,
+    LOG_FORMAT, LOG_FILE, LOG_QUEUE_SIZE, LOG_RATE_LIMITS,
+    CLIP_DIR, CLIP_PRE_SECONDS, CLIP_POST_SECONDS, CLIP_MAX_SECONDS,
+    CLIP_BUFFER_BYTES, CLIP_MAX_PENDING_BYTES,
+    HISTORY_DB, HISTORY_FLUSH_INTERVAL, HISTORY_RETENTION_DAYS, HISTORY_PRUNE_INTERVAL, HISTORY_MAX_PENDING
+)
+from history_store import HistoryStore
+from occupancy import OccupancyStats
+from video_buffer import ClipRecorder
+from scene import DeltaStream, EMPTY_SCENE, merge_snapshots
+from profiles import ResponseProfile
+from replay_source import ReplaySource
+from subscriptions import Subscription
+from wire_format import BinaryEncoder, BINARY_SUBPROTOCOL, select_subprotocol
+
+# extra= for the rate-limited broadcast log line (limits in monitor_config.LOG_RATE_LIMITS)
+BROADCAST_LOG = log_key("broadcast")
 
 class CameraMonitor:
-    def __init__(self, show_preview=False):
-        self.current_detection = {"person": 0, "cup": 0}
-        self.current_confidence = {"person": 0.0, "cup": 0.0}
-        self.all_objects = {}
+    def __init__(self, show_preview=False, video_output="drop", metadata_fifo=None, metadata_format="jsonl",
+                 metrics_port=METRICS_PORT, log_handler=None, clip_dir=CLIP_DIR, cameras=None,
+                 history_db=HISTORY_DB, replay=None, websocket_port=WEBSOCKET_PORT, tracking=TRACKING):
+        self.binary_encoder = BinaryEncoder(DETECTION_LABELS)
         self.signal_active = False
-        self.connected_clients = set()
-        self.camera_process = None
-        self.frame_count = 0
-        self.last_detection_time = None
+        self.hub = BroadcastHub(max_queue=CLIENT_QUEUE_SIZE, policy=SLOW_CLIENT_POLICY)
+        self.last_status_frame = 0
+        # Latency tracing: pipeline stages plus all-client totals of the per-client stages
+        self.latency = stage_histograms(PIPELINE_STAGES + CLIENT_STAGES)
+        self.recent_snapshots = {}  # trace id -> snapshot, for matching client acks
+        # Plain counters are bumped per frame; rates are only worked out when scraped
+        self.metrics_port = metrics_port
+        self.rates = {}
+        self.started = time.monotonic()
         self.show_preview = show_preview
+        self.websocket_port = websocket_port
 
-        # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+        # Setup logging (a no-op when main() already routed it through the background writer)
+        logging.basicConfig(level=logging.INFO, format=TEXT_FORMAT, datefmt=DATE_FORMAT)
         self.logger = logging.getLogger(__name__)
-
-    async def start_camera_monitoring(self):
-        """Start the camera process and monitor its output"""
-        # Use different commands for preview vs headless mode
-        if self.show_preview:
-            # Use rpicam-hello for preview mode - it's designed for this
-            cmd = [
-                "rpicam-hello", "-v", "2", "-t", "0",
-                "--post-process-file", "/home/pi/rpicam-apps/assets/hailo_yolov8_inference.json",
-                "--lores-width", "640", "--lores-height", "640"
-            ]
+        self.log_handler = log_handler  # background log writer, for its drop/suppression counters
+
+        # One source per camera, each with its own process, ingest tasks and scene.
+        # replay (ReplaySource options) feeds every camera from a recording or generator instead
+        cameras = cameras or CAMERAS
+        self.sources = {}
+        for index, camera in enumerate(cameras):
+            name = camera["name"]
+            if replay:
+                self.sources[name] = ReplaySource(name=name, camera=camera.get("camera", index), latency=self.latency,
+                                                  recent_snapshots=self.recent_snapshots, logger=self.logger,
+                                                  tracking=tracking, zones=camera.get("zones"), seed=index,
+                                                  **replay)
+                continue
+            fifo = camera.get("metadata_fifo")
+            if fifo is None and metadata_fifo:
+                fifo = metadata_fifo if len(cameras) == 1 else f"{metadata_fifo}.{name}"
+            self.sources[name] = CameraSource(name, camera.get("camera", index), show_preview, video_output,
+                                              fifo, metadata_format, self.latency, self.recent_snapshots,
+                                              self.logger, tracking, camera.get("zones"))
+
+        # Alert clips need the encoded video, so they switch headless video output to the pipe
+        if clip_dir:
+            if self.show_preview:
+                self.logger.warning("Alert clips need headless mode - no video is piped in preview mode")
+            else:
+                for name, source in self.sources.items():
+                    directory = clip_dir if len(self.sources) == 1 else os.path.join(clip_dir, name)
+                    source.video_output = "pipe"
+                    source.clip_recorder = ClipRecorder(directory, CLIP_PRE_SECONDS, CLIP_POST_SECONDS,
+                                                        CLIP_MAX_SECONDS, CLIP_BUFFER_BYTES,
+                                                        CLIP_MAX_PENDING_BYTES, self.logger)
+                    source.video_consumers.append(source.clip_recorder.feed)
+                    # Every frame, published or not, keeps a running clip going while the alert holds
+                    source.scene_consumers.append(source.clip_recorder.record_scene)
+
+        # Rolling occupancy per camera, and for the merged scene (the same object with one camera)
+        self.occupancy = {}
+        for name, source in self.sources.items():
+            self.occupancy[name] = OccupancyStats(OCCUPANCY_WINDOWS, OCCUPANCY_SLOTS)
+            source.scene_consumers.append(self.occupancy[name].record)
+        if len(self.sources) == 1:
+            self.occupancy[None] = next(iter(self.occupancy.values()))
         else:
-            # Use rpicam-vid for headless mode with output capture
-            cmd = [
-                "rpicam-vid", "-n", "-v", "2", "-t", "0", "--inline",
-                "--post-process-file", "/home/pi/rpicam-apps/assets/hailo_yolov8_inference.json",
-                "--width", "640", "--height", "640",
-                "--framerate", "10", "-o", "-"
-            ]
-
-        mode = "with preview window (rpicam-hello)" if self.show_preview else "headless (rpicam-vid)"
-        self.logger.info(f"Starting camera monitoring {mode}...")
-        self.logger.info(f"Command: {' '.join(cmd)}")
-
-        if self.show_preview:
-            self.logger.info("📺 Preview window should appear for testing")
+            self.occupancy[None] = OccupancyStats(OCCUPANCY_WINDOWS, OCCUPANCY_SLOTS)
+            self.frame_scenes = {}  # camera -> its latest frame, published or not, for merged occupancy
+            for source in self.sources.values():
+                source.scene_consumers.append(self.record_merged_occupancy)
+        self.camera_set_occupancy = {}  # frozenset of cameras -> merged occupancy, for multi-camera subscriptions
+
+        # Every camera frame goes to the history database in batches
+        self.history = None
+        if history_db:
+            self.history = HistoryStore(history_db, HISTORY_FLUSH_INTERVAL, HISTORY_RETENTION_DAYS,
+                                        HISTORY_PRUNE_INTERVAL, HISTORY_MAX_PENDING, self.logger)
+            for source in self.sources.values():
+                source.scene_consumers.append(self.history.record)
+
+        # Merged scene across all cameras - what clients get unless they pick a camera.
+        # With a single camera it is simply that camera's scene.
+        self.snapshot = EMPTY_SCENE
+        self.merged_frames = 0
+        self.frames_broadcast = 0  # scenes sent to clients (merged view)
+        # Delta state per (camera, subscription): the merged view (None) plus each camera when there
+        # are several; filtered delta streams are added while subscribed clients need them
+        self.delta_streams = {
+            (name, None): DeltaStream(DELTA_CONFIDENCE_EPSILON, self.binary_encoder, DELTA_HISTORY)
+            for name in [None, *self.sources] if name is None or len(self.sources) > 1
+        }
+        self.subscriptions = {}  # interned, so equal filters share one cached filtered scene
+
+    def scene_for(self, camera):
+        """Latest snapshot of a camera, or the merged scene for None"""
+        return self.snapshot if camera is None else self.sources[camera].snapshot
+
+    def delta_stream_for(self, camera, subscription):
+        """Delta stream for a view, created (and primed with the current scene) on first use"""
+        key = (camera, subscription)
+        delta_stream = self.delta_streams.get(key)
+        if delta_stream is None:
+            delta_stream = self.delta_streams[key] = DeltaStream(DELTA_CONFIDENCE_EPSILON, self.binary_encoder,
+                                                                 DELTA_HISTORY)
+            delta_stream.update(subscription.apply(self.scene_for(camera), self.scene_for))
+        return delta_stream
+
+    def prune_delta_streams(self):
+        """Drop filtered delta streams and interned subscriptions no connected client uses any more"""
+        in_use = {(view[0], view[4]) for view in (channel.view for channel in self.hub.channels.values())}
+        for key in [key for key in self.delta_streams if key[1] is not None and key not in in_use]:
+            del self.delta_streams[key]
+        subscribed = {subscription for _camera, subscription in in_use}
+        for subscription in [subscription for subscription in self.subscriptions if subscription not in subscribed]:
+            del self.subscriptions[subscription]
+        camera_sets = {subscription.cameras for subscription in subscribed if subscription}
+        for cameras in [cameras for cameras in self.camera_set_occupancy if cameras not in camera_sets]:
+            del self.camera_set_occupancy[cameras]
+
+    def merge_scene(self, snapshot):
+        """Rebuild the merged scene after a camera produced a new snapshot"""
+        if len(self.sources) == 1:
+            self.snapshot = snapshot
         else:
-            self.logger.info("🔒 Running headless - suitable for SSH connections")
-
-        try:
-            self.camera_process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT
-            )
-
-            self.logger.info("Camera process started successfully")
-            await self.process_camera_output()
-
-        except Exception as e:
-            self.logger.error(f"Error starting camera: {e}")
-
-    async def process_camera_output(self):
-        """Process camera output and detect objects"""
-        if not self.camera_process:
-            return
-
-        self.logger.info("Starting camera output processing...")
-
-        async for line_bytes in self.camera_process.stdout:
+            self.merged_frames += 1
+            self.snapshot = merge_snapshots([source.snapshot for source in self.sources.values()],
+                                            self.merged_frames, snapshot.t_read)
+            remember_snapshot(self.recent_snapshots, self.snapshot)
+        return self.snapshot
+
+    def record_merged_occupancy(self, snapshot):
+        """Scene consumer: merged occupancy from every camera frame, not just the published ones"""
+        frame_scenes = self.frame_scenes
+        frame_scenes[snapshot.camera] = snapshot
+        merged = merge_snapshots(list(frame_scenes.values()), self.merged_frames, snapshot.t_read)
+        merged.t_parsed = snapshot.t_parsed
+        self.occupancy[None].record(merged)
+        for cameras, stats in self.camera_set_occupancy.items():
+            if snapshot.camera in cameras:
+                merged = merge_snapshots([frame_scenes[camera] for camera in cameras if camera in frame_scenes],
+                                         self.merged_frames, snapshot.t_read)
+                merged.t_parsed = snapshot.t_parsed
+                stats.record(merged)
+
+    async def distribute_scenes(self, source):
+        """Take a camera's latest scene from its reader and broadcast it"""
+        while True:
+            snapshot = await source.scene_queue.get()
             try:
-                line = line_bytes.decode('utf-8').strip()
-
-                # Log all output for debugging (you can reduce this later)
-                if line and not line.startswith('#'):
-                    self.logger.debug(f"Camera output: {line}")
-
-                # Parse YOLO detection output
-                if self.is_detection_line(line):
-                    self.frame_count += 1
-                    self.last_detection_time = datetime.now()
-
-                    self.logger.info(f"Frame {self.frame_count}: Processing detection line")
-                    self.parse_detection_line(line)
-                    await self.update_signal_status()
-
-            except UnicodeDecodeError as e:
-                self.logger.warning(f"Failed to decode line: {e}")
+                await self.update_signal_status(snapshot, source)
             except Exception as e:
-                self.logger.error(f"Error processing camera output: {e}")
-
-    def is_detection_line(self, line):
-        """Check if this line contains object detection info"""
-        detection_indicators = [
-            "Object detected:",
-            "Detection:",
-            "Found:",
-            "person",
-            "cup",
-            "bottle",
-            "chair",
-            "dining table"
-        ]
-        return any(indicator in line.lower() for indicator in detection_indicators)
-
-    def parse_detection_line(self, line):
-        """Parse a detection line and update object counts with confidence"""
-        # Reset for this frame
-        self.current_detection = {"person": 0, "cup": 0}
-        self.current_confidence = {"person": 0.0, "cup": 0.0}
-        self.all_objects = {}
-
-        line_lower = line.lower()
-
-        # Log the raw detection line
-        self.logger.info(f"Raw detection: {line}")
-
-        # Parse different object types and their counts with confidence
-        objects_found = []
-        
-        # Define all objects we want to detect with confidence
-        target_objects = ["person", "cup", "bottle", "chair", "dining table", "laptop", "cell phone", "book", "mouse", "keyboard", "tv", "car", "bicycle", "dog", "cat"]
-        
-        for obj in target_objects:
-            # Pattern to match: object_name[optional_stuff] (confidence_score)
-            pattern = fr'{obj}[^(]*\(([\d.]+)\)'
-            matches = re.findall(pattern, line_lower)
-            if matches:
-                confidences = [float(conf) for conf in matches]
-                avg_conf = sum(confidences) / len(confidences)
-                self.all_objects[obj] = {"count": len(matches), "confidence": avg_conf}
-                objects_found.append(f"{len(matches)} {obj}(s) @{avg_conf:.2f}")
-                
-                # Update legacy fields for backwards compatibility
-                if obj == "person":
-                    self.current_detection["person"] = len(matches)
-                    self.current_confidence["person"] = avg_conf
-                elif obj == "cup":
-                    self.current_detection["cup"] = len(matches)
-                    self.current_confidence["cup"] = avg_conf
-
-        # Verbose logging
-        if objects_found:
-            self.logger.info(f"Frame {self.frame_count} objects: {', '.join(objects_found)}")
-        else:
-            self.logger.debug(f"Frame {self.frame_count}: No objects detected")
-
-    async def update_signal_status(self):
-        """Broadcast detection status for any detected objects"""
-        # Always broadcast if we have any objects detected
-        has_objects = bool(self.all_objects)
-        
-        # Special case: high priority alert for person+cup combination
-        person_cup_alert = (
-            self.current_detection["person"] == 1 and
-            self.current_detection["cup"] == 1
-        )
-        
-        if has_objects:
-            await self.broadcast_signal(alert=person_cup_alert)
-            if person_cup_alert:
-                self.logger.warning("🚨 HIGH PRIORITY: 1 person + 1 cup detected!")
+                self.logger.error(f"Error distributing {source.name} frame {snapshot.frame}: {e}")
+
+    async def update_signal_status(self, snapshot=None, source=None):
+        """Broadcast a published scene, and act on its alert"""
+        snapshot = snapshot or self.snapshot
+        merged = self.merge_scene(snapshot) if source else snapshot
+
+        # Every published scene goes out, empty ones included, so clients (and delta
+        # views) see objects disappear
+        if merged is not snapshot:
+            # Clients watching only this camera
+            await self.broadcast_signal(snapshot, snapshot.camera)
+        await self.broadcast_signal(merged, origin=snapshot.camera)
+        self.frames_broadcast += 1
+
+        # Alert raised by an alert rule (ALERT_RULES) or a zone
+        has_objects = bool(snapshot.all_objects)
+        rule_alert = snapshot.alert
+
+        # Alert clips are started from every frame by ClipRecorder.record_scene
+        if has_objects and rule_alert:
+            active = ", ".join(snapshot.rules or ()) or "zone alert"
+            self.logger.warning(f"🚨 HIGH PRIORITY on {snapshot.camera}: {active}")
 
         # Update signal status for legacy compatibility
-        self.signal_active = person_cup_alert
+        self.signal_active = merged.alert
 
         # Log periodic status for monitoring
-        if self.frame_count % 30 == 0:  # Every 30 frames
-            status = "HIGH PRIORITY" if person_cup_alert else ("DETECTING" if has_objects else "idle")
-            self.logger.info(f"Status update - Frame {self.frame_count}: {status}")
-            if self.all_objects:
-                self.logger.info(f"Current scene: {self.all_objects}")
-
-    async def broadcast_signal(self, alert=False):
-        """Broadcast detection data to all connected WebSocket clients"""
-        if not self.connected_clients:
+        if merged.frame - self.last_status_frame >= 30:  # Every 30 frames
+            self.last_status_frame = merged.frame
+            status = "HIGH PRIORITY" if merged.alert else ("DETECTING" if merged.all_objects else "idle")
+            self.logger.info(f"Status update - Frame {merged.frame}: {status}")
+            if merged.all_objects:
+                self.logger.info(f"Current scene: {merged.all_objects}")
+            self.logger.info(f"⏱️ Latency: {self.latency_summary()}")
+            coalesced = sum(source.scene_queue.coalesced for source in self.sources.values())
+            self.logger.info(f"Frames coalesced before broadcast: {coalesced}, "
+                             f"dropped for slow clients: {self.hub.dropped}, "
+                             f"slow clients disconnected: {self.hub.slow_disconnects}")
+
+    async def broadcast_signal(self, snapshot=None, camera=None, origin=None):
+        """Broadcast detection data to the WebSocket clients watching this camera (None = merged view)
+
+        origin is the camera whose new frame triggered a merged broadcast.
+        """
+        snapshot = snapshot or self.snapshot
+        # Keep the delta views current even with no clients, so late joiners get a correct keyframe
+        has_delta = {}
+        for key, delta_stream in self.delta_streams.items():
+            if key[0] == camera:
+                subscription = key[1]
+                scene = subscription.apply(snapshot, self.scene_for) if subscription else snapshot
+                has_delta[key] = delta_stream.update(scene)
+
+        if not self.hub:
             self.logger.debug("No WebSocket clients connected for broadcast")
             return
 
-        # Calculate overall average confidence from all detected objects
-        if self.all_objects:
-            total_confidence = sum(obj["confidence"] for obj in self.all_objects.values() if isinstance(obj, dict))
-            avg_confidence = total_confidence / len([obj for obj in self.all_objects.values() if isinstance(obj, dict)])
+        def encode(view, keyframe, since):
+            if view[0] != camera:
+                return None
+            subscription = view[4]
+            if subscription and subscription.cameras and origin and origin not in subscription.cameras:
+                return None  # merged broadcast caused by a camera this client doesn't follow
+            return self.encode_view(view, snapshot, keyframe, has_delta.get((camera, subscription), False),
+                                    since=since)
+
+        snapshot.t_enqueued = time.monotonic()
+        self.latency["queue"].record(snapshot.t_enqueued - snapshot.t_parsed)
+
+        # Encoded once per snapshot and view, then queued for every client without waiting on any socket
+        delivered = self.hub.publish_views(encode, snapshot.version, snapshot)
+        if snapshot.alert:
+            self.logger.warning("[ALERT] Detection sent to %d WebSocket clients: %s", delivered, snapshot.summary)
         else:
-            avg_confidence = 0.0
-
-        # Create detection summary
-        object_summary = []
-        for obj_name, obj_data in self.all_objects.items():
-            if isinstance(obj_data, dict):
-                object_summary.append(f"{obj_data['count']} {obj_name}(s) @{obj_data['confidence']:.2f}")
-            else:
-                object_summary.append(f"{obj_data} {obj_name}(s)")
-
-        # Send modern JSON format with rich object detection data
-        message = {
-            "alert": alert,
-            "timestamp": datetime.now().isoformat(),
-            "frame": self.frame_count,
-            "target_detection": self.current_detection,  # Legacy compatibility
-            "target_confidence": self.current_confidence,  # Legacy compatibility
-            "average_confidence": round(avg_confidence, 3),
-            "all_objects": self.all_objects,
-            "summary": ", ".join(object_summary),
-            "message": f"Objects detected: {', '.join(object_summary)}" if object_summary else "No objects detected"
-        }
-
-        message_str = json.dumps(message)
-        disconnected = set()
-
-        for websocket in self.connected_clients:
+            self.logger.info("Detection sent to %d WebSocket clients: %s", delivered, snapshot.summary,
+                             extra=BROADCAST_LOG)
+
+    def encode_view(self, view, snapshot, keyframe=True, has_delta=False, status=False, since=None):
+        """(payload, text) for a client view, or None if that view has nothing to send
+
+        A view is (camera, stream, encoding, profile, subscription): camera is a camera name
+        or None for the merged scene, stream "full", "delta" or "profile", encoding "json" or
+        "binary", profile the client's ResponseProfile and subscription its Subscription
+        filter (both None when unused). since is the scene version a delta client that
+        skipped messages last got; it is sent the skipped changes as one delta.
+        """
+        camera, stream, encoding, profile, subscription = view
+        text = encoding == "json"
+        if subscription and stream != "delta":
+            snapshot = subscription.apply(snapshot, self.scene_for)
+        if stream == "profile":
+            return profile.payload(snapshot, encoding), text
+        if stream == "delta":
+            delta_stream = self.delta_stream_for(camera, subscription) if subscription else self.delta_streams[(camera, None)]
+            if keyframe:
+                return delta_stream.keyframe(encoding), text
+            if since is not None:
+                payload = delta_stream.catch_up(since, encoding)
+                return (payload, text) if payload is not None else None
+            return (delta_stream.payload(encoding), text) if has_delta else None
+        if encoding == "binary":
+            return self.binary_encoder.scene(snapshot), False
+        return (snapshot.status_payload if status else snapshot.frame_payload), True
+
+    def handle_client_message(self, channel, message, client_info):
+        """Apply a control message from a client; returns False if it wasn't one"""
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            return False
+        if not isinstance(data, dict):
+            return False
+
+        if "ack" in data:
+            # The client has applied the message carrying this trace id
+            self.record_ack(channel, data["ack"])
+            return True
+
+        if "profile" in data:
             try:
-                await websocket.send(message_str)
-                log_level = "WARNING" if alert else "INFO"
-                priority = "[ALERT] " if alert else ""
-                self.logger.log(getattr(logging, log_level), f"{priority}Detection sent to WebSocket client: {message['summary']}")
-            except websockets.exceptions.ConnectionClosed:
-                disconnected.add(websocket)
-
-        # Remove disconnected clients
-        self.connected_clients -= disconnected
-        if disconnected:
-            self.logger.info(f"Removed {len(disconnected)} disconnected WebSocket clients")
+                profile = ResponseProfile.from_message(data["profile"])
+            except ValueError as e:
+                self.logger.warning(f"Ignoring profile from {client_info}: {e}")
+                return True
+            # From now on this client gets a tiny duty + sound message computed server-side
+            channel.view = (channel.view[0], "profile", channel.view[2], profile, channel.view[4])
+            channel.version = None
+            self.logger.info(f"Response profile set for {client_info}: {profile.priorities}")
+            return True
+
+        if "subscribe" in data or "min_confidence" in data or "max_rate" in data:
+            self.apply_subscription(channel, data, client_info)
+            return True
+
+        if "occupancy" in data:
+            channel.occupancy = bool(data["occupancy"])
+            if channel.occupancy:
+                channel.push(json.dumps(self.occupancy_message(channel.view)))
+            self.logger.info(f"Occupancy updates {'on' if channel.occupancy else 'off'} for {client_info}")
+            return True
+
+        if "history" in data:
+            # Answered from the database thread; the reply is queued like any other message
+            asyncio.create_task(self.send_history(channel, data["history"], client_info))
+            return True
+
+        return False
+
+    def apply_subscription(self, channel, data, client_info):
+        """Update a client's label/camera/confidence filter and its rate limit"""
+        camera, stream, encoding, profile, current = channel.view
+        try:
+            subscription = Subscription.from_message(data, current)
+            max_rate = data.get("max_rate", (data.get("subscribe") or {}).get("max_rate"))
+            min_interval = channel.min_interval if max_rate is None else (1.0 / float(max_rate) if max_rate else 0.0)
+        except (AttributeError, TypeError, ValueError, ZeroDivisionError) as e:
+            self.logger.warning(f"Ignoring subscription from {client_info}: {e}")
+            return
+        if subscription.cameras is not None:
+            unknown = subscription.cameras - set(self.sources)
+            if unknown:
+                self.logger.warning(f"Ignoring subscription from {client_info}: unknown cameras {sorted(unknown)}")
+                return
+            if len(self.sources) == 1:
+                subscription = Subscription(subscription.labels, None, subscription.min_confidence)
+
+        # Camera choice: one subscribed camera gets that camera's own stream, several get a merge of them
+        if subscription.cameras is None:
+            camera = channel.camera
+        else:
+            camera = subscription.camera
+        subscription = None if subscription.is_everything else self.subscriptions.setdefault(subscription, subscription)
+
+        channel.view = (camera, stream, encoding, profile, subscription)
+        channel.min_interval = min_interval
+        channel.version = None
+        channel.needs_keyframe = True
+        channel.behind = False
+        self.prune_delta_streams()
+        rate = f"{1 / min_interval:g}/s" if min_interval else "unlimited"
+        self.logger.info(f"Subscription set for {client_info}: "
+                         f"{subscription.key if subscription else 'everything'}, max rate {rate}")
+
+    def occupancy_for(self, camera, subscription):
+        """Occupancy of a view: its camera's, or a merge of just the cameras its subscription names
+
+        Stats for a subset of the cameras are only kept while a client subscribes to it,
+        so they start from that client's first occupancy request.
+        """
+        cameras = subscription.cameras if subscription else None
+        if camera is not None or cameras is None or cameras == set(self.sources):
+            return self.occupancy[camera]
+        stats = self.camera_set_occupancy.get(cameras)
+        if stats is None:
+            stats = self.camera_set_occupancy[cameras] = OccupancyStats(OCCUPANCY_WINDOWS, OCCUPANCY_SLOTS)
+        return stats
+
+    def occupancy_message(self, view):
+        """Occupancy for a client view: its camera (or subscribed cameras), limited to its subscribed labels"""
+        camera = view[0]
+        subscription = view[4]
+        labels = subscription.labels if subscription else None
+        message = {"type": "occupancy", "camera": camera}
+        if camera is None and subscription and subscription.cameras:
+            message["cameras"] = sorted(subscription.cameras)
+        message.update(self.occupancy_for(camera, subscription).summary(labels))
+        return message
+
+    async def broadcast_occupancy(self):
+        """Send every opted-in client its view's occupancy every OCCUPANCY_INTERVAL seconds"""
+        while True:
+            await asyncio.sleep(OCCUPANCY_INTERVAL)
+            payloads = {}  # built once per (camera, subscription)
+            for channel in list(self.hub.channels.values()):
+                if not channel.occupancy:
+                    continue
+                key = (channel.view[0], channel.view[4])
+                payload = payloads.get(key)
+                if payload is None:
+                    payload = payloads[key] = json.dumps(self.occupancy_message(channel.view))
+                channel.push(payload)
+
+    async def occupancy_endpoint(self, params):
+        """GET /occupancy?camera=&labels=person,cup"""
+        camera = params.get("camera")
+        if camera is not None and camera not in self.sources:
+            raise ValueError(f"Unknown camera {camera!r}")
+        labels = params.get("labels")
+        if labels is not None:
+            labels = {label.strip().lower() for label in labels.split(",") if label.strip()}
+        body = {"camera": camera, **self.occupancy[camera].summary(labels)}
+        return json.dumps(body).encode(), "application/json"
+
+    async def query_history(self, request):
+        """Run a history query from {"start", "end", "step", "camera", "labels"}; raises ValueError if malformed
+
+        start and end are Unix times (default: the last hour); labels is a list or a
+        comma-separated string.
+        """
+        if self.history is None:
+            raise ValueError("detection history is not enabled (--history-db)")
+        if not isinstance(request, dict):
+            raise ValueError("history request must be an object")
+        try:
+            end = float(request["end"]) if request.get("end") is not None else time.time()
+            start = float(request["start"]) if request.get("start") is not None else end - 3600
+            step = float(request.get("step", 60))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid history request: {e}") from None
+        camera = request.get("camera")
+        if camera is not None and camera not in self.sources:
+            raise ValueError(f"Unknown camera {camera!r}")
+        labels = request.get("labels")
+        if isinstance(labels, str):
+            labels = [label.strip().lower() for label in labels.split(",") if label.strip()]
+        elif labels is not None:
+            if not isinstance(labels, (list, tuple)):
+                raise ValueError("labels must be a list")
+            labels = [str(label).lower() for label in labels]
+        return await self.history.query(start, end, step, camera, labels or None)
+
+    async def history_endpoint(self, params):
+        """GET /history?start=&end=&step=&camera=&labels=person,cup"""
+        return json.dumps(await self.query_history(params)).encode(), "application/json"
+
+    async def send_history(self, channel, request, client_info):
+        try:
+            result = await self.query_history(request)
+        except ValueError as e:
+            self.logger.warning(f"Ignoring history request from {client_info}: {e}")
+            result = {"error": str(e)}
+        except Exception as e:
+            self.logger.error(f"Error querying history for {client_info}: {e}")
+            result = {"error": "history query failed"}
+        channel.push(json.dumps({"type": "history", **result}), control=True)
+
+    def record_ack(self, channel, trace):
+        """Record round-trip latency for the first ack of each trace id from a client"""
+        if not isinstance(trace, int) or trace <= channel.last_ack:
+            return
+        channel.last_ack = trace
+        snapshot = self.recent_snapshots.get(trace)
+        if snapshot is not None:
+            round_trip = time.monotonic() - snapshot.t_read
+            channel.latency["round_trip"].record(round_trip)
+            self.latency["round_trip"].record(round_trip)
+
+    def latency_summary(self):
+        """p50/p95/p99 per stage; per-client stages are merged across connected clients"""
+        summary = {stage: self.latency[stage].summary() for stage in PIPELINE_STAGES}
+        for stage in ("write", "delivery"):
+            merged = LatencyHistogram()
+            for channel in self.hub.channels.values():
+                merged.merge(channel.latency[stage])
+            summary[stage] = merged.summary()
+        summary["round_trip"] = self.latency["round_trip"].summary()
+        return summary
+
+    def rate(self, key, total, now):
+        meter = self.rates.get(key)
+        if meter is None:
+            meter = self.rates[key] = RateMeter(METRICS_RATE_WINDOW)
+            meter.rate(0, self.started)  # every total starts from zero at startup
+        return round(meter.rate(total, now), 3)
+
+    def render_metrics(self):
+        """Current counters in Prometheus text format (called once per scrape)"""
+        now = time.monotonic()
+        text = PrometheusText()
+        # Samples of one metric must be contiguous, so one pass per metric
+        sources = list(self.sources.values())
+        for source in sources:
+            text.counter("peeperpam_frames_total", "Frames with detections processed", source.frame_count,
+                         {"camera": source.name})
+        for source in sources:
+            text.gauge("peeperpam_frames_per_second", "Frames with detections per second",
+                       self.rate(("frames", source.name), source.frame_count, now), {"camera": source.name})
+        text.counter("peeperpam_frames_broadcast_total", "Scenes broadcast to clients", self.frames_broadcast)
+        for source in sources:
+            text.counter("peeperpam_camera_lines_total", "Log lines read from the camera process",
+                         source.lines_read, {"camera": source.name})
+        for source in sources:
+            text.gauge("peeperpam_camera_lines_per_second", "Camera log lines read per second",
+                       self.rate(("lines", source.name), source.lines_read, now), {"camera": source.name})
+        for source in sources:
+            text.counter("peeperpam_camera_restarts_total", "Times the camera process was restarted",
+                         source.camera_restarts, {"camera": source.name})
+        for source in sources:
+            text.counter("peeperpam_frames_coalesced_total", "Frames superseded before they were broadcast",
+                         source.scene_queue.coalesced, {"camera": source.name})
+        tracked = [source for source in sources if source.tracker]
+        for source in tracked:
+            text.counter("peeperpam_frames_unchanged_total", "Frames whose tracked scene needed no broadcast",
+                         source.frames_unchanged, {"camera": source.name})
+        for source in tracked:
+            text.counter("peeperpam_tracks_created_total", "Object tracks started",
+                         source.tracker.tracks_created, {"camera": source.name})
+        for source in tracked:
+            text.gauge("peeperpam_tracks_active", "Confirmed object tracks",
+                       sum(track.confirmed for track in source.tracker.tracks), {"camera": source.name})
+        for source in sources:
+            text.counter("peeperpam_rule_evaluations_total", "Alert rule evaluations (rules whose inputs changed)",
+                         source.rules.evaluations, {"camera": source.name})
+        for source in sources:
+            for rule, level in (source.snapshot.rules or {}).items():
+                text.gauge("peeperpam_rule_active", "Level of each active alert rule", level,
+                           {"camera": source.name, "rule": rule})
+        for source in sources:
+            for zone, data in (source.snapshot.zones or {}).items():
+                for label, entry in data["objects"].items():
+                    text.gauge("peeperpam_zone_objects", "Objects currently in each zone", entry["count"],
+                               {"camera": source.name, "zone": zone, "label": label})
+        recorders = [source for source in sources if source.clip_recorder]
+        for source in recorders:
+            text.counter("peeperpam_alert_clips_total", "Alert clips started",
+                         source.clip_recorder.clips_started, {"camera": source.name})
+        for source in recorders:
+            text.counter("peeperpam_clip_bytes_dropped_total", "Clip bytes dropped because the disk fell behind",
+                         source.clip_recorder.bytes_dropped, {"camera": source.name})
+        if self.history is not None:
+            text.counter("peeperpam_history_frames_written_total", "Frames written to the history database",
+                         self.history.written)
+            text.counter("peeperpam_history_frames_dropped_total", "Frames dropped before reaching the history database",
+                         self.history.dropped)
+            text.gauge("peeperpam_history_frames_pending", "Frames waiting for the next history write",
+                       len(self.history.pending))
+        if self.log_handler is not None:
+            text.counter("peeperpam_log_suppressed_total", "Per-frame log lines skipped by rate limiting",
+                         self.log_handler.rate_limit.suppressed)
+            text.counter("peeperpam_log_dropped_total", "Log lines dropped because the writer fell behind",
+                         self.log_handler.dropped)
+        for stage in PIPELINE_STAGES + ("round_trip",):
+            text.histogram("peeperpam_stage_latency_seconds", "Latency of each pipeline stage",
+                           self.latency[stage], {"stage": stage})
+
+        text.gauge("peeperpam_clients_connected", "Connected WebSocket clients", len(self.hub))
+        text.counter("peeperpam_client_drops_total", "Messages dropped for slow clients", self.hub.dropped)
+        text.counter("peeperpam_slow_client_disconnects_total", "Clients disconnected for falling behind",
+                     self.hub.slow_disconnects)
+        # Samples of one metric must be contiguous, so one pass per metric
+        channels = list(self.hub.channels.values())
+        for channel in channels:
+            text.counter("peeperpam_client_bytes_sent_total", "Bytes written to each client",
+                         channel.bytes_sent, {"client": channel.name})
+        for channel in channels:
+            text.gauge("peeperpam_client_queue_depth", "Messages waiting in each client's send queue",
+                       len(channel.queue), {"client": channel.name})
+        for channel in channels:
+            text.counter("peeperpam_client_dropped_total", "Messages dropped for each client",
+                         channel.dropped, {"client": channel.name})
+
+        label_detections = [({"camera": source.name, "label": label}, total)
+                            for source in sources for label, total in source.label_detections.items()]
+        for labels, total in label_detections:
+            text.counter("peeperpam_detections_total", "Objects detected, per camera and label", total, labels)
+        for labels, total in label_detections:
+            text.gauge("peeperpam_detections_per_second", "Objects detected per second, per camera and label",
+                       self.rate(("label", labels["camera"], labels["label"]), total, now), labels)
+        return text.render()
 
     async def handle_websocket_connection(self, websocket, path=None):
         """Handle new WebSocket connections - compatible with websockets 15.x and 16.x"""
         client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        self.logger.info(f"New WebSocket connection from {client_info}. Total clients: {len(self.connected_clients)}")
+        self.logger.info(f"New WebSocket connection from {client_info}. Total clients: {len(self.hub)}")
         
+        # ws://host:6789/?stream=delta opts into change-only streaming,
+        # the peeperpam.bin.v1 subprotocol into the compact binary encoding
+        options = self._connection_options(websocket, path)
+        stream = "delta" if options.get("stream") == "delta" else "full"
+        encoding = "binary" if getattr(websocket, "subprotocol", None) == BINARY_SUBPROTOCOL else "json"
+        # ?camera=<name> follows one camera; everyone else gets the merged scene
+        camera = options.get("camera")
+        if camera is not None and camera not in self.sources:
+            self.logger.warning(f"Unknown camera {camera!r} from {client_info} - sending the merged scene")
+            camera = None
+        if len(self.sources) == 1:
+            camera = None  # the merged scene is that camera's scene
+
         # Add client AFTER logging but BEFORE starting tasks
-        self.connected_clients.add(websocket)
+        channel = self.hub.add(websocket, (camera, stream, encoding, None, None))
+        channel.camera = camera
+        if encoding == "binary":
+            # Class ids in every binary scene index this table
+            channel.push(self.binary_encoder.class_table, text=False, control=True)
 
-        # Create a dedicated sending task for this client (like server.py)
+        # Create a dedicated status task for this client (like server.py)
         async def send_signals_to_client():
             # Wait a bit before starting to send signals to ensure handshake is complete
             await asyncio.sleep(1)
             while True:
                 try:
-                    # Always send current detection status
-                    if self.all_objects:
-                        # Calculate overall average confidence
-                        total_confidence = sum(obj["confidence"] for obj in self.all_objects.values() if isinstance(obj, dict))
-                        avg_confidence = total_confidence / len([obj for obj in self.all_objects.values() if isinstance(obj, dict)])
-                        
-                        # Create object summary
-                        object_summary = []
-                        for obj_name, obj_data in self.all_objects.items():
-                            if isinstance(obj_data, dict):
-                                object_summary.append(f"{obj_data['count']} {obj_name}(s) @{obj_data['confidence']:.2f}")
-                            else:
-                                object_summary.append(f"{obj_data} {obj_name}(s)")
-                        
-                        message = {
-                            "alert": self.signal_active,  # True only for person+cup combo
-                            "status": "active",
-                            "timestamp": datetime.now().isoformat(),
-                            "frame": self.frame_count,
-                            "target_detection": self.current_detection,
-                            "target_confidence": self.current_confidence,
-                            "average_confidence": round(avg_confidence, 3),
-                            "all_objects": self.all_objects,
-                            "summary": ", ".join(object_summary),
-                            "message": f"Detecting: {', '.join(object_summary)}"
-                        }
-                        await websocket.send(json.dumps(message))
-                        if self.frame_count % 50 == 0:  # Reduce logging frequency
-                            self.logger.debug(f"Status sent to {client_info}: {message['summary']}")
-
-                    await asyncio.sleep(0.5)  # Send updates every 0.5 seconds
-                except websockets.exceptions.ConnectionClosed:
-                    self.logger.info(f"Connection closed while sending signals to {client_info}")
-                    break
+                    snapshot = self.scene_for(channel.view[0])
+                    now = time.monotonic()
+                    if channel.min_interval and channel.throttled(now):
+                        pass  # max_rate from the client's subscription
+                    elif channel.view[1] == "delta":
+                        # Delta clients need a keyframe when they join or fall behind, and every
+                        # DELTA_KEYFRAME_INTERVAL to resync even if they never missed a message
+                        if channel.needs_keyframe or now - channel.last_keyframe >= DELTA_KEYFRAME_INTERVAL:
+                            payload, text = self.encode_view(channel.view, snapshot)
+                            if channel.push(payload, snapshot.version, text):
+                                channel.needs_keyframe = False
+                                channel.behind = False
+                                channel.last_keyframe = now
+                        elif channel.behind:
+                            # Changes skipped for max_rate, in case the scene has gone quiet since
+                            message = self.encode_view(channel.view, snapshot, keyframe=False, since=channel.version)
+                            if message is None or channel.push(message[0], snapshot.version, message[1]):
+                                channel.behind = False
+                    # Only send when this client hasn't already been queued the current scene
+                    elif snapshot.all_objects and snapshot.version != channel.version:
+                        # Goes through the client's outbound buffer so there's a single writer per socket
+                        payload, text = self.encode_view(channel.view, snapshot, status=True)
+                        if not channel.push(payload, snapshot.version, text):
+                            break
+                        if snapshot.frame % 50 == 0:  # Reduce logging frequency
+                            self.logger.debug("Status sent to %s: %s", client_info, snapshot.summary)
+
+                    await asyncio.sleep(0.5)  # Check for updates every 0.5 seconds
                 except Exception as e:
                     self.logger.error(f"Error sending to {client_info}: {e}")
                     break
@@ -295,9 +662,10 @@ class CameraMonitor:
             while True:
                 try:
                     message = await asyncio.wait_for(websocket.recv(), timeout=10)
-                    self.logger.info(f"Received message from {client_info}: {message}")
+                    if not self.handle_client_message(channel, message, client_info):
+                        self.logger.info(f"Received message from {client_info}: {message}")
                 except asyncio.TimeoutError:
-                    self.logger.debug(f"No message received from {client_info}, sending ping to keep connection alive")
+                    self.logger.debug("No message received from %s, sending ping to keep connection alive", client_info)
                     await websocket.ping()
 
         except websockets.exceptions.ConnectionClosed:
@@ -306,17 +674,28 @@ class CameraMonitor:
             self.logger.error(f"WebSocket error with {client_info}: {e}")
         finally:
             signal_task.cancel()  # Clean up the sending task
-            self.connected_clients.discard(websocket)
-            self.logger.info(f"Client {client_info} disconnected. Remaining clients: {len(self.connected_clients)}")
+            self.hub.remove(websocket)
+            self.prune_delta_streams()
+            self.logger.info(f"Client {client_info} disconnected. Remaining clients: {len(self.hub)}")
+
+    @staticmethod
+    def _connection_options(websocket, path=None):
+        """Query string options from the connection URL, e.g. /?stream=delta"""
+        if path is None:
+            # websockets 14+ passes only the connection; the path lives on the request
+            request = getattr(websocket, "request", None)
+            path = getattr(request, "path", "/")
+        return {key: values[-1] for key, values in parse_qs(urlsplit(path).query).items()}
 
     async def start_websocket_server(self):
         """Start the WebSocket server"""
-        self.logger.info("Starting WebSocket server on 0.0.0.0:6789")
+        self.logger.info(f"Starting WebSocket server on 0.0.0.0:{self.websocket_port}")
         try:
             async with websockets.serve(
                 self.handle_websocket_connection, 
                 "0.0.0.0", 
-                6789,
+                self.websocket_port,
+                select_subprotocol=select_subprotocol,  # no subprotocol requested means JSON
                 ping_interval=20,  # Send ping every 20 seconds
                 ping_timeout=10,   # Wait 10 seconds for pong
                 close_timeout=10   # Wait 10 seconds for close
@@ -330,25 +709,42 @@ class CameraMonitor:
     async def cleanup(self):
         """Cleanup resources"""
         self.logger.info("Starting cleanup process...")
-        if self.camera_process and self.camera_process.returncode is None:
-            self.logger.info("Terminating camera process...")
-            self.camera_process.terminate()
-            try:
-                await asyncio.wait_for(self.camera_process.wait(), timeout=5.0)
-                self.logger.info("Camera process terminated gracefully")
-            except asyncio.TimeoutError:
-                self.logger.warning("Camera process didn't terminate, killing...")
-                self.camera_process.kill()
+        for source in self.sources.values():
+            process = source.camera_process
+            if process and process.returncode is None:
+                self.logger.info(f"Terminating camera {source.name} process...")
+                process.terminate()
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=5.0)
+                    self.logger.info(f"Camera {source.name} process terminated gracefully")
+                except asyncio.TimeoutError:
+                    self.logger.warning(f"Camera {source.name} process didn't terminate, killing...")
+                    process.kill()
+        if self.history:
+            await self.history.close()
         self.logger.info("Cleanup complete")
 
     async def run(self):
         """Main run loop"""
         try:
-            # Start both camera monitoring and WebSocket server concurrently
-            await asyncio.gather(
-                self.start_camera_monitoring(),
-                self.start_websocket_server()
-            )
+            # Start every camera with its own distributor, and the WebSocket server, concurrently
+            tasks = [self.start_websocket_server()]
+            for source in self.sources.values():
+                tasks.append(source.run())
+                tasks.append(self.distribute_scenes(source))
+                if source.clip_recorder:
+                    tasks.append(source.clip_recorder.run())
+            if self.history:
+                tasks.append(self.history.run())
+            tasks.append(self.broadcast_occupancy())
+            if self.metrics_port:
+                # Scraped over plain HTTP on its own port, served from the same event loop
+                metrics_server = MetricsServer(self.render_metrics, port=self.metrics_port, logger=self.logger)
+                metrics_server.add_route("/occupancy", self.occupancy_endpoint)
+                if self.history:
+                    metrics_server.add_route("/history", self.history_endpoint)
+                tasks.append(metrics_server.serve())
+            await asyncio.gather(*tasks)
         except KeyboardInterrupt:
             self.logger.info("Received interrupt signal")
         except Exception as e:
@@ -360,15 +756,62 @@ def signal_handler(signum, frame):
     logging.info(f"Received signal {signum}")
     sys.exit(0)
 
-async def main():
-    # Parse command line arguments
+def parse_camera(value):
+    """--camera NAME=INDEX (or just INDEX, named camN)"""
+    name, _, index = value.rpartition("=")
+    try:
+        index = int(index)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected NAME=INDEX, got {value!r}")
+    return {"name": name or f"cam{index}", "camera": index}
+
+def replay_options(args):
+    """ReplaySource options from the command line, or None to run the real cameras"""
+    if not args.replay:
+        return None
+    return {"replay": args.replay, "replay_format": args.replay_format, "rate": args.replay_rate,
+            "loop": args.replay_loop}
+
+def build_arg_parser():
     parser = argparse.ArgumentParser(description='Combined Camera Monitor with Object Detection')
     parser.add_argument('--preview', action='store_true',
                        help='Show camera preview window (for local testing)')
     parser.add_argument('--headless', action='store_true',
                        help='Run without preview window (for SSH/remote)')
+    parser.add_argument('--camera', action='append', metavar='NAME=INDEX', type=parse_camera, dest='cameras',
+                       help='Run a camera source; repeat for several cameras (default: CAMERAS in monitor_config.py)')
+    parser.add_argument('--video-output', choices=['drop', 'pipe'], default='drop',
+                       help='Headless video: drop it at the source or pipe it to video consumers (default: drop)')
+    parser.add_argument('--metadata-fifo', metavar='PATH',
+                       help='Read structured per-frame detections from this FIFO instead of scraping verbose logs')
+    parser.add_argument('--metadata-format', choices=sorted(METADATA_PARSERS), default='jsonl',
+                       help='Record format written to --metadata-fifo (default: jsonl)')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                       help=f'Port for the Prometheus metrics endpoint, 0 to disable (default: {METRICS_PORT})')
+    parser.add_argument('--clip-dir', metavar='DIR', default=CLIP_DIR,
+                       help='Save pre/post-roll H.264 clips here when the alert fires (headless only; pipes video)')
+    parser.add_argument('--replay', metavar='PATH',
+                       help='Replay a recorded rpicam log (or metadata file) instead of running the camera; '
+                            '"synthetic" generates random detections')
+    parser.add_argument('--replay-format', choices=['log'] + sorted(METADATA_PARSERS), default='log',
+                       help='Format of the --replay file: rpicam stderr log or a metadata stream (default: log)')
+    parser.add_argument('--replay-rate', type=float, default=10.0,
+                       help='Frames per second to replay at, 0 for as fast as possible (default: 10)')
+    parser.add_argument('--replay-loop', action='store_true',
+                       help='Start the --replay file again when it ends')
+    parser.add_argument('--history-db', metavar='PATH', default=HISTORY_DB,
+                       help='Store every frame in this SQLite database and serve /history queries')
+    parser.add_argument('--no-tracking', dest='tracking', action='store_false', default=TRACKING,
+                       help='Publish raw per-frame detections instead of tracked, debounced objects')
+    parser.add_argument('--log-format', choices=['text', 'json'], default=LOG_FORMAT,
+                       help=f'Log output format; json writes one JSON object per line (default: {LOG_FORMAT})')
+    parser.add_argument('--log-file', metavar='PATH', default=LOG_FILE,
+                       help='Also append logs to this file')
+    return parser
 
-    args = parser.parse_args()
+async def main():
+    # Parse command line arguments
+    args = build_arg_parser().parse_args()
 
     # Determine preview mode
     show_preview = False
@@ -378,24 +821,25 @@ async def main():
         show_preview = False
     else:
         # Auto-detect: check if DISPLAY is set (local) or not (SSH)
-        import os
         show_preview = 'DISPLAY' in os.environ and os.environ['DISPLAY']
 
+    # Log writes happen on a background thread, never on the event loop
+    log_handler = configure_logging(log_format=args.log_format, log_file=args.log_file,
+                                    rate_limits=LOG_RATE_LIMITS, queue_size=LOG_QUEUE_SIZE)
+
     # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    monitor = CameraMonitor(show_preview=show_preview)
+    monitor = CameraMonitor(show_preview=show_preview, video_output=args.video_output,
+                            metadata_fifo=args.metadata_fifo, metadata_format=args.metadata_format,
+                            metrics_port=args.metrics_port, log_handler=log_handler, clip_dir=args.clip_dir,
+                            cameras=args.cameras, history_db=args.history_db, replay=replay_options(args),
+                            tracking=args.tracking)
     await monitor.run()
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Combined Camera Monitor with Object Detection')
-    parser.add_argument('--preview', action='store_true',
-                       help='Show camera preview window (for local testing)')
-    parser.add_argument('--headless', action='store_true',
-                       help='Run without preview window (for SSH/remote)')
-
-    args = parser.parse_args()
+    args = build_arg_parser().parse_args()
 
     print("🔍 Combined Camera Monitor with Enhanced Detection")
     print("📡 WebSocket server will be available on ws://0.0.0.0:6789")
@@ -10,6 +10,22 @@ PASSWORD = "your_actual_password"  # Replace with your actual WiFi password
 SERVER_IP = "peeper.local"  # Use hostname or IP address of your Raspberry Pi
 SERVER_PORT = 6789
 
+# Ask the server for the compact binary wire format (falls back to JSON on older servers)
+USE_BINARY_PROTOCOL = True
+
+# Send our scales/priorities to the server at connect time; it then sends just "duty + sound"
+USE_SERVER_PROFILE = True
+
+# Let the server's ALERT_RULES (monitor_config.py) drive the needle instead of the priorities below
+# (needs USE_SERVER_PROFILE)
+USE_SERVER_RULES = False
+
+# Only receive the labels we react to (primary + interesting objects), above a confidence floor
+USE_SUBSCRIPTION = True
+SUBSCRIBE_CAMERAS = []          # Camera names to follow (empty = merged view of all cameras)
+SUBSCRIBE_MIN_CONFIDENCE = 0.1  # Server drops detections below this confidence
+SUBSCRIBE_MAX_RATE = 0          # Max scene messages per second (0 = every frame)
+
 # ====== DETECTION PRIORITIES ======
 # Object priority scaling factors (0.0 = no response, 1.0 = full response)
 PERSON_SCALE = 0.7      # Person detection alone gets 70% response
@@ -55,6 +71,26 @@ UFO_SUSTAIN_SEC = 2.0
 UFO_FADE_OUT_SEC = 1.0
 UFO_STEP_MS = 5             # CPU delay between updates
 
+# Named sound effects - each is precomputed into frequency/duty tables at boot
+SOUND_EFFECTS = {
+    "ufo": {
+        "base_freq": UFO_BASE_FREQ, "freq_depth": UFO_FREQ_DEPTH, "lfo_rate": UFO_LFO_RATE,
+        "volume_depth": UFO_VOLUME_DEPTH, "volume": UFO_VOLUME,
+        "fade_in": UFO_FADE_IN_SEC, "sustain": UFO_SUSTAIN_SEC, "fade_out": UFO_FADE_OUT_SEC,
+    },
+    "alarm": {
+        "base_freq": 1200, "freq_depth": 500, "lfo_rate": 8,
+        "volume_depth": 0.1, "volume": 1.0,
+        "fade_in": 0.05, "sustain": 1.5, "fade_out": 0.3,
+    },
+}
+
+# Effect per alert level: the first entry whose threshold the PWM duty exceeds is played
+SOUND_LEVELS = [
+    (0.8, "alarm"),
+    (SOUND_THRESHOLD, "ufo"),
+]
+
 # ====== CONNECTION SETTINGS ======
 # WiFi connection parameters
 WIFI_MAX_ATTEMPTS = 100     # Maximum connection attempts (10 seconds total)
@@ -64,4 +100,10 @@ WIFI_RETRY_DELAY = 0.1      # Seconds between connection attempts
 NETWORK_STABILIZE_DELAY = 3  # Seconds to wait after WiFi connection
 
 # WebSocket reconnection
-WEBSOCKET_RETRY_DELAY = 5   # Seconds to wait before reconnecting on error
\ No newline at end of file
+WEBSOCKET_RETRY_DELAY = 5   # Seconds to wait before reconnecting on error
+WEBSOCKET_PING_INTERVAL = 15  # Seconds of silence before pinging the server (reconnect if unanswered)
+SEND_ACKS = True            # Echo each message's trace id back once applied (server measures round-trip latency)
+
+# ====== MEMORY SETTINGS ======
+GC_THRESHOLD = 16384        # Bytes allocated between garbage collections (smaller = shorter pauses)
+MEM_REPORT_INTERVAL = 60    # Seconds between heap statistics printouts (0 = off)
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Parsers for the detections produced by the rpicam Hailo post-processing stage"""
+import json
+import re
+import struct
+
+
+class DetectionParser:
+    """Extract every (label, confidence, box) from a log line with one precompiled regex
+
+    Lines look like ``Object: person[0] (0.87) @ 120,34 200x310``; the ``[id]`` and
+    ``@ x,y wxh`` parts are optional. A label only matches as whole words directly
+    followed by its confidence, so "cup" never matches inside "cupboard" and a
+    label can never borrow the confidence of a later object.
+    """
+
+    def __init__(self, labels):
+        self.labels = [label.lower() for label in labels]
+        self._vocabulary = frozenset(self.labels)
+        # Capture up to as many words as the longest label, then check them against
+        # the vocabulary - much cheaper than an alternation over every label
+        max_words = max((label.count(' ') + 1 for label in self.labels), default=1)
+        pattern = re.compile(
+            r'(?<![A-Za-z])([A-Za-z]+(?: [A-Za-z]+){0,%d})(?:\[\d+\])?\s*\((\d+(?:\.\d+)?)\)'
+            r'(?:\s*@\s*(\d+),\s*(\d+)\s+(\d+)x(\d+))?' % (max_words - 1)
+        )
+        self._findall = pattern.findall
+
+    def _label(self, words):
+        """Map captured words to a vocabulary label, dropping leading non-label words"""
+        words = words.lower()
+        vocabulary = self._vocabulary
+        while words not in vocabulary:
+            _, sep, words = words.partition(' ')
+            if not sep:
+                return None
+        return words
+
+    def is_detection_line(self, line):
+        """Check if this line carries at least one detection"""
+        return self.parse(line) is not None
+
+    def parse(self, line):
+        """Return a list of (label, confidence, box) tuples, or None for non-detection lines
+
+        box is (x, y, width, height) in pixels when the line includes it, else None.
+        """
+        # Every detection carries "(confidence)" - reject plain log lines before the regex runs
+        if '(' not in line:
+            return None
+        detections = []
+        for words, conf, x, y, w, h in self._findall(line):
+            label = self._label(words)
+            if label is not None:
+                detections.append((label, float(conf), (int(x), int(y), int(w), int(h)) if w else None))
+        return detections or None
+
+
+class JsonLinesMetadataParser:
+    """Incremental parser for per-frame detection metadata written as JSON lines
+
+    Each line is one frame::
+
+        {"frame": 42, "timestamp": 1712345678.25,
+         "detections": [{"label": "person", "confidence": 0.87, "box": [120, 34, 200, 310]}]}
+
+    "class_id" may be given instead of "label"; it indexes the label vocabulary.
+    """
+
+    def __init__(self, labels):
+        self.labels = [label.lower() for label in labels]
+        self.malformed = 0  # lines skipped because they weren't valid frame records
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        """Consume a chunk of bytes and return the (sequence, timestamp, detections) frames it completes"""
+        buffer = self._buffer
+        buffer += chunk
+        frames = []
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            if end > start:
+                try:
+                    frames.append(self._parse_frame(json.loads(buffer[start:end])))
+                except (ValueError, TypeError, AttributeError):
+                    self.malformed += 1
+            start = end + 1
+        if start:
+            del buffer[:start]
+        return frames
+
+    def _parse_frame(self, record):
+        detections = []
+        labels = self.labels
+        for det in record.get("detections", ()):
+            label = det.get("label")
+            if label is None:
+                class_id = det.get("class_id")
+                if class_id is None or not 0 <= class_id < len(labels):
+                    continue
+                label = labels[class_id]
+            box = det.get("box")
+            detections.append((label.lower(), float(det.get("confidence", 0.0)), tuple(box) if box else None))
+        return record.get("frame"), record.get("timestamp"), detections
+
+
+class BinaryMetadataParser:
+    """Incremental parser for per-frame detection metadata as a packed binary record stream
+
+    Frame header (little endian): magic b"PPD1", sequence u32, timestamp f64 (seconds), count u16,
+    followed by count records of: class_id u16, confidence f32, x u16, y u16, width u16, height u16.
+    class_id indexes the label vocabulary.
+    """
+
+    MAGIC = b"PPD1"
+    HEADER = struct.Struct("<4sIdH")
+    RECORD = struct.Struct("<HfHHHH")
+
+    def __init__(self, labels):
+        self.labels = [label.lower() for label in labels]
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        """Consume a chunk of bytes and return the (sequence, timestamp, detections) frames it completes"""
+        buffer = self._buffer
+        buffer += chunk
+        header_size = self.HEADER.size
+        record_size = self.RECORD.size
+        unpack_header = self.HEADER.unpack_from
+        unpack_record = self.RECORD.unpack_from
+        labels = self.labels
+        frames = []
+        offset = 0
+        while len(buffer) - offset >= header_size:
+            magic, sequence, timestamp, count = unpack_header(buffer, offset)
+            if magic != self.MAGIC:
+                # Lost sync - skip ahead to the next header
+                next_header = buffer.find(self.MAGIC, offset + 1)
+                offset = next_header if next_header >= 0 else len(buffer) - (len(self.MAGIC) - 1)
+                continue
+            end = offset + header_size + count * record_size
+            if end > len(buffer):
+                break
+            detections = []
+            for position in range(offset + header_size, end, record_size):
+                class_id, confidence, x, y, w, h = unpack_record(buffer, position)
+                if class_id < len(labels):
+                    detections.append((labels[class_id], confidence, (x, y, w, h)))
+            frames.append((sequence, timestamp, detections))
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+
+METADATA_PARSERS = {
+    "jsonl": JsonLinesMetadataParser,
+    "binary": BinaryMetadataParser,
+}
@@ -0,0 +1,197 @@
+"""Detection history: every frame's scene in SQLite (WAL), written in batches off the event loop"""
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    camera TEXT,
+    alert INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frames_ts ON frames (ts);
+CREATE TABLE IF NOT EXISTS detections (
+    frame_id INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    confidence REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS detections_frame ON detections (frame_id);
+"""
+
+# Most buckets a single query returns; longer ranges get a coarser step
+MAX_BUCKETS = 2000
+
+
+class HistoryStore:
+    """Append-only scene history with retention and downsampled range queries
+
+    record() is called for every frame on the event loop and only appends to a
+    list. A flush task hands the batch to a single database thread every
+    flush_interval seconds, so the SD card sees a few transactions per second
+    however high the frame rate. Rows older than retention_days are deleted and
+    the freed pages returned to the filesystem.
+    """
+
+    def __init__(self, path, flush_interval=0.5, retention_days=7.0, prune_interval=3600.0,
+                 max_pending=10000, logger=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention = retention_days * 86400
+        self.prune_interval = prune_interval
+        self.max_pending = max_pending
+        self.logger = logger or logging.getLogger(__name__)
+        self.pending = deque()  # (wall time, camera, alert, all_objects) per frame
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        # One thread owns the connection: batched writes, pruning and queries run there in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self.db = None
+
+    def record(self, snapshot):
+        """Scene consumer: queue a frame for the next batch (never touches the disk)"""
+        pending = self.pending
+        if len(pending) >= self.max_pending:
+            # Database can't keep up - drop the oldest frame rather than grow without bound
+            pending.popleft()
+            self.dropped += 1
+        pending.append((time.time(), snapshot.camera, snapshot.alert, snapshot.all_objects))
+        self.recorded += 1
+
+    async def _call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def _open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        # Incremental auto-vacuum only takes effect on a new database (before any table exists)
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        db.execute("PRAGMA journal_mode = WAL")
+        # WAL + NORMAL: no fsync per transaction, still consistent after a power cut
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.executescript(SCHEMA)
+        self.db = db
+
+    def _write(self, batch):
+        db = self.db
+        with db:
+            for ts, camera, alert, all_objects in batch:
+                frame_id = db.execute("INSERT INTO frames (ts, camera, alert) VALUES (?, ?, ?)",
+                                      (ts, camera, int(alert))).lastrowid
+                if all_objects:
+                    db.executemany(
+                        "INSERT INTO detections (frame_id, label, count, confidence) VALUES (?, ?, ?, ?)",
+                        [(frame_id, label, data["count"], data["confidence"]) for label, data in all_objects.items()]
+                    )
+
+    def _prune(self, cutoff):
+        db = self.db
+        with db:
+            oldest = db.execute("SELECT MIN(id) FROM frames WHERE ts >= ?", (cutoff,)).fetchone()[0]
+            if oldest is None:
+                oldest = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM frames").fetchone()[0]
+            db.execute("DELETE FROM detections WHERE frame_id < ?", (oldest,))
+            removed = db.execute("DELETE FROM frames WHERE id < ?", (oldest,)).rowcount
+        db.execute("PRAGMA incremental_vacuum")
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    async def run(self):
+        """Flush task: batch writes every flush_interval, prune once per prune_interval"""
+        await self._call(self._open)
+        self.logger.info(f"🗄️ Recording detection history to {self.path}")
+        next_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.pending:
+                batch, self.pending = self.pending, deque()
+                try:
+                    await self._call(self._write, batch)
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    self.dropped += len(batch)
+                    self.logger.error(f"Error writing detection history: {e}")
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + self.prune_interval
+                try:
+                    removed = await self._call(self._prune, time.time() - self.retention)
+                    if removed:
+                        self.logger.info(f"Pruned {removed} frames older than the history retention")
+                except sqlite3.Error as e:
+                    self.logger.error(f"Error pruning detection history: {e}")
+
+    def _close(self, batch):
+        if self.db is None:
+            return 0
+        if batch:
+            self._write(batch)
+        self.db.close()
+        self.db = None
+        return len(batch)
+
+    async def close(self):
+        """Write whatever is still pending and close the database"""
+        batch, self.pending = self.pending, deque()
+        try:
+            self.written += await self._call(self._close, batch)
+        except sqlite3.Error as e:
+            self.logger.error(f"Error closing detection history: {e}")
+        self.executor.shutdown(wait=False)
+
+    def _query(self, start, end, step, camera, labels):
+        where = "f.ts >= ? AND f.ts < ?"
+        args = [start, end]
+        if camera is not None:
+            where += " AND f.camera = ?"
+            args.append(camera)
+        bucket = "CAST((f.ts - ?) / ? AS INTEGER)"
+        frame_counts = dict(self.db.execute(
+            f"SELECT {bucket} AS b, COUNT(*) FROM frames f WHERE {where} GROUP BY b",
+            [start, step] + args
+        ))
+        label_filter = ""
+        if labels:
+            label_filter = f" AND d.label IN ({', '.join('?' * len(labels))})"
+            args += list(labels)
+        rows = self.db.execute(
+            f"SELECT {bucket} AS b, d.label, COUNT(*), SUM(d.count), MAX(d.count), AVG(d.confidence), "
+            f"MAX(d.confidence) FROM frames f JOIN detections d ON d.frame_id = f.id "
+            f"WHERE {where}{label_filter} GROUP BY b, d.label ORDER BY b",
+            [start, step] + args
+        ).fetchall()
+
+        series = {}
+        for index, label, seen, total, max_count, avg_confidence, max_confidence in rows:
+            frames = frame_counts.get(index, seen)
+            series.setdefault(label, []).append({
+                "t": start + index * step,
+                "presence": round(seen / frames, 4),
+                "avg_count": round(total / frames, 4),
+                "max_count": max_count,
+                "avg_confidence": round(avg_confidence, 4),
+                "max_confidence": round(max_confidence, 4),
+            })
+        return {"start": start, "end": end, "step": step, "camera": camera,
+                "frames": sum(frame_counts.values()), "series": series}
+
+    async def query(self, start, end=None, step=60.0, camera=None, labels=None):
+        """Per-label aggregates in buckets of step seconds between two Unix times
+
+        Each bucket has presence (fraction of frames with the label), average and
+        maximum count, and average and maximum confidence. Raw frames never leave
+        the database.
+        """
+        end = time.time() if end is None else float(end)
+        start = float(start)
+        step = max(1.0, float(step))
+        if end <= start:
+            raise ValueError("end must be after start")
+        # Keep responses small whatever range is asked for
+        step = max(step, (end - start) / MAX_BUCKETS)
+        if self.db is None:
+            raise ValueError("history store is not open yet")
+        return await self._call(self._query, start, end, step, camera, labels)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Open many WebSocket clients against a running monitor and measure what they receive"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import websockets
+
+from metrics import LatencyHistogram
+from wire_format import BINARY_SUBPROTOCOL
+
+
+class LoadClient:
+    """One simulated dashboard: counts messages and bytes, and times scene delivery
+
+    Latency is measured from the scene's "timestamp" (set when the frame was
+    parsed) to the moment the message arrives, so it is only meaningful with the
+    monitor on the same machine. Messages without a timestamp (delta, profile and
+    binary streams) are counted but not timed; use ack=True to have the monitor
+    time them as round trips instead.
+    """
+
+    def __init__(self, url, ack=False, subprotocol=None, control=None):
+        self.url = url
+        self.ack = ack
+        self.subprotocol = subprotocol
+        self.control = control  # JSON control messages sent after connecting, e.g. a subscription
+        self.latency = LatencyHistogram()
+        self.messages = 0
+        self.bytes = 0
+        self.errors = 0
+        self._trace = None  # trace id of the last message, for acks
+
+    async def run(self, duration):
+        deadline = time.monotonic() + duration
+        subprotocols = [self.subprotocol] if self.subprotocol else None
+        try:
+            async with websockets.connect(self.url, subprotocols=subprotocols, max_queue=None) as websocket:
+                for message in self.control or ():
+                    await websocket.send(json.dumps(message))
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        message = await asyncio.wait_for(websocket.recv(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    self.receive(message)
+                    if self.ack and isinstance(message, str):
+                        trace = self._trace
+                        if trace:
+                            await websocket.send(b'{"ack":%d}' % trace)
+        except (OSError, websockets.exceptions.WebSocketException):
+            self.errors += 1
+
+    def receive(self, message):
+        received = datetime.now()
+        self.messages += 1
+        self.bytes += len(message)
+        self._trace = None
+        if not isinstance(message, str):
+            return
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        self._trace = data.get("trace")
+        timestamp = data.get("timestamp")
+        if timestamp:
+            self.latency.record((received - datetime.fromisoformat(timestamp)).total_seconds())
+
+
+async def run_load(url, clients=100, duration=10.0, ack=False, subprotocol=None, control=None, ramp=2.0):
+    """Connect `clients` LoadClients over `ramp` seconds, keep them for `duration`, and summarise"""
+    load = [LoadClient(url, ack, subprotocol, control) for _ in range(clients)]
+    tasks = []
+    for client in load:
+        tasks.append(asyncio.create_task(client.run(duration)))
+        if ramp:
+            await asyncio.sleep(ramp / clients)
+    await asyncio.gather(*tasks)
+
+    latency = LatencyHistogram()
+    for client in load:
+        latency.merge(client.latency)
+    messages = sum(client.messages for client in load)
+    return {
+        "clients": clients,
+        "errors": sum(client.errors for client in load),
+        "messages": messages,
+        "messages_per_second": round(messages / duration, 1),
+        "bytes": sum(client.bytes for client in load),
+        "delivery_latency": latency.summary(),
+    }
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='WebSocket load generator for the camera monitor')
+    parser.add_argument('--url', default='ws://127.0.0.1:6789/',
+                       help='Monitor URL, including any options such as ?stream=delta (default: ws://127.0.0.1:6789/)')
+    parser.add_argument('--clients', type=int, default=100, help='Number of concurrent clients (default: 100)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds each client stays connected')
+    parser.add_argument('--ramp', type=float, default=2.0, help='Seconds over which clients connect')
+    parser.add_argument('--ack', action='store_true', help='Acknowledge every message so the monitor times round trips')
+    parser.add_argument('--binary', action='store_true', help=f'Request the {BINARY_SUBPROTOCOL} subprotocol')
+    parser.add_argument('--subscribe', metavar='JSON',
+                       help='Control message sent after connecting, e.g. \'{"subscribe": {"labels": ["person"]}}\'')
+    return parser
+
+
+async def main():
+    args = build_arg_parser().parse_args()
+    control = [json.loads(args.subscribe)] if args.subscribe else None
+    summary = await run_load(args.url, args.clients, args.duration, args.ack,
+                             BINARY_SUBPROTOCOL if args.binary else None, control, args.ramp)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
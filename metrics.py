@@ -0,0 +1,217 @@
+"""Cheap in-process metrics: fixed-bucket latency histograms and counters updated on every
+frame, exposed in Prometheus text format by a small HTTP endpoint"""
+import asyncio
+import logging
+from bisect import bisect_left
+from collections import deque
+from urllib.parse import parse_qs
+
+# Log-spaced bucket upper bounds from 50 µs to ~60 s
+LATENCY_BUCKETS = tuple(50e-6 * 1.25 ** i for i in range(64))
+
+
+class LatencyHistogram:
+    """Latency distribution in fixed log-spaced buckets
+
+    Recording is a bisect plus two additions, so it is safe on the per-frame path;
+    percentiles are read from the buckets (accurate to one bucket, ~25%).
+    """
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other):
+        """Add another histogram's samples into this one"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction (0.0-1.0) of samples"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return LATENCY_BUCKETS[min(index, len(LATENCY_BUCKETS) - 1)]
+        return LATENCY_BUCKETS[-1]
+
+    def summary(self):
+        """p50/p95/p99 in milliseconds"""
+        return {
+            "count": self.count,
+            "p50_ms": round(self.percentile(0.50) * 1000, 2),
+            "p95_ms": round(self.percentile(0.95) * 1000, 2),
+            "p99_ms": round(self.percentile(0.99) * 1000, 2),
+        }
+
+
+# Pipeline stages, in order, measured from the monotonic timestamps on each snapshot:
+#   parse      line read -> scene built
+#   queue      scene built -> broadcast enqueued (time in the latest-scene queue)
+#   write      broadcast enqueued -> socket write complete (per client)
+#   delivery   line read -> socket write complete (per client)
+#   round_trip line read -> Pico ack after the duty was applied (per client)
+PIPELINE_STAGES = ("parse", "queue")
+CLIENT_STAGES = ("write", "delivery", "round_trip")
+
+
+def stage_histograms(stages):
+    return {stage: LatencyHistogram() for stage in stages}
+
+
+class RateMeter:
+    """Per-second rate of a monotonically increasing total, sampled when it's read
+
+    The hot path only bumps a plain integer; the rate is worked out at scrape time
+    against the oldest sample still inside the window.
+    """
+
+    __slots__ = ("window", "samples")
+
+    def __init__(self, window=10.0):
+        self.window = window
+        self.samples = deque()
+
+    def rate(self, total, now):
+        samples = self.samples
+        samples.append((now, total))
+        while len(samples) > 2 and now - samples[1][0] >= self.window:
+            samples.popleft()
+        then, then_total = samples[0]
+        if now <= then:
+            return 0.0
+        return (total - then_total) / (now - then)
+
+
+# Every 4th bucket is enough resolution for a scrape and keeps the exposition short
+PROMETHEUS_BUCKETS = range(3, len(LATENCY_BUCKETS), 4)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class PrometheusText:
+    """Builder for the Prometheus text exposition format (version 0.0.4)"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.lines = []
+        self.declared = set()
+
+    def declare(self, name, kind, help_text):
+        if name not in self.declared:
+            self.declared.add(name)
+            self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, kind, help_text, value, labels=None):
+        self.declare(name, kind, help_text)
+        self.lines.append(f"{name}{_labels(labels)} {value}")
+
+    def counter(self, name, help_text, value, labels=None):
+        self.sample(name, "counter", help_text, value, labels)
+
+    def gauge(self, name, help_text, value, labels=None):
+        self.sample(name, "gauge", help_text, value, labels)
+
+    def histogram(self, name, help_text, histogram, labels=None):
+        """Expose a LatencyHistogram as cumulative le buckets"""
+        self.declare(name, "histogram", help_text)
+        labels = labels or {}
+        counts = histogram.counts
+        cumulative = 0
+        previous = 0
+        for index in PROMETHEUS_BUCKETS:
+            cumulative += sum(counts[previous:index + 1])
+            previous = index + 1
+            bucket_labels = dict(labels, le=f"{LATENCY_BUCKETS[index]:.6g}")
+            self.lines.append(f"{name}_bucket{_labels(bucket_labels)} {cumulative}")
+        self.lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {histogram.count}")
+        self.lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+        self.lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    def render(self):
+        return ("\n".join(self.lines) + "\n").encode()
+
+
+class MetricsServer:
+    """Minimal HTTP server for GET /metrics on the monitor's own event loop
+
+    render() is called once per scrape and returns the exposition bytes; nothing
+    here runs on the per-frame path. Other read-only endpoints can be added with
+    add_route().
+    """
+
+    def __init__(self, render, host="0.0.0.0", port=9108, logger=None):
+        self.render = render
+        self.host = host
+        self.port = port
+        self.logger = logger or logging.getLogger(__name__)
+        self.scrapes = 0
+        self.routes = {}
+
+    def add_route(self, path, handler):
+        """Serve GET path with: async handler(query params) -> (body bytes, content type)
+
+        A ValueError from the handler becomes a 400 response.
+        """
+        self.routes[path.encode()] = handler
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.logger.info(f"📈 Metrics available on http://{self.host}:{self.port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            method, path = request.split(b" ", 2)[:2]
+            route, _, query = path.partition(b"?")
+            if method != b"GET":
+                await self.respond(writer, "405 Method Not Allowed", b"")
+            elif route == b"/metrics":
+                self.scrapes += 1
+                await self.respond(writer, "200 OK", self.render(), PrometheusText.CONTENT_TYPE)
+            elif route in self.routes:
+                params = {key: values[-1] for key, values in parse_qs(query.decode()).items()}
+                try:
+                    body, content_type = await self.routes[route](params)
+                except ValueError as e:
+                    await self.respond(writer, "400 Bad Request", str(e).encode())
+                else:
+                    await self.respond(writer, "200 OK", body, content_type)
+            else:
+                await self.respond(writer, "404 Not Found", b"")
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except Exception as e:
+            self.logger.error(f"Error serving metrics: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, body, content_type="text/plain"):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
@@ -0,0 +1,135 @@
+# PeeperPam Monitor Configuration File
+# Server-side settings for combined_monitor.py running on the Raspberry Pi
+# (config.py holds the Pico W client settings)
+
+# ====== DETECTION LABELS ======
+# Label vocabulary the detection parser recognises (COCO 80 by default).
+# Must match the class names printed by the post-processing stage.
+DETECTION_LABELS = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck",
+    "boat", "traffic light", "fire hydrant", "stop sign", "parking meter", "bench",
+    "bird", "cat", "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra",
+    "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove",
+    "skateboard", "surfboard", "tennis racket", "bottle", "wine glass", "cup",
+    "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange",
+    "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
+    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse",
+    "remote", "keyboard", "cell phone", "microwave", "oven", "toaster", "sink",
+    "refrigerator", "book", "clock", "vase", "scissors", "teddy bear",
+    "hair drier", "toothbrush"
+]
+
+# ====== CAMERAS ======
+# One rpicam pipeline per entry. "camera" is the rpicam --camera index; "metadata_fifo" and "zones" are optional.
+# Clients get a merged scene of every camera, or one camera with ws://<server>:6789/?camera=<name>
+CAMERAS = [
+    {"name": "cam0", "camera": 0},
+]
+
+# ====== ZONES ======
+# Give a camera entry "zones" to report what is in each region of its image, in the detection
+# boxes' pixel coordinates. "alert" raises the scene alert while the zone holds at least those counts:
+#   {"name": "cam0", "camera": 0, "zones": [
+#       {"name": "doorway", "rect": [0, 0, 200, 480]},
+#       {"name": "desk", "polygon": [[300, 220], [640, 200], [640, 480], [260, 480]], "alert": {"person": 1, "cup": 1}},
+#   ]}
+ZONE_ANCHOR = "bottom"  # Point of each box tested against zones: "bottom" (centre of the bottom edge) or "center"
+
+# ====== BROADCAST SETTINGS ======
+WEBSOCKET_PORT = 6789   # Clients connect to ws://<server>:WEBSOCKET_PORT
+
+# Outbound messages buffered per WebSocket client before the slow-client policy applies
+CLIENT_QUEUE_SIZE = 8
+
+# What happens when a client can't keep up:
+#   "drop_oldest" - discard the oldest queued message
+#   "latest"      - discard everything queued and keep only the newest message
+#   "disconnect"  - close the connection
+SLOW_CLIENT_POLICY = "drop_oldest"
+
+# ====== DELTA STREAMING ======
+# Clients connecting to ws://<server>:6789/?stream=delta get one keyframe, then only changes
+DELTA_CONFIDENCE_EPSILON = 0.05   # Confidence moves smaller than this aren't sent
+DELTA_KEYFRAME_INTERVAL = 10.0    # Seconds between full keyframes for resync
+DELTA_HISTORY = 64                # Recent deltas kept to catch up max_rate clients with one merged delta
+
+# ====== ALERT RULES ======
+# Compiled at startup; each frame only re-checks rules whose labels (or zones) changed count or
+# crossed a min_confidence or RULE_LEVEL_STEP boundary.
+# A rule is active while all of its "when" conditions and at least one of its "any" conditions
+# have held for "for" seconds. A condition is {"label", optional "count" (exact) or
+# "min_count"/"max_count" (default: at least 1; "max_count": 0 means absent), "min_confidence",
+# "zone"}. "alert": True rules raise the scene alert (and alert clips); "priority" (0-1) times the
+# matched labels' mean confidence is the rule's level, which clients with "rules" in their profile
+# use as the needle duty. Optional "cameras": [names] limits a rule to those cameras.
+ALERT_RULES = [
+    {"name": "person_with_cup", "when": [{"label": "person", "count": 1}, {"label": "cup", "count": 1}],
+     "alert": True, "priority": 1.0},
+    {"name": "person", "when": [{"label": "person"}], "priority": 0.7},
+    {"name": "cup", "when": [{"label": "cup"}], "priority": 0.3},
+    # {"name": "desk_unattended", "when": [{"label": "laptop", "zone": "desk"},
+    #                                      {"label": "person", "zone": "desk", "max_count": 0}],
+    #  "for": 30, "alert": True, "priority": 0.8},
+]
+RULE_LEVEL_STEP = 0.1  # Confidence change that re-checks a rule and updates its level
+
+# ====== OBJECT TRACKING ======
+# Detections are matched to tracks across frames by bounding-box overlap, so counts and the
+# alert don't flicker; scenes are only broadcast when the tracked state changes
+TRACKING = True              # --no-tracking publishes raw per-frame detections instead
+TRACK_IOU_THRESHOLD = 0.3    # Minimum box overlap (intersection over union) to continue a track
+TRACK_CONFIRM_FRAMES = 2     # Frames in a row before a new object counts as present
+TRACK_DROP_FRAMES = 5        # Missed frames before a present object is dropped
+ALERT_ON_FRAMES = 3          # Frames in a row an alert rule must hold to raise the alert
+ALERT_OFF_FRAMES = 5         # Frames in a row it must be gone to clear the alert
+TRACK_CONFIDENCE_STEP = 0.1  # Confidence change that is worth a broadcast on its own
+
+# ====== OCCUPANCY ======
+# Rolling per-label statistics (presence, mean/max count, mean confidence, last seen) per camera.
+# Clients opt in with {"occupancy": true}; also served at http://<server>:METRICS_PORT/occupancy
+OCCUPANCY_WINDOWS = (10.0, 60.0, 3600.0)  # Window lengths in seconds
+OCCUPANCY_SLOTS = 60                      # Time buckets per window (its resolution)
+OCCUPANCY_INTERVAL = 5.0                  # Seconds between occupancy messages to opted-in clients
+
+# ====== CAMERA SUPERVISION ======
+CAMERA_RESTART_DELAY = 5.0   # Seconds to wait before restarting the camera process after it exits
+
+# ====== METRICS ======
+# Prometheus text format on http://<server>:METRICS_PORT/metrics (0 disables the endpoint)
+METRICS_PORT = 9108
+METRICS_RATE_WINDOW = 10.0   # Seconds averaged over for the per-second rate gauges
+
+# ====== LOGGING ======
+# Log records are written by a background thread; per-frame messages are rate limited
+LOG_FORMAT = "text"          # "text", or "json" for one JSON object per line
+LOG_FILE = None              # Also append logs to this file (None = stderr only)
+LOG_QUEUE_SIZE = 10000       # Records buffered for the writer thread before new ones are dropped
+
+# Per-frame message type -> (max lines per second, keep one in every N)
+LOG_RATE_LIMITS = {
+    "frame": (1.0, 1),          # "Frame N: Processing detection line"
+    "raw_detection": (1.0, 1),  # raw camera detection lines
+    "frame_objects": (2.0, 1),  # per-frame object summary
+    "broadcast": (1.0, 1),      # "Detection sent to N WebSocket clients" (alerts are never limited)
+}
+
+# ====== ALERT CLIPS ======
+# With a clip directory set (--clip-dir), the last few seconds of encoded video are kept in
+# memory and saved together with the following seconds whenever the alert fires
+CLIP_DIR = None
+CLIP_PRE_SECONDS = 5.0              # Video kept from before the alert (rounded back to a keyframe)
+CLIP_POST_SECONDS = 5.0             # Video recorded after the alert last fired
+CLIP_MAX_SECONDS = 60.0             # Longest single clip under a continuous alert
+CLIP_BUFFER_BYTES = 8 * 1024 * 1024 # Fixed size of the in-memory pre-event ring
+CLIP_MAX_PENDING_BYTES = 4 * 1024 * 1024  # Clip data waiting for the disk before it's dropped
+CLIP_INTRA_PERIOD = 10              # Frames between keyframes, so pre-roll starts close to CLIP_PRE_SECONDS
+
+# ====== DETECTION HISTORY ======
+# With a history database set (--history-db), every frame's scene is stored in SQLite and can be
+# queried at http://<server>:METRICS_PORT/history or with a {"history": {...}} WebSocket message
+HISTORY_DB = None
+HISTORY_FLUSH_INTERVAL = 0.5        # Seconds between batched writes
+HISTORY_RETENTION_DAYS = 7.0        # Frames older than this are deleted
+HISTORY_PRUNE_INTERVAL = 3600.0     # Seconds between retention passes
+HISTORY_MAX_PENDING = 10000         # Frames waiting for the database before the oldest are dropped
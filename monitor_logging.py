@@ -0,0 +1,148 @@
+"""Logging for the monitor: a background writer thread, per-message-type rate limits and
+optional JSON-lines output, so per-frame logs never block the event loop on disk I/O"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# Attributes every LogRecord has; anything else was passed through extra= and goes into JSON output
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def log_key(key):
+    """extra= for a rate-limited log call, e.g. logger.info("...", extra=log_key("frame"))"""
+    return {"log_key": key}
+
+
+class TextFormatter(logging.Formatter):
+    """The plain text format, plus how many similar records RateLimitFilter suppressed before this one"""
+
+    def formatMessage(self, record):
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            record.message = f"{record.message} (+{suppressed} similar suppressed)"
+        return super().formatMessage(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Per-key sampling plus a token-bucket rate limit for hot-path log calls
+
+    Only records logged with extra=log_key(...) for a configured key are limited.
+    limits maps key -> (max records per second, keep one in every N). Suppressed
+    records are counted, and the next record that gets through carries the count as
+    record.suppressed for the formatter to show; its message is left alone.
+    """
+
+    def __init__(self, limits):
+        super().__init__()
+        self.limits = limits
+        self.state = {}  # key -> [tokens, last refill, records seen, suppressed since last emit]
+        self.suppressed = 0
+
+    def filter(self, record):
+        key = getattr(record, "log_key", None)
+        if key is None:
+            return True
+        limit = self.limits.get(key)
+        if limit is None:
+            return True
+        per_second, sample_every = limit
+        state = self.state.get(key)
+        if state is None:
+            state = self.state[key] = [per_second, record.created, 0, 0]
+
+        state[2] += 1
+        tokens = min(per_second, state[0] + (record.created - state[1]) * per_second)
+        state[1] = record.created
+        if state[2] % sample_every or tokens < 1:
+            state[0] = tokens
+            state[3] += 1
+            self.suppressed += 1
+            return False
+
+        state[0] = tokens - 1
+        if state[3]:
+            record.suppressed = state[3]
+            state[3] = 0
+        return True
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the writer thread and never blocks
+
+    The stock handler formats every record on the calling thread; here the message
+    is built by the listener, so the event loop only pays for creating the record.
+    Records are dropped (and counted) if the writer falls behind.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks can't wait - the frames they reference may be gone by then
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=logging.INFO, log_format="text", log_file=None, rate_limits=None, queue_size=10000):
+    """Route all logging through a background writer thread
+
+    Returns the queue handler (for its drop/suppression counters). Safe to call once
+    per process; the writer is flushed and stopped at exit.
+    """
+    formatter = JsonLinesFormatter() if log_format == "json" else TextFormatter(TEXT_FORMAT, DATE_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = BackgroundQueueHandler(queue.Queue(queue_size))
+    rate_limit = RateLimitFilter(rate_limits or {})
+    queue_handler.addFilter(rate_limit)
+    queue_handler.rate_limit = rate_limit
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler
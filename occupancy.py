@@ -0,0 +1,147 @@
+"""Rolling per-label occupancy over the last few seconds, minutes and hours, kept up to date per frame"""
+import time
+
+
+def window_name(seconds):
+    """10 -> "10s", 60 -> "1m", 3600 -> "1h\""""
+    for unit, size in (("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{seconds:g}s"
+
+
+class RollingWindow:
+    """Per-label sums over the last `seconds`, in `slots` time buckets
+
+    Each frame is added to the current bucket and to running totals; when a bucket
+    falls out of the window its sums are subtracted again. A frame costs one update
+    per label in it however long the window is. The window moves in steps of
+    seconds / slots, so it covers between (slots - 1) and slots buckets of history.
+    """
+
+    def __init__(self, seconds, slots=60):
+        self.seconds = seconds
+        self.width = seconds / slots
+        self.frames = 0
+        self.totals = {}  # label -> [frames present, count sum, confidence sum]
+        # Per bucket: [frames, {label: [frames present, count sum, confidence sum, max count]}]
+        self.slots = [[0, {}] for _ in range(slots)]
+        self.current = -slots  # absolute index of the newest bucket
+
+    def advance(self, now):
+        """Expire the buckets that are older than the window at time now"""
+        index = int(now // self.width)
+        if index <= self.current:
+            return
+        slots = self.slots
+        totals = self.totals
+        for expired in range(max(self.current + 1, index - len(slots) + 1), index + 1):
+            slot = slots[expired % len(slots)]
+            if slot[0]:
+                self.frames -= slot[0]
+                for label, (present, count, confidence, _max) in slot[1].items():
+                    total = totals[label]
+                    if total[0] == present:
+                        del totals[label]
+                    else:
+                        total[0] -= present
+                        total[1] -= count
+                        total[2] -= confidence
+                slot[0] = 0
+                slot[1] = {}
+        self.current = index
+
+    def add(self, all_objects, now):
+        self.advance(now)
+        slot = self.slots[self.current % len(self.slots)]
+        slot[0] += 1
+        self.frames += 1
+        labels = slot[1]
+        totals = self.totals
+        for label, data in all_objects.items():
+            count = data["count"]
+            confidence = data["confidence"]
+            entry = labels.get(label)
+            if entry is None:
+                labels[label] = [1, count, confidence, count]
+            else:
+                entry[0] += 1
+                entry[1] += count
+                entry[2] += confidence
+                if count > entry[3]:
+                    entry[3] = count
+            total = totals.get(label)
+            if total is None:
+                totals[label] = [1, count, confidence]
+            else:
+                total[0] += 1
+                total[1] += count
+                total[2] += confidence
+
+    def stats(self, now, labels=None):
+        """{"frames": n, "labels": {label: presence, mean/max count, mean confidence}}
+
+        presence is the fraction of frames that had the label and mean_count is
+        averaged over every frame; mean_confidence only over frames with the label.
+        """
+        self.advance(now)
+        frames = self.frames
+        result = {}
+        for label, (present, count, confidence) in self.totals.items():
+            if labels is not None and label not in labels:
+                continue
+            result[label] = {
+                "presence": round(present / frames, 4),
+                "mean_count": round(count / frames, 4),
+                "max_count": max(slot[1][label][3] for slot in self.slots if label in slot[1]),
+                "mean_confidence": round(confidence / present, 4),
+            }
+        return {"frames": frames, "labels": result}
+
+
+class OccupancyStats:
+    """Rolling windows for one scene (a camera or the merged view) plus when each label was last seen
+
+    record() is a scene consumer and runs on every frame; summary() is only
+    called when a client or the query endpoint asks. Scenes with zones get the
+    same statistics for each zone.
+    """
+
+    def __init__(self, windows=(10.0, 60.0, 3600.0), slots=60):
+        self.window_seconds = windows
+        self.slot_count = slots
+        self.windows = {window_name(seconds): RollingWindow(seconds, slots) for seconds in windows}
+        self.last_seen = {}  # label -> monotonic time of the last frame that had it
+        self.zones = {}  # zone name -> OccupancyStats of the objects in that zone
+
+    def record(self, snapshot):
+        now = snapshot.t_parsed
+        self.add(snapshot.all_objects, now)
+        if snapshot.zones:
+            zones = self.zones
+            for name, zone in snapshot.zones.items():
+                stats = zones.get(name)
+                if stats is None:
+                    stats = zones[name] = OccupancyStats(self.window_seconds, self.slot_count)
+                stats.add(zone["objects"], now)
+
+    def add(self, all_objects, now):
+        for window in self.windows.values():
+            window.add(all_objects, now)
+        last_seen = self.last_seen
+        for label in all_objects:
+            last_seen[label] = now
+
+    def summary(self, labels=None, now=None):
+        """Every window's stats plus seconds since each label was last seen, optionally for some labels only"""
+        now = time.monotonic() if now is None else now
+        summary = {
+            "windows": {name: window.stats(now, labels) for name, window in self.windows.items()},
+            "last_seen": {
+                label: round(now - seen, 3) for label, seen in self.last_seen.items()
+                if labels is None or label in labels
+            },
+        }
+        if self.zones:
+            summary["zones"] = {name: stats.summary(labels, now) for name, stats in self.zones.items()}
+        return summary
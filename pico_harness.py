@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Run the Pico client under CPython: stub hardware, real protocol and decision code
+
+The MicroPython-only modules (machine, network, micropython, uasyncio, ubinascii,
+ujson) are replaced with small stand-ins before client_core.py and main.py are
+imported, so the code that runs here is the code that gets flashed. Two modes:
+
+- corpus (default): decode a corpus of messages built with the server's own encoders
+  (JSON and binary scenes, JSON and binary profile duties) and report the decode +
+  decision time and allocations per message for each kind
+- --live: start a monitor on a synthetic replay and run the client's WebSocket
+  framing against it, timing every message the server sends
+
+Allocations are measured with tracemalloc, so they are CPython bytes - use them to
+compare two versions of the client, not as a MicroPython heap figure.
+"""
+import argparse
+import asyncio
+import binascii
+import builtins
+import json
+import logging
+import socket
+import sys
+import time
+import tracemalloc
+import types
+from itertools import islice
+
+from camera_source import CameraSource
+from combined_monitor import CameraMonitor
+from monitor_config import DETECTION_LABELS
+from profiles import ResponseProfile
+from replay_source import synthetic_log_lines
+from wire_format import BinaryEncoder
+
+
+class Pin:
+    def __init__(self, pin_id, *args, **kwargs):
+        self.id = pin_id
+
+
+class PWM:
+    """Records what the client does to a pin instead of driving it"""
+
+    def __init__(self, pin, *args, **kwargs):
+        self.pin = pin
+        self.frequency = 0
+        self.duty = 0
+        self.changes = 0
+
+    def freq(self, value=None):
+        if value is None:
+            return self.frequency
+        self.frequency = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self.duty
+        if value != self.duty:
+            self.changes += 1
+        self.duty = value
+
+
+class WLAN:
+    """Always connected"""
+
+    def __init__(self, interface=None):
+        self.connected = True
+
+    def active(self, *args):
+        return True
+
+    def isconnected(self):
+        return self.connected
+
+    def connect(self, ssid=None, password=None):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def status(self):
+        return 3
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+
+class StreamReader:
+    """uasyncio streams have readinto(); asyncio's don't"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    async def readinto(self, view):
+        data = await self.reader.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    async def readline(self):
+        return await self.reader.readline()
+
+
+async def open_connection(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    return StreamReader(reader), writer
+
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+def install_stubs():
+    """Register the MicroPython modules the client imports"""
+    machine = types.ModuleType("machine")
+    machine.Pin = Pin
+    machine.PWM = PWM
+    network = types.ModuleType("network")
+    network.WLAN = WLAN
+    network.STA_IF = 0
+    micropython = types.ModuleType("micropython")
+    micropython.viper = micropython.native = lambda function: function
+    micropython.const = lambda value: value
+    uasyncio = types.ModuleType("uasyncio")
+    uasyncio.__dict__.update({name: getattr(asyncio, name) for name in dir(asyncio) if not name.startswith("_")})
+    uasyncio.open_connection = open_connection
+    uasyncio.sleep_ms = sleep_ms
+    sys.modules.update({"machine": machine, "network": network, "micropython": micropython,
+                        "uasyncio": uasyncio, "ubinascii": binascii, "ujson": json})
+    # Viper pointer annotations are evaluated as plain names under CPython
+    builtins.ptr8 = memoryview
+    time.ticks_ms = lambda: int(time.monotonic() * 1000)
+    time.ticks_diff = lambda end, start: end - start
+    time.ticks_add = lambda ticks, delta: ticks + delta
+
+
+class NullOutput:
+    """Swallows the client's print() output while it is being timed"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0
+
+
+def summarise(times_ns, allocations=None):
+    result = {
+        "messages": len(times_ns),
+        "mean_us": round(sum(times_ns) / len(times_ns) / 1000, 2) if times_ns else 0,
+        "p50_us": round(percentile(times_ns, 0.50) / 1000, 2),
+        "p99_us": round(percentile(times_ns, 0.99) / 1000, 2),
+    }
+    if allocations:
+        result["mean_alloc_bytes"] = round(sum(allocations) / len(allocations))
+        result["max_alloc_bytes"] = max(allocations)
+    return result
+
+
+def build_corpus(frames):
+    """Messages as the client's recv() returns them, per kind, from synthetic scenes"""
+    import client_core  # only importable once install_stubs() has run
+
+    source = CameraSource(tracking=False)  # a message per frame, not just per change
+    encoder = BinaryEncoder(DETECTION_LABELS)
+    profile = ResponseProfile.from_message(json.loads(client_core.build_profile_message())["profile"])
+    corpus = {"json": [], "binary": [], "profile_json": [], "profile_binary": []}
+    for line in islice(synthetic_log_lines(DETECTION_LABELS), frames * 2):
+        if not source.ingest_log_line(line):
+            continue
+        snapshot = source.snapshot
+        corpus["json"].append(snapshot.frame_payload.decode())
+        corpus["binary"].append(memoryview(bytearray(encoder.scene(snapshot))))
+        corpus["profile_json"].append(profile.payload(snapshot).decode())
+        corpus["profile_binary"].append(memoryview(bytearray(profile.payload(snapshot, "binary"))))
+    return corpus, memoryview(bytearray(encoder.class_table))
+
+
+def run_corpus(frames, verbose=False):
+    import client_core  # only importable once install_stubs() has run
+
+    corpus, class_table = build_corpus(frames)
+    decide = client_core.decide
+    report = {}
+    stdout = sys.stdout
+    try:
+        if not verbose:
+            sys.stdout = NullOutput()
+        decide(class_table)
+        for kind, messages in corpus.items():
+            times = []
+            for message in messages:
+                started = time.perf_counter_ns()
+                decide(message)
+                times.append(time.perf_counter_ns() - started)
+            # Separate pass: tracemalloc slows everything down
+            allocations = []
+            tracemalloc.start()
+            for message in messages:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                decide(message)
+                allocations.append(tracemalloc.get_traced_memory()[1] - before)
+            tracemalloc.stop()
+            report[kind] = summarise(times, allocations)
+    finally:
+        sys.stdout = stdout
+    return report
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_live(duration, rate, binary, profile, verbose=False, max_attempts=3):
+    """Decode everything a local monitor sends the real client for `duration` seconds
+
+    Raises OSError if the client can't connect within max_attempts tries.
+    """
+    # Only importable once install_stubs() has run
+    import client_core
+    import main as pico
+
+    port = free_port()
+    monitor = CameraMonitor(metrics_port=0, websocket_port=port, tracking=False,
+                            replay={"replay": "synthetic", "rate": rate, "loop": True})
+    tasks = [asyncio.create_task(monitor.start_websocket_server())]
+    for source in monitor.sources.values():
+        tasks.append(asyncio.create_task(source.run()))
+        tasks.append(asyncio.create_task(monitor.distribute_scenes(source)))
+    await asyncio.sleep(0.5)
+
+    client_core.USE_BINARY_PROTOCOL = binary
+    client_core.WEBSOCKET_RETRY_DELAY = 0.5  # local server: no need to wait long between attempts
+    ws = client_core.WebSocketClient("127.0.0.1", port)
+    times = []
+    stdout = sys.stdout
+    try:
+        if not verbose:
+            sys.stdout = NullOutput()
+        await ws.connect(max_attempts)
+        if profile:
+            await ws.send_frame(0x1, client_core.build_profile_message())
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            try:
+                signal = await asyncio.wait_for(ws.recv(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not signal:
+                continue
+            started = time.perf_counter_ns()
+            decision = client_core.decide(signal)
+            times.append(time.perf_counter_ns() - started)
+            if decision is not None:
+                duty, sound, trace = decision
+                pico.apply_duty(duty, sound)
+                if trace:
+                    await ws.send_frame(0x1, b'{"ack":%d}' % trace)
+        await ws.close()
+    finally:
+        sys.stdout = stdout
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "format": ("binary" if ws.binary else "json") + (" profile" if profile else " scene"),
+        "decode_and_decide": summarise(times),
+        "needle_changes": pico.alert.changes,
+        "round_trip": monitor.latency_summary()["round_trip"],
+    }
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Run and benchmark the Pico client under CPython')
+    parser.add_argument('--frames', type=int, default=2000, help='Scenes per message kind in the corpus run')
+    parser.add_argument('--live', action='store_true', help='Run the client against a local monitor instead')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of live traffic (default: 10)')
+    parser.add_argument('--rate', type=float, default=10.0, help='Frames per second the live monitor sends')
+    parser.add_argument('--json', action='store_true', help='Live client asks for JSON instead of binary')
+    parser.add_argument('--no-profile', action='store_true', help='Live client decides locally from full scenes')
+    parser.add_argument('--connect-attempts', type=int, default=3,
+                       help='Failed connects before a live run gives up (default: 3)')
+    parser.add_argument('--verbose', action='store_true', help="Show the client's own output")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    install_stubs()
+    if args.live:
+        try:
+            report = asyncio.run(run_live(args.duration, args.rate, not args.json, not args.no_profile,
+                                          args.verbose, args.connect_attempts))
+        except OSError as e:
+            print(f"❌ Live run failed: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        report = run_corpus(args.frames, args.verbose)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Per-client response profiles: the server runs the needle's priority ladder once per frame"""
+import json
+
+from wire_format import encode_duty
+
+
+class ResponseProfile:
+    """A client's scales, priority labels and sound threshold
+
+    Sent by the client at connect time as::
+
+        {"profile": {"priorities": [["person", 0.7], ["cup", 0.3]],
+                     "interesting": ["bottle", "laptop"], "other_scale": 0.1,
+                     "sound_threshold": 0.5}}
+
+    With "rules": true the server's alert rules (ALERT_RULES) replace the client's
+    ladder: the duty is the level of the strongest active rule.
+
+    Profiles compare equal when their settings match, so clients with identical
+    profiles share one evaluation and one encoded message per frame.
+    """
+
+    __slots__ = ("priorities", "interesting", "other_scale", "sound_threshold", "rules", "key")
+
+    def __init__(self, priorities, interesting=(), other_scale=0.1, sound_threshold=0.5, rules=False):
+        self.priorities = tuple((str(label).lower(), float(scale)) for label, scale in priorities)
+        self.interesting = tuple(str(label).lower() for label in interesting)
+        self.other_scale = float(other_scale)
+        self.sound_threshold = float(sound_threshold)
+        self.rules = bool(rules)
+        self.key = (self.priorities, self.interesting, self.other_scale, self.sound_threshold, self.rules)
+
+    @classmethod
+    def from_message(cls, profile):
+        """Build a profile from the client's JSON; raises ValueError if it's malformed"""
+        try:
+            return cls(
+                profile.get("priorities", ()),
+                profile.get("interesting", ()),
+                profile.get("other_scale", 0.1),
+                profile.get("sound_threshold", 0.5),
+                profile.get("rules", False),
+            )
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid response profile: {e}") from None
+
+    def __eq__(self, other):
+        return isinstance(other, ResponseProfile) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def evaluate(self, snapshot):
+        """Return (duty, sound) for a snapshot - same ladder the Pico used to run itself"""
+        all_objects = snapshot.all_objects
+        duty = 0.0
+        if self.rules:
+            duty = max(snapshot.rules.values(), default=0.0) if snapshot.rules else 0.0
+        elif all_objects:
+            # Priority 1: the scene alert (person+cup by default, see ALERT_RULES)
+            if snapshot.alert:
+                duty = snapshot.average_confidence
+            else:
+                # Priority 2+: priority labels in order, then the interesting objects
+                for label, scale in self.priorities:
+                    if label in all_objects:
+                        duty = all_objects[label]["confidence"] * scale
+                        break
+                else:
+                    for label in self.interesting:
+                        if label in all_objects:
+                            duty = all_objects[label]["confidence"] * self.other_scale
+                            break
+        duty = max(0.0, min(1.0, duty))
+        return duty, duty > self.sound_threshold
+
+    def payload(self, snapshot, encoding="json"):
+        """The tiny duty + sound message for this profile"""
+        duty, sound = self.evaluate(snapshot)
+        if encoding == "binary":
+            return encode_duty(duty, sound, snapshot.alert, snapshot.version)
+        return json.dumps({
+            "duty": round(duty, 4),
+            "sound": sound,
+            "alert": snapshot.alert,
+            "trace": snapshot.version,
+        }).encode()
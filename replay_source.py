@@ -0,0 +1,131 @@
+"""Camera sources without a camera: replay recorded rpicam output or generate synthetic detections"""
+import asyncio
+import random
+import time
+
+from camera_source import CameraSource
+from detection_parser import METADATA_PARSERS
+from monitor_config import DETECTION_LABELS
+
+# Bytes read from a recorded metadata file per chunk
+REPLAY_CHUNK_SIZE = 16 * 1024
+
+
+def synthetic_log_lines(labels, seed=0, max_objects=4, noise_lines=1, churn=0.03):
+    """Endless rpicam-style log output: a detection line with 1..max_objects objects per frame,
+    plus non-detection lines for the parser to skip
+
+    Detections look like ``Object: person[0] (0.87) @ 120,34 200x310``, so replaying
+    them goes through the same parser as a real camera. Objects persist across frames
+    like a real scene: boxes drift by a few pixels and confidences wobble, and each
+    frame an object leaves (or a new one arrives) with probability churn. seed makes
+    runs repeatable.
+    """
+    rng = random.Random(seed)
+    labels = list(labels)
+    # Most objects come from a few everyday labels, like a real scene (so the person+cup alert fires)
+    common = [label for label in ("person", "cup", "chair", "laptop", "cell phone") if label in labels] or labels[:8]
+
+    def arrival():
+        label = rng.choice(common) if rng.random() < 0.8 else rng.choice(labels)
+        x, y = rng.randrange(0, 600), rng.randrange(0, 600)
+        return [label, x, y, rng.randrange(20, 640 - x), rng.randrange(20, 640 - y), rng.uniform(0.3, 0.99)]
+
+    scene = [arrival() for _ in range(rng.randint(1, max_objects))]
+    frame = 0
+    while True:
+        frame += 1
+        for _ in range(noise_lines):
+            yield f"#{frame} (12.34 fps) exp 10000.00 ag 2.00 dg 1.00".encode()
+        scene = [obj for obj in scene if rng.random() >= churn] or [arrival()]
+        if len(scene) < max_objects and rng.random() < churn:
+            scene.append(arrival())
+        objects = []
+        for index, obj in enumerate(scene):
+            obj[1] = min(620, max(0, obj[1] + rng.randint(-3, 3)))
+            obj[2] = min(620, max(0, obj[2] + rng.randint(-3, 3)))
+            obj[5] = min(0.99, max(0.3, obj[5] + rng.uniform(-0.03, 0.03)))
+            label, x, y, width, height, confidence = obj
+            objects.append(f"{label}[{index}] ({confidence:.2f}) @ {x},{y} {width}x{height}")
+        yield ("Object: " + " ".join(objects)).encode()
+
+
+class ReplaySource(CameraSource):
+    """A CameraSource fed from a file or a generator instead of an rpicam process
+
+    replay is a path to a capture of rpicam's stderr (replay_format "log") or of the
+    metadata stream (a METADATA_PARSERS format), or "synthetic". Frames are paced at
+    rate per second; rate 0 replays as fast as the event loop allows, yielding after
+    every frame so broadcasting keeps up with parsing.
+    """
+
+    def __init__(self, replay, replay_format="log", rate=10.0, loop=False, limit=None, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.replay = replay
+        self.replay_format = replay_format
+        self.rate = rate
+        self.loop = loop
+        self.limit = limit  # stop after this many frames (None = until the input ends)
+        self.seed = seed
+        self.finished = asyncio.Event()
+
+    def command(self):
+        return ["replay", self.replay]
+
+    async def run(self):
+        """Replay the input once (or forever with loop) with the same ingest path as a camera"""
+        self.logger.info(f"Replaying {self.replay} as camera {self.name} "
+                         f"({f'{self.rate:g} frames/s' if self.rate else 'max speed'})")
+        try:
+            while True:
+                await self._replay_once()
+                if not self.loop or self.replay == "synthetic" or self._at_limit():
+                    break
+        finally:
+            self.finished.set()
+        self.logger.info(f"Replay for camera {self.name} finished after {self.frame_count} frames")
+
+    def _at_limit(self):
+        return self.limit is not None and self.frame_count >= self.limit
+
+    async def _pace(self, started, frames):
+        """Wait until frame number `frames` is due, or just yield at max speed"""
+        if self.rate:
+            delay = started + frames / self.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                return
+        await asyncio.sleep(0)
+
+    async def _replay_once(self):
+        started = time.monotonic()
+        frames = 0
+        if self.replay == "synthetic" or self.replay_format == "log":
+            lines = (synthetic_log_lines(self.detection_parser.labels, self.seed)
+                     if self.replay == "synthetic" else self._file_lines())
+            for line in lines:
+                if self.ingest_log_line(line):
+                    frames += 1
+                    if self._at_limit():
+                        return
+                    await self._pace(started, frames)
+            return
+
+        parser = METADATA_PARSERS[self.replay_format](DETECTION_LABELS)
+        with open(self.replay, "rb") as file:
+            while True:
+                chunk = file.read(REPLAY_CHUNK_SIZE)
+                if not chunk:
+                    return
+                t_read = time.monotonic()
+                for sequence, timestamp, detections in parser.feed(chunk):
+                    self.lines_read += 1
+                    self.ingest_metadata_frame(sequence, timestamp, detections, t_read)
+                    frames += 1
+                    if self._at_limit():
+                        return
+                    await self._pace(started, frames)
+
+    def _file_lines(self):
+        with open(self.replay, "rb") as file:
+            yield from file
@@ -0,0 +1,192 @@
+"""Declarative alert rules from monitor_config.ALERT_RULES, compiled once into per-frame checks"""
+from bisect import bisect_right
+
+NO_OBJECTS = {}
+UNSEEN = object()  # input value before the first frame, so every rule is evaluated once
+
+
+def compile_condition(condition):
+    """(check, input, min_confidence) for one {"label", "count"/"min_count"/"max_count", "min_confidence",
+    "zone"} condition
+
+    check(all_objects, zones) -> (matched, confidence of the label or None if absent);
+    input is the (zone, label) whose objects the check reads.
+    """
+    if not isinstance(condition, dict) or not condition.get("label"):
+        raise ValueError(f"Rule condition needs a label: {condition!r}")
+    label = str(condition["label"]).lower()
+    zone = condition.get("zone")
+    if "count" in condition:
+        low = high = int(condition["count"])
+    else:
+        high = condition.get("max_count")
+        high = int(high) if high is not None else None
+        # At least one unless "max_count": 0 asks for the label to be absent
+        low = int(condition.get("min_count", 1 if high is None else min(1, high)))
+    min_confidence = float(condition.get("min_confidence", 0.0))
+
+    def check(all_objects, zones):
+        if zone is None:
+            objects = all_objects
+        else:
+            objects = zones[zone]["objects"] if zones and zone in zones else NO_OBJECTS
+        entry = objects.get(label)
+        if entry is None:
+            return low <= 0, None
+        count = entry["count"]
+        if count < low or (high is not None and count > high):
+            return False, None
+        confidence = entry["confidence"]
+        return confidence >= min_confidence, confidence
+
+    return check, (zone, label), min_confidence
+
+
+class Rule:
+    """One compiled rule: all of "when" and at least one of "any" hold for "for" seconds
+
+    Its level while active is priority times the mean confidence of the labels it
+    matched (just priority if it only matched absent labels), so the needle can
+    be driven by the strongest active rule. It is worked out when the rule is
+    re-checked, so it follows the confidences in the engine's level steps.
+    """
+
+    __slots__ = ("name", "priority", "alert", "duration", "conditions", "alternatives", "inputs",
+                 "thresholds", "matched", "level", "since", "active")
+
+    def __init__(self, spec):
+        self.name = spec.get("name")
+        if not self.name:
+            raise ValueError(f"Alert rule without a name: {spec!r}")
+        self.priority = float(spec.get("priority", 1.0))
+        self.alert = bool(spec.get("alert", False))
+        self.duration = float(spec.get("for", 0.0))
+        compiled = [compile_condition(condition) for condition in spec.get("when", ())]
+        alternatives = [compile_condition(condition) for condition in spec.get("any", ())]
+        if not compiled and not alternatives:
+            raise ValueError(f"Alert rule {self.name!r} has no conditions")
+        self.conditions = [check for check, _input, _threshold in compiled]
+        self.alternatives = [check for check, _input, _threshold in alternatives]
+        self.inputs = {key for _check, key, _threshold in compiled + alternatives}
+        self.thresholds = {(key, threshold) for _check, key, threshold in compiled + alternatives if threshold > 0}
+        self.matched = False  # conditions held on the last evaluation
+        self.level = 0.0
+        self.since = None  # when the conditions started holding
+        self.active = False  # matched for at least `duration` seconds
+
+    def evaluate(self, all_objects, zones, now):
+        confidences = []
+        matched = True
+        for check in self.conditions:
+            ok, confidence = check(all_objects, zones)
+            if not ok:
+                matched = False
+                break
+            if confidence is not None:
+                confidences.append(confidence)
+        if matched and self.alternatives:
+            matched = False
+            for check in self.alternatives:
+                ok, confidence = check(all_objects, zones)
+                if ok:
+                    matched = True
+                    if confidence is not None:
+                        confidences.append(confidence)
+        if matched and not self.matched:
+            self.since = now
+        self.matched = matched
+        self.level = self.priority * (sum(confidences) / len(confidences) if confidences else 1.0) if matched else 0.0
+
+
+class RuleEngine:
+    """Evaluates the rules for one camera, re-checking only the rules whose inputs changed
+
+    A rule's inputs are the (zone, label) pairs its conditions read. Each frame the
+    engine compares what the conditions can see of those inputs with the previous
+    frame's: the count, and which band the confidence is in. The bands are split at
+    every min_confidence a condition uses on that input and every level_step (so
+    active rules' levels follow the confidence in steps). Rules with no changed input
+    keep their last result, so a frame where nothing moved costs one lookup and one
+    bisect per watched input however many rules there are. Rules that are matched
+    but still waiting out their "for" duration are checked against the clock.
+    """
+
+    def __init__(self, specs, camera=None, level_step=0.1):
+        self.rules = []
+        for spec in specs:
+            cameras = spec.get("cameras")
+            if cameras is not None and camera not in cameras:
+                continue
+            self.rules.append(Rule(spec))
+        names = [rule.name for rule in self.rules]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ValueError(f"Duplicate alert rule names: {', '.join(sorted(duplicates))}")
+        self.by_input = {}  # (zone, label) -> rules reading it
+        for rule in self.rules:
+            for key in rule.inputs:
+                self.by_input.setdefault(key, []).append(rule)
+        steps = [index * level_step for index in range(1, int(1 / level_step) + 1)] if level_step else []
+        self.bands = {key: set(steps) for key in self.by_input}  # (zone, label) -> confidence band edges
+        for rule in self.rules:
+            for key, threshold in rule.thresholds:
+                self.bands[key].add(threshold)
+        self.bands = {key: sorted(edges) for key, edges in self.bands.items()}
+        self.values = dict.fromkeys(self.by_input, UNSEEN)  # (count, confidence band) per input last frame
+        self.waiting = set()  # matched rules still waiting out their duration
+        self.active = {}  # name -> level of the active rules
+        self.alert = False  # whether an active rule raises the alert
+        self._published = None  # active rule names clients last saw
+        self.evaluations = 0  # rule evaluations run, for the metrics
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, all_objects, zones=None, now=0.0):
+        """Update every rule for this frame's scene; returns {name: level} of the active rules"""
+        stale = set()
+        values = self.values
+        bands = self.bands
+        for key, rules in self.by_input.items():
+            zone, label = key
+            if zone is None:
+                objects = all_objects
+            else:
+                objects = zones[zone]["objects"] if zones and zone in zones else NO_OBJECTS
+            entry = objects.get(label)
+            value = (entry["count"], bisect_right(bands[key], entry["confidence"])) if entry is not None else None
+            if value != values[key]:
+                values[key] = value
+                stale.update(rules)
+
+        changed = bool(stale)
+        waiting = self.waiting
+        for rule in stale:
+            was_active = rule.active
+            rule.evaluate(all_objects, zones, now)
+            if not rule.matched:
+                rule.active = False
+                waiting.discard(rule)
+            elif not was_active:
+                waiting.add(rule)
+        self.evaluations += len(stale)
+
+        if waiting:
+            ready = [rule for rule in waiting if now - rule.since >= rule.duration]
+            for rule in ready:
+                rule.active = True
+                waiting.discard(rule)
+            changed = changed or bool(ready)
+        if changed:
+            active = [rule for rule in self.rules if rule.active]
+            self.active = {rule.name: round(rule.level, 3) for rule in active}
+            self.alert = any(rule.alert for rule in active)
+        return self.active
+
+    def changed(self):
+        """Whether the set of active rules differs from what clients last saw"""
+        names = frozenset(self.active)
+        if names == self._published:
+            return False
+        self._published = names
+        return True
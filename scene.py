@@ -0,0 +1,292 @@
+"""Versioned, immutable scene snapshots shared by every broadcaster"""
+import itertools
+import json
+import time
+from collections import deque
+from datetime import datetime
+
+# Versions are unique across every snapshot built by this process
+_versions = itertools.count(1)
+
+
+class SceneSnapshot:
+    """One frame's detection state plus its encoded wire payloads
+
+    Built once per parsed frame and shared by all senders; the payloads are encoded
+    on first use and cached, so N clients cost one json.dumps per frame.
+    """
+
+    __slots__ = ("version", "frame", "timestamp", "alert", "all_objects",
+                 "target_detection", "target_confidence", "average_confidence",
+                 "summary", "binary_payload", "t_read", "t_parsed", "t_enqueued", "camera", "tracks", "zones",
+                 "rules",
+                 "_frame_payload", "_status_payload")
+
+    def __init__(self, frame, all_objects, target_detection, target_confidence, alert=False, timestamp=None,
+                 t_read=None, camera=None, tracks=None, zones=None,
+                 rules=None):
+        # The version doubles as the trace id echoed back by clients
+        self.version = next(_versions)
+        # Monotonic stage timestamps for latency tracing
+        self.t_parsed = time.monotonic()
+        self.t_read = t_read if t_read is not None else self.t_parsed
+        self.t_enqueued = None
+        self.camera = camera  # source camera name, None for the merged view
+        self.tracks = tracks  # confirmed object tracks (id, label, confidence, box, dwell) when tracking
+        self.zones = zones  # per-zone objects and alerts when the camera has zones
+        self.rules = rules  # active alert rule name -> level (priority x confidence)
+        self.frame = frame
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.alert = alert
+        self.all_objects = all_objects
+        self.target_detection = target_detection
+        self.target_confidence = target_confidence
+
+        # Calculate overall average confidence from all detected objects
+        if all_objects:
+            self.average_confidence = sum(obj["confidence"] for obj in all_objects.values()) / len(all_objects)
+        else:
+            self.average_confidence = 0.0
+
+        # Create detection summary
+        self.summary = ", ".join(
+            f"{data['count']} {name}(s) @{data['confidence']:.2f}" for name, data in all_objects.items()
+        )
+        self.binary_payload = None  # filled in by wire_format.BinaryEncoder on first use
+        self._frame_payload = None
+        self._status_payload = None
+
+    def _message(self):
+        message = {
+            "alert": self.alert,
+            "timestamp": self.timestamp,
+            "frame": self.frame,
+            "trace": self.version,
+            "target_detection": self.target_detection,  # Legacy compatibility
+            "target_confidence": self.target_confidence,  # Legacy compatibility
+            "average_confidence": round(self.average_confidence, 3),
+            "all_objects": self.all_objects,
+            "summary": self.summary,
+        }
+        if self.camera is not None:
+            message["camera"] = self.camera
+        if self.tracks is not None:
+            message["tracks"] = self.tracks
+        if self.zones is not None:
+            message["zones"] = self.zones
+        if self.rules is not None:
+            message["rules"] = self.rules
+        return message
+
+    @property
+    def frame_payload(self):
+        """UTF-8 JSON sent to every client when the frame is broadcast"""
+        if self._frame_payload is None:
+            message = self._message()
+            message["message"] = f"Objects detected: {self.summary}" if self.summary else "No objects detected"
+            self._frame_payload = json.dumps(message).encode()
+        return self._frame_payload
+
+    @property
+    def status_payload(self):
+        """UTF-8 JSON sent by the periodic status senders"""
+        if self._status_payload is None:
+            message = self._message()
+            message["status"] = "active"
+            message["message"] = f"Detecting: {self.summary}"
+            self._status_payload = json.dumps(message).encode()
+        return self._status_payload
+
+
+# Snapshot in place before the first frame arrives
+EMPTY_SCENE = SceneSnapshot(0, {}, {"person": 0, "cup": 0}, {"person": 0.0, "cup": 0.0})
+
+
+def merge_snapshots(snapshots, frame, t_read=None):
+    """One scene covering several cameras: counts add up, confidences are count-weighted
+
+    The merged view alerts whenever any camera does. Zones are named "<camera>/<zone>";
+    a rule active on several cameras keeps its highest level.
+    """
+    counts = {}
+    totals = {}
+    alert = False
+    tracks = None
+    zones = None
+    rules = None
+    for snapshot in snapshots:
+        alert = alert or snapshot.alert
+        if snapshot.tracks is not None:
+            tracks = (tracks or []) + snapshot.tracks
+        if snapshot.zones is not None:
+            zones = zones or {}
+            for name, zone in snapshot.zones.items():
+                zones[f"{snapshot.camera}/{name}"] = zone
+        if snapshot.rules is not None:
+            rules = rules or {}
+            for name, level in snapshot.rules.items():
+                if level >= rules.get(name, level):
+                    rules[name] = level
+        for label, data in snapshot.all_objects.items():
+            count = data["count"]
+            if label in counts:
+                counts[label] += count
+                totals[label] += data["confidence"] * count
+            else:
+                counts[label] = count
+                totals[label] = data["confidence"] * count
+    all_objects = {
+        label: {"count": count, "confidence": totals[label] / count}
+        for label, count in counts.items()
+    }
+    target_detection = {obj: counts.get(obj, 0) for obj in ("person", "cup")}
+    target_confidence = {obj: all_objects[obj]["confidence"] if obj in all_objects else 0.0
+                         for obj in ("person", "cup")}
+    return SceneSnapshot(frame, all_objects, target_detection, target_confidence, alert=alert, t_read=t_read,
+                         tracks=tracks, zones=zones, rules=rules)
+
+
+class DeltaStream:
+    """Change-only encoding of the scene for clients that opt into delta streaming
+
+    Keeps the single view of the scene that every in-sync delta client holds, so each
+    delta is computed and encoded once per frame. A client only receives deltas after a
+    keyframe. The last few deltas are kept so a client that skipped some (its max_rate)
+    catches up with one merged delta; clients further behind get a fresh keyframe. When
+    clients get periodic keyframes is up to the broadcaster.
+    """
+
+    def __init__(self, epsilon=0.05, binary_encoder=None, history=64):
+        self.epsilon = epsilon
+        self.binary_encoder = binary_encoder
+        self.history = deque(maxlen=history)  # (trace, changed labels, removed labels, alert flipped) per delta
+        self.horizon = 0  # newest trace no longer in history; clients behind it need a keyframe
+        self.view = {}  # label -> (count, confidence) as delta clients currently see it
+        self.alert = False
+        self.frame = 0
+        self.trace = 0
+        self.seq = 0
+        self.changed = {}
+        self.removed = []
+        self._payloads = {}
+        self._keyframes = {}
+        self._catch_ups = {}
+
+    def update(self, snapshot):
+        """Fold a snapshot into the shared view
+
+        Returns True when in-sync delta clients have something to receive (see payload()),
+        False when nothing moved past epsilon.
+        """
+        view = self.view
+        epsilon = self.epsilon
+        changed = {}
+        for label, data in snapshot.all_objects.items():
+            count = data["count"]
+            confidence = data["confidence"]
+            previous = view.get(label)
+            if previous is None or previous[0] != count or abs(previous[1] - confidence) > epsilon:
+                view[label] = changed[label] = (count, confidence)
+        removed = [label for label in view if label not in snapshot.all_objects]
+        for label in removed:
+            del view[label]
+
+        alert_changed = snapshot.alert != self.alert
+        self.alert = snapshot.alert
+        self.frame = snapshot.frame
+        self.trace = snapshot.version
+        self.changed = changed
+        self.removed = removed
+        # Keyframes and catch-ups carry the frame and trace, so they are rebuilt even if nothing else moved
+        self._keyframes.clear()
+        self._catch_ups.clear()
+        if not changed and not removed and not alert_changed:
+            return False
+
+        history = self.history
+        if len(history) == history.maxlen:
+            self.horizon = history[0][0]
+        history.append((self.trace, tuple(changed), tuple(removed), alert_changed))
+        self.seq += 1
+        self._payloads.clear()
+        return True
+
+    def payload(self, encoding="json"):
+        """The message for in-sync delta clients after the last update()"""
+        payload = self._payloads.get(encoding)
+        if payload is None:
+            payload = self._payloads[encoding] = self._encode_delta(self.changed, self.removed, encoding)
+        return payload
+
+    def catch_up(self, since, encoding="json"):
+        """One delta taking a client from the scene at trace since to the current view
+
+        Returns a keyframe if since is older than the kept history, and None if nothing
+        changed after since.
+        """
+        key = (since, encoding)
+        if key in self._catch_ups:
+            return self._catch_ups[key]
+        if since < self.horizon:
+            payload = self.keyframe(encoding)
+        else:
+            touched = set()
+            alert_changed = False
+            for trace, changed, removed, alert_flipped in self.history:
+                if trace > since:
+                    touched.update(changed)
+                    touched.update(removed)
+                    alert_changed = alert_changed or alert_flipped
+            if touched or alert_changed:
+                view = self.view
+                changed = {label: view[label] for label in touched if label in view}
+                payload = self._encode_delta(changed, sorted(touched.difference(view)), encoding)
+            else:
+                payload = None
+        self._catch_ups[key] = payload
+        return payload
+
+    def _encode_delta(self, changed, removed, encoding):
+        if encoding == "binary":
+            entries = [(label, count, confidence) for label, (count, confidence) in changed.items()]
+            entries.extend((label, 0, 0.0) for label in removed)
+            return self.binary_encoder.encode(entries, self.seq, self.alert, delta=True)
+        message = {
+            "type": "delta",
+            "seq": self.seq,
+            "frame": self.frame,
+            "trace": self.trace,
+            "alert": self.alert,
+        }
+        if changed:
+            message["set"] = {
+                label: {"count": count, "confidence": round(confidence, 3)}
+                for label, (count, confidence) in changed.items()
+            }
+        if removed:
+            message["del"] = removed
+        return json.dumps(message).encode()
+
+    def keyframe(self, encoding="json"):
+        """Full copy of the shared view, for new and resyncing clients"""
+        payload = self._keyframes.get(encoding)
+        if payload is None:
+            if encoding == "binary":
+                payload = self.binary_encoder.encode(
+                    [(label, count, confidence) for label, (count, confidence) in self.view.items()],
+                    self.seq, self.alert
+                )
+            else:
+                payload = json.dumps({
+                    "type": "keyframe",
+                    "seq": self.seq,
+                    "frame": self.frame,
+                    "trace": self.trace,
+                    "alert": self.alert,
+                    "all_objects": {
+                        label: {"count": count, "confidence": round(confidence, 3)}
+                        for label, (count, confidence) in self.view.items()
+                    },
+                }).encode()
+            self._keyframes[encoding] = payload
+        return payload
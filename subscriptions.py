@@ -0,0 +1,110 @@
+"""Per-client subscriptions: which cameras and labels a client wants, and how often"""
+from scene import SceneSnapshot, merge_snapshots
+
+
+class Subscription:
+    """Label, camera and confidence filter applied to the scene before it is encoded
+
+    Built from the client's control messages::
+
+        {"subscribe": {"labels": ["person", "cup"], "cameras": ["desk"]}}
+        {"min_confidence": 0.4}
+        {"max_rate": 2}
+
+    Subscriptions compare equal when their filters match, so clients with identical
+    filters share one filtered scene and one encoded payload per frame. max_rate is
+    per client and applied when queueing, so it isn't part of the comparison.
+    """
+
+    __slots__ = ("labels", "cameras", "min_confidence", "key", "_source", "_filtered")
+
+    def __init__(self, labels=None, cameras=None, min_confidence=0.0):
+        self.labels = frozenset(str(label).lower() for label in labels) if labels else None
+        self.cameras = frozenset(str(camera) for camera in cameras) if cameras else None
+        self.min_confidence = max(0.0, min(1.0, float(min_confidence)))
+        self.key = (self.labels, self.cameras, self.min_confidence)
+        self._source = None  # snapshot the cached filtered scene was built from
+        self._filtered = None
+
+    @classmethod
+    def from_message(cls, data, current=None):
+        """Apply a control message on top of the current subscription; raises ValueError if malformed"""
+        labels = current.labels if current else None
+        cameras = current.cameras if current else None
+        min_confidence = current.min_confidence if current else 0.0
+        try:
+            if "subscribe" in data:
+                subscribe = data["subscribe"] or {}
+                labels = subscribe.get("labels")
+                cameras = subscribe.get("cameras")
+                min_confidence = subscribe.get("min_confidence", min_confidence)
+                for name, value in (("labels", labels), ("cameras", cameras)):
+                    if value is not None and not isinstance(value, (list, tuple)):
+                        raise TypeError(f"{name} must be a list")
+            if "min_confidence" in data:
+                min_confidence = data["min_confidence"]
+            return cls(labels, cameras, min_confidence)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid subscription: {e}") from None
+
+    @property
+    def is_everything(self):
+        return self.labels is None and self.cameras is None and self.min_confidence <= 0.0
+
+    @property
+    def camera(self):
+        """The single camera this subscription follows, if it names exactly one"""
+        if self.cameras is not None and len(self.cameras) == 1:
+            return next(iter(self.cameras))
+        return None
+
+    def __eq__(self, other):
+        return isinstance(other, Subscription) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def apply(self, snapshot, scene_for=None):
+        """The snapshot reduced to this subscription's cameras, labels and confidence
+
+        The result keeps the original trace id and timestamps so acks and latency
+        tracing still match; it is cached until a new snapshot comes in.
+        """
+        if snapshot is self._source:
+            return self._filtered
+        source = snapshot
+        if self.cameras is not None and len(self.cameras) > 1 and scene_for is not None:
+            # Several cameras: merge just those instead of the whole installation
+            source = merge_snapshots([scene_for(camera) for camera in sorted(self.cameras)], snapshot.frame)
+        labels = self.labels
+        min_confidence = self.min_confidence
+        all_objects = {
+            label: data for label, data in source.all_objects.items()
+            if (labels is None or label in labels) and data["confidence"] >= min_confidence
+        }
+        tracks = source.tracks
+        if tracks is not None:
+            tracks = [track for track in tracks if track["label"] in all_objects]
+        zones = source.zones
+        if zones is not None:
+            zones = {
+                name: {"objects": {label: data for label, data in zone["objects"].items()
+                                   if (labels is None or label in labels) and data["confidence"] >= min_confidence},
+                       "alert": zone["alert"]}
+                for name, zone in zones.items()
+            }
+        # Legacy person/cup fields from the filtered objects, so they can't leak unsubscribed labels
+        target_detection = {obj: all_objects[obj]["count"] if obj in all_objects else 0
+                            for obj in source.target_detection}
+        target_confidence = {obj: all_objects[obj]["confidence"] if obj in all_objects else 0.0
+                             for obj in source.target_confidence}
+        filtered = SceneSnapshot(snapshot.frame, all_objects, target_detection, target_confidence,
+                                 alert=source.alert, timestamp=snapshot.timestamp, t_read=snapshot.t_read,
+                                 camera=snapshot.camera, tracks=tracks, zones=zones,
+                                 rules=source.rules)
+        filtered.version = snapshot.version
+        filtered.t_parsed = snapshot.t_parsed
+        filtered.t_enqueued = snapshot.t_enqueued
+        self._source = snapshot
+        self._filtered = filtered
+        return filtered
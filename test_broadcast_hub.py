@@ -0,0 +1,150 @@
+"""BroadcastHub delivery tests: run with python -m pytest (needs websockets installed)"""
+import asyncio
+import json
+import logging
+
+import pytest
+
+pytest.importorskip("websockets")
+
+from broadcast_hub import BroadcastHub  # noqa: E402
+from combined_monitor import CameraMonitor  # noqa: E402
+from scene import SceneSnapshot  # noqa: E402
+
+
+class FakeWebSocket:
+    remote_address = ("127.0.0.1", 1234)
+
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, payload, text=True):
+        self.messages.append(payload)
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def scene(objects, alert=False):
+    all_objects = {label: {"count": count, "confidence": confidence} for label, (count, confidence) in objects.items()}
+    return SceneSnapshot(0, all_objects, {}, {}, alert=alert)
+
+
+def apply(messages):
+    """What a delta client's view of the scene is after these messages"""
+    view = {}
+    kinds = []
+    for payload in messages:
+        message = json.loads(payload)
+        kinds.append(message["type"])
+        if message["type"] == "keyframe":
+            view = {label: entry["count"] for label, entry in message["all_objects"].items()}
+        else:
+            view.update((label, entry["count"]) for label, entry in message.get("set", {}).items())
+            for label in message.get("del", ()):
+                view.pop(label, None)
+    return view, kinds
+
+
+@pytest.fixture
+def monitor():
+    logging.disable(logging.CRITICAL)
+    yield CameraMonitor(metrics_port=0, tracking=False, replay={"replay": "synthetic"})
+    logging.disable(logging.NOTSET)
+
+
+async def broadcast(monitor, snapshot):
+    monitor.snapshot = snapshot
+    await monitor.broadcast_signal(snapshot)
+    await asyncio.sleep(0)
+
+
+def test_throttled_delta_client_catches_up_with_one_delta(monitor):
+    async def run():
+        websocket = FakeWebSocket()
+        channel = monitor.hub.add(websocket, (None, "delta", "json", None, None))
+        await broadcast(monitor, scene({"person": (1, 0.9), "cup": (1, 0.8)}))
+        channel.min_interval = 60.0
+
+        await broadcast(monitor, scene({"person": (2, 0.9), "cup": (1, 0.8)}))
+        await broadcast(monitor, scene({"person": (2, 0.9), "chair": (1, 0.7)}))
+        await broadcast(monitor, scene({"person": (2, 0.9), "chair": (1, 0.7)}, alert=True))
+        assert len(websocket.messages) == 1
+        assert channel.behind
+
+        channel.last_push = 0.0  # the client's next slot
+        await broadcast(monitor, scene({"person": (2, 0.9), "chair": (1, 0.7)}, alert=True))
+        channel.close()
+        return websocket.messages, channel
+
+    messages, channel = asyncio.run(run())
+    view, kinds = apply(messages)
+    assert kinds == ["keyframe", "delta"]
+    assert view == {"person": 2, "chair": 1}
+    assert json.loads(messages[-1])["alert"] is True
+    assert not channel.needs_keyframe and not channel.behind
+
+
+def test_unused_subscriptions_are_pruned(monitor):
+    async def run():
+        websockets = [FakeWebSocket(), FakeWebSocket()]
+        channels = [monitor.hub.add(websocket, (None, "delta", "json", None, None)) for websocket in websockets]
+        for channel, labels in zip(channels, (["person"], ["cup"])):
+            monitor.apply_subscription(channel, {"subscribe": {"labels": labels}}, channel.name)
+        assert len(monitor.subscriptions) == 2
+
+        monitor.apply_subscription(channels[0], {"subscribe": {}}, channels[0].name)
+        assert len(monitor.subscriptions) == 1
+        monitor.hub.remove(websockets[1])
+        monitor.prune_delta_streams()
+        assert monitor.subscriptions == {}
+        assert list(monitor.delta_streams) == [(None, None)]
+
+    asyncio.run(run())
+
+
+def test_occupancy_covers_only_the_subscribed_cameras():
+    logging.disable(logging.CRITICAL)
+    try:
+        monitor = CameraMonitor(metrics_port=0, tracking=False, replay={"replay": "synthetic"},
+                                cameras=[{"name": "door"}, {"name": "desk"}, {"name": "hall"}])
+    finally:
+        logging.disable(logging.NOTSET)
+
+    async def run():
+        channel = monitor.hub.add(FakeWebSocket())
+        monitor.apply_subscription(channel, {"subscribe": {"cameras": ["door", "desk"]}}, channel.name)
+        monitor.occupancy_message(channel.view)  # starts the stats for door + desk
+        for camera, objects in (("door", {"person": (1, 0.9)}), ("desk", {"cup": (2, 0.8)}),
+                                ("hall", {"chair": (1, 0.7)})):
+            snapshot = scene(objects)
+            snapshot.camera = camera
+            monitor.record_merged_occupancy(snapshot)
+        return monitor.occupancy_message(channel.view)
+
+    message = asyncio.run(run())
+    assert message["cameras"] == ["desk", "door"]
+    labels = message["windows"]["10s"]["labels"]
+    assert set(labels) == {"person", "cup"}
+    assert labels["cup"]["max_count"] == 2
+    assert "chair" in monitor.occupancy_message((None, "full", "json", None, None))["windows"]["10s"]["labels"]
+
+
+@pytest.mark.parametrize("policy", ["latest", "drop_oldest"])
+def test_slow_client_policies_keep_control_messages(policy):
+    async def run():
+        hub = BroadcastHub(max_queue=3, policy=policy)
+        channel = hub.add(FakeWebSocket())
+        channel.push(b"class table", text=False, control=True)
+        for index in range(10):  # the sender task doesn't run until we yield
+            channel.push(f"scene {index}")
+        queued = [entry[0] for entry in channel.queue]
+        channel.close()
+        return queued, channel
+
+    queued, channel = asyncio.run(run())
+    assert queued[0] == b"class table"
+    assert queued[-1] == "scene 9"
+    assert len(queued) <= 3
+    assert channel.dropped == 11 - len(queued)
+    assert channel.needs_keyframe
@@ -0,0 +1,49 @@
+"""CameraSource log ingestion tests: run with python -m pytest"""
+from camera_source import CameraSource
+
+
+def feed(source, lines):
+    for line in lines:
+        source.ingest_log_line(line.encode())
+
+
+def detection_frames(frames, start=1):
+    for frame in range(start, start + frames):
+        yield f"#{frame} (10.00 fps) exp 10000.00 ag 2.00 dg 1.00"
+        yield "Object: person[0] (0.90) @ 100,100 50x200 cup[1] (0.80) @ 300,300 40x40"
+
+
+def frame_lines(frames, start=1):
+    for frame in range(start, start + frames):
+        yield f"#{frame} (10.00 fps) exp 10000.00 ag 2.00 dg 1.00"
+
+
+def test_frame_lines_without_detections_drop_the_tracks():
+    source = CameraSource()
+    feed(source, detection_frames(10))
+    assert set(source.snapshot.all_objects) == {"person", "cup"}
+    assert source.snapshot.alert
+
+    feed(source, frame_lines(190, start=11))
+    assert source.snapshot.all_objects == {}
+    assert not source.snapshot.alert
+    assert not source.tracker.tracks
+    assert source.frame_count == 199  # the last frame line's frame isn't over yet
+
+
+def test_frame_lines_clear_the_scene_without_tracking():
+    source = CameraSource(tracking=False)
+    feed(source, detection_frames(3))
+    assert set(source.snapshot.all_objects) == {"person", "cup"}
+
+    feed(source, frame_lines(2, start=4))
+    assert source.snapshot.all_objects == {}
+    frames = source.frame_count
+    feed(source, frame_lines(5, start=6))
+    assert source.frame_count == frames  # an empty scene stays put without new frames
+
+
+def test_detection_frames_are_not_counted_twice():
+    source = CameraSource()
+    feed(source, detection_frames(5))
+    assert source.frame_count == 5
@@ -0,0 +1,71 @@
+"""Detection parser tests: run with python -m pytest"""
+import json
+
+import pytest
+
+from detection_parser import BinaryMetadataParser, DetectionParser, JsonLinesMetadataParser
+from monitor_config import DETECTION_LABELS
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return DetectionParser(DETECTION_LABELS)
+
+
+def test_full_detection_line(parser):
+    line = "Object: person[0] (0.87) @ 120,34 200x310 cup[1] (0.64) @ 300,200 40x60"
+    assert parser.parse(line) == [("person", 0.87, (120, 34, 200, 310)), ("cup", 0.64, (300, 200, 40, 60))]
+
+
+def test_box_and_id_are_optional(parser):
+    assert parser.parse("Object: person (0.9)") == [("person", 0.9, None)]
+
+
+@pytest.mark.parametrize("line", ["#12 (12.34 fps) exp 10000.00 ag 2.00 dg 1.00", "Camera started", ""])
+def test_non_detection_lines(parser, line):
+    assert parser.parse(line) is None
+    assert not parser.is_detection_line(line)
+
+
+def test_cup_does_not_match_inside_cupboard(parser):
+    assert parser.parse("Object: cupboard[0] (0.90)") is None
+    assert parser.parse("Object: cupboard[0] (0.90) cup[1] (0.80)") == [("cup", 0.8, None)]
+    assert parser.parse("Object: teacup (0.90)") is None
+
+
+def test_label_never_borrows_a_later_confidence(parser):
+    assert parser.parse("Object: person[0] cup[1] (0.80)") == [("cup", 0.8, None)]
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("Object: cell phone[2] (0.66) @ 1,2 3x4", [("cell phone", 0.66, (1, 2, 3, 4))]),
+    ("Object: teddy bear (0.5)", [("teddy bear", 0.5, None)]),
+    ("Object: person[0] (0.90) hot dog[1] (0.70)", [("person", 0.9, None), ("hot dog", 0.7, None)]),
+    ("Object: phone (0.7)", None),
+])
+def test_multi_word_labels(parser, line, expected):
+    assert parser.parse(line) == expected
+
+
+def test_labels_are_case_insensitive(parser):
+    assert parser.parse("Object: Person[0] (0.9)") == [("person", 0.9, None)]
+
+
+def test_json_lines_frames_split_across_chunks():
+    parser = JsonLinesMetadataParser(DETECTION_LABELS)
+    data = b"".join(json.dumps(record).encode() + b"\n" for record in (
+        {"frame": 1, "timestamp": 1.5, "detections": [{"label": "person", "confidence": 0.9, "box": [1, 2, 3, 4]}]},
+        {"frame": 2, "timestamp": 1.6, "detections": [{"class_id": DETECTION_LABELS.index("cup"), "confidence": 0.5}]},
+    )) + b"not json\n"
+    frames = parser.feed(data[:30]) + parser.feed(data[30:])
+    assert frames == [(1, 1.5, [("person", 0.9, (1, 2, 3, 4))]), (2, 1.6, [("cup", 0.5, None)])]
+    assert parser.malformed == 1
+
+
+def test_binary_frames_resync_after_garbage():
+    parser = BinaryMetadataParser(DETECTION_LABELS)
+    frame = BinaryMetadataParser.HEADER.pack(b"PPD1", 7, 2.5, 1) + \
+        BinaryMetadataParser.RECORD.pack(DETECTION_LABELS.index("cup"), 0.5, 1, 2, 3, 4)
+    data = b"junk" + frame + frame
+    frames = parser.feed(data[:10]) + parser.feed(data[10:])
+    assert frames == [(7, 2.5, [("cup", 0.5, (1, 2, 3, 4))])] * 2
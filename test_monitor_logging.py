@@ -0,0 +1,44 @@
+"""Log rate limiting tests: run with python -m pytest"""
+import json
+import logging
+
+from monitor_logging import JsonLinesFormatter, RateLimitFilter, TextFormatter, log_key
+
+
+def record(msg, args=(), created=0.0):
+    entry = logging.makeLogRecord({"msg": msg, "args": args, **log_key("frame")})
+    entry.created = created
+    return entry
+
+
+def passed(limit, records):
+    return [entry for entry in records if limit.filter(entry)]
+
+
+def test_suppressed_count_is_rendered_by_the_formatter():
+    limit = RateLimitFilter({"frame": (1000, 3)})
+    records = passed(limit, [record("Frame %d", (frame,)) for frame in range(1, 5)])
+    assert [entry.getMessage() for entry in records] == ["Frame 3"]
+    assert records[0].suppressed == 2
+    assert TextFormatter("%(message)s").format(records[0]) == "Frame 3 (+2 similar suppressed)"
+    assert json.loads(JsonLinesFormatter().format(records[0]))["suppressed"] == 2
+
+
+def test_literal_percent_without_args():
+    limit = RateLimitFilter({"frame": (1000, 2)})
+    records = passed(limit, [record("Queue 100% full") for _ in range(2)])
+    assert TextFormatter("%(message)s").format(records[0]) == "Queue 100% full (+1 similar suppressed)"
+
+
+def test_mapping_args_are_left_alone():
+    limit = RateLimitFilter({"frame": (1000, 2)})
+    records = passed(limit, [record("Saw %(label)s", {"label": "person"}) for _ in range(2)])
+    assert records[0].args == {"label": "person"}
+    assert TextFormatter("%(message)s").format(records[0]) == "Saw person (+1 similar suppressed)"
+
+
+def test_token_bucket_limits_the_rate():
+    limit = RateLimitFilter({"frame": (2, 1)})
+    records = passed(limit, [record("Frame", created=index / 100) for index in range(100)])
+    assert len(records) == 3  # a full bucket of 2, then 2 per second for the second that follows
+    assert limit.suppressed == 97
@@ -0,0 +1,81 @@
+"""RuleEngine tests: run with python -m pytest"""
+import pytest
+
+from rules import RuleEngine
+
+
+def scene(**labels):
+    return {label: {"count": count, "confidence": confidence} for label, (count, confidence) in labels.items()}
+
+
+def test_for_duration_holds_the_rule_back():
+    engine = RuleEngine([{"name": "lingering", "when": [{"label": "person"}], "for": 5, "alert": True}])
+    assert engine.evaluate(scene(person=(1, 0.9)), now=0.0) == {}
+    assert engine.evaluate(scene(person=(1, 0.9)), now=4.9) == {}
+    assert not engine.alert
+    assert "lingering" in engine.evaluate(scene(person=(1, 0.9)), now=5.0)
+    assert engine.alert
+
+
+def test_for_duration_restarts_when_the_conditions_break():
+    engine = RuleEngine([{"name": "lingering", "when": [{"label": "person"}], "for": 5}])
+    engine.evaluate(scene(person=(1, 0.9)), now=0.0)
+    engine.evaluate(scene(), now=3.0)
+    engine.evaluate(scene(person=(1, 0.9)), now=4.0)
+    assert engine.evaluate(scene(person=(1, 0.9)), now=8.0) == {}
+    assert "lingering" in engine.evaluate(scene(person=(1, 0.9)), now=9.0)
+
+
+def test_absent_label():
+    engine = RuleEngine([{"name": "empty_desk", "when": [{"label": "laptop"}, {"label": "person", "max_count": 0}]}])
+    assert engine.evaluate(scene(laptop=(1, 0.8))) == {"empty_desk": pytest.approx(0.8)}
+    assert engine.evaluate(scene(laptop=(1, 0.8), person=(1, 0.9))) == {}
+
+
+def test_only_rules_reading_a_changed_label_are_rechecked():
+    engine = RuleEngine([
+        {"name": "person", "when": [{"label": "person"}]},
+        {"name": "cup", "when": [{"label": "cup"}]},
+    ])
+    engine.evaluate(scene(person=(1, 0.9), cup=(1, 0.8)))
+    assert engine.evaluations == 2
+    engine.evaluate(scene(person=(2, 0.9), cup=(1, 0.8)))
+    assert engine.evaluations == 3
+
+
+def test_confidence_wobble_within_a_band_is_not_stale():
+    engine = RuleEngine([{"name": "person", "when": [{"label": "person", "min_confidence": 0.55}]}],
+                        level_step=0.1)
+    engine.evaluate(scene(person=(1, 0.61)))
+    for confidence in (0.62, 0.64, 0.66, 0.69, 0.61):
+        engine.evaluate(scene(person=(1, confidence)))
+    assert engine.evaluations == 1
+
+
+def test_crossing_a_threshold_rechecks_the_rule():
+    engine = RuleEngine([{"name": "person", "when": [{"label": "person", "min_confidence": 0.55}]}],
+                        level_step=None)
+    assert engine.evaluate(scene(person=(1, 0.6))) == {"person": 0.6}
+    assert engine.evaluate(scene(person=(1, 0.9))) == {"person": 0.6}  # no threshold crossed
+    assert engine.evaluate(scene(person=(1, 0.54))) == {}
+    assert engine.evaluate(scene(person=(1, 0.55))) == {"person": 0.55}
+    assert engine.evaluations == 3
+
+
+def test_level_follows_the_confidence_in_steps():
+    engine = RuleEngine([{"name": "person", "when": [{"label": "person"}], "priority": 0.5}], level_step=0.1)
+    engine.evaluate(scene(person=(1, 0.62)))
+    assert engine.evaluate(scene(person=(1, 0.65))) == {"person": 0.31}
+    assert engine.evaluate(scene(person=(1, 0.81))) == {"person": 0.405}
+
+
+def test_zone_condition_reads_the_zone():
+    engine = RuleEngine([{"name": "at_desk", "when": [{"label": "person", "zone": "desk"}]}])
+    zones = {"desk": {"objects": scene(person=(1, 0.9)), "alert": False}}
+    assert engine.evaluate(scene(person=(1, 0.9)), {"desk": {"objects": {}, "alert": False}}) == {}
+    assert "at_desk" in engine.evaluate(scene(person=(1, 0.9)), zones)
+
+
+def test_rules_for_other_cameras_are_skipped():
+    engine = RuleEngine([{"name": "door_only", "when": [{"label": "person"}], "cameras": ["door"]}], "desk")
+    assert len(engine) == 0
@@ -0,0 +1,86 @@
+"""DeltaStream tests: run with python -m pytest"""
+import json
+import random
+
+from scene import DeltaStream, SceneSnapshot
+
+
+def scene(frame, alert=False, **labels):
+    all_objects = {label: {"count": count, "confidence": confidence} for label, (count, confidence) in labels.items()}
+    return SceneSnapshot(frame, all_objects, {}, {}, alert=alert)
+
+
+def test_keyframe_follows_the_frame_when_nothing_moved():
+    stream = DeltaStream()
+    assert stream.update(scene(1, person=(1, 0.9)))
+    first = json.loads(stream.keyframe())
+    steady = scene(2, person=(1, 0.91))
+    assert not stream.update(steady)
+    keyframe = json.loads(stream.keyframe())
+    assert keyframe["frame"] == 2 and keyframe["trace"] == steady.version
+    assert keyframe["seq"] == first["seq"]
+    assert keyframe["all_objects"] == first["all_objects"]
+
+
+def random_scenes(count, seed=0):
+    rng = random.Random(seed)
+    labels = ["person", "cup", "chair", "laptop"]
+    for frame in range(1, count + 1):
+        present = [label for label in labels if rng.random() < 0.6]
+        yield scene(frame, alert=rng.random() < 0.3,
+                    **{label: (rng.randint(1, 3), round(rng.uniform(0.3, 0.99), 3)) for label in present})
+
+
+def apply(view, message):
+    """A delta client's handling of one message"""
+    message = json.loads(message)
+    if message["type"] == "keyframe":
+        view = dict(message["all_objects"])
+    else:
+        view = {**view, **message.get("set", {})}
+        for label in message.get("del", ()):
+            view.pop(label, None)
+    return view, message["alert"]
+
+
+def check_matches(view, snapshot, epsilon):
+    assert set(view) == set(snapshot.all_objects)
+    for label, entry in view.items():
+        assert entry["count"] == snapshot.all_objects[label]["count"]
+        assert abs(entry["confidence"] - snapshot.all_objects[label]["confidence"]) <= epsilon + 0.001
+
+
+def test_applying_every_delta_rebuilds_the_scene():
+    stream = DeltaStream(epsilon=0.05)
+    snapshots = random_scenes(300)
+    stream.update(next(snapshots))
+    view, _alert = apply({}, stream.keyframe())
+    for snapshot in snapshots:
+        if stream.update(snapshot):
+            view, alert = apply(view, stream.payload())
+            assert alert == snapshot.alert
+        check_matches(view, snapshot, 0.05)
+    assert view == json.loads(stream.keyframe())["all_objects"]
+
+
+def test_catch_up_rebuilds_the_scene_from_any_recent_version():
+    stream = DeltaStream(epsilon=0.05, history=64)
+    snapshots = list(random_scenes(100, seed=1))
+    views = {}  # scene version -> what an in-sync client had then
+    view = {}
+    for snapshot in snapshots:
+        stream.update(snapshot)
+        view, _alert = apply({}, stream.keyframe())
+        views[snapshot.version] = view
+    last = snapshots[-1]
+    for snapshot in snapshots[-60:-1]:
+        caught_up = stream.catch_up(snapshot.version)
+        if caught_up is None:
+            assert views[snapshot.version] == view
+            continue
+        message = json.loads(caught_up)
+        assert message["type"] == "delta"
+        rebuilt, alert = apply(views[snapshot.version], caught_up)
+        assert alert == last.alert
+        check_matches(rebuilt, last, 0.05)
+    assert json.loads(stream.catch_up(snapshots[0].version))["type"] == "keyframe"  # older than the history
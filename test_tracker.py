@@ -0,0 +1,71 @@
+"""ObjectTracker tests: run with python -m pytest"""
+from tracker import ObjectTracker, iou
+
+PERSON = ("person", 0.9, (100, 100, 50, 200))
+MOVED = ("person", 0.8, (105, 102, 50, 200))
+CUP = ("cup", 0.7, (300, 300, 40, 40))
+
+
+def run(tracker, frames):
+    for now, detections in enumerate(frames):
+        tracker.update(detections, float(now))
+    return tracker.scene()
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (5, 0, 10, 10)) == 50 / 150
+    assert iou((0, 0, 10, 10), (10, 0, 10, 10)) == 0.0
+
+
+def test_object_is_confirmed_after_confirm_frames():
+    tracker = ObjectTracker(confirm_frames=3)
+    assert run(tracker, [[PERSON], [MOVED]]) == {}
+    tracker.update([PERSON], 2.0)
+    assert tracker.scene()["person"]["count"] == 1
+
+
+def test_one_frame_flicker_never_shows():
+    tracker = ObjectTracker(confirm_frames=2)
+    assert run(tracker, [[PERSON], [], [PERSON], []]) == {}
+    assert not tracker.tracks
+
+
+def test_confirmed_track_keeps_its_id_as_it_moves():
+    tracker = ObjectTracker(confirm_frames=2)
+    run(tracker, [[PERSON], [MOVED], [PERSON]])
+    assert len(tracker.tracks) == 1
+    assert tracker.tracks_created == 1
+
+
+def test_confirmed_track_survives_drop_frames_empty_frames():
+    tracker = ObjectTracker(confirm_frames=2, drop_frames=3)
+    run(tracker, [[PERSON, CUP], [PERSON, CUP]])
+    for now in range(2, 5):
+        tracker.update([], float(now))
+        assert set(tracker.scene()) == {"person", "cup"}
+    tracker.update([], 5.0)
+    assert tracker.scene() == {}
+    assert not tracker.tracks
+
+
+def test_alert_hysteresis():
+    tracker = ObjectTracker(alert_on_frames=3, alert_off_frames=2)
+    assert [tracker.update_alert(raw) for raw in (True, True, False, True, True, True)] == \
+        [False, False, False, False, False, True]
+    assert [tracker.update_alert(raw) for raw in (False, True, False, False)] == [True, True, True, False]
+
+
+def test_changed_only_when_the_confirmed_tracks_move():
+    tracker = ObjectTracker(confirm_frames=2, drop_frames=1, confidence_step=0.1)
+    tracker.update([PERSON], 0.0)
+    assert tracker.changed()  # first call: nothing published yet
+    assert not tracker.changed()
+    tracker.update([PERSON], 1.0)
+    assert tracker.changed()  # confirmed
+    tracker.update([("person", 0.88, PERSON[2])], 2.0)
+    assert not tracker.changed()  # confidence moved less than the step
+    tracker.update([], 3.0)
+    assert not tracker.changed()  # coasting through a missed frame
+    tracker.update([], 4.0)
+    assert tracker.changed()  # dropped
@@ -0,0 +1,68 @@
+"""WebSocket handshake tests: run with python -m unittest (needs websockets installed)"""
+import asyncio
+import json
+import logging
+import socket
+import unittest
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+from wire_format import BINARY_SUBPROTOCOL, select_subprotocol
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class SelectSubprotocolTest(unittest.TestCase):
+    def test_binary_when_offered(self):
+        self.assertEqual(select_subprotocol(None, ["other", BINARY_SUBPROTOCOL]), BINARY_SUBPROTOCOL)
+
+    def test_none_without_offer(self):
+        self.assertIsNone(select_subprotocol(None, []))
+        self.assertIsNone(select_subprotocol(None, ["other"]))
+
+
+@unittest.skipIf(websockets is None, "websockets is not installed")
+class HandshakeTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        from combined_monitor import CameraMonitor
+
+        logging.disable(logging.CRITICAL)
+        self.port = free_port()
+        self.monitor = CameraMonitor(metrics_port=0, websocket_port=self.port, tracking=False,
+                                     replay={"replay": "synthetic", "rate": 50, "loop": True})
+        self.tasks = [asyncio.create_task(self.monitor.start_websocket_server())]
+        for source in self.monitor.sources.values():
+            self.tasks.append(asyncio.create_task(source.run()))
+            self.tasks.append(asyncio.create_task(self.monitor.distribute_scenes(source)))
+        await asyncio.sleep(0.3)
+
+    async def asyncTearDown(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        logging.disable(logging.NOTSET)
+
+    async def test_client_without_subprotocol_gets_json(self):
+        async with websockets.connect(f"ws://127.0.0.1:{self.port}/") as websocket:
+            self.assertIsNone(websocket.subprotocol)
+            message = await asyncio.wait_for(websocket.recv(), 5)
+        self.assertIsInstance(message, str)
+        self.assertIn("all_objects", json.loads(message))
+
+    async def test_client_offering_binary_gets_binary(self):
+        async with websockets.connect(f"ws://127.0.0.1:{self.port}/",
+                                      subprotocols=[BINARY_SUBPROTOCOL]) as websocket:
+            self.assertEqual(websocket.subprotocol, BINARY_SUBPROTOCOL)
+            message = await asyncio.wait_for(websocket.recv(), 5)
+        self.assertIsInstance(message, bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Binary wire format round trips through the Pico client's decoder: run with python -m pytest
+
+The client is loaded under CPython with pico_harness's stand-ins for the MicroPython
+modules (pico_harness needs websockets installed).
+"""
+import json
+
+import pytest
+
+pytest.importorskip("websockets")
+
+import pico_harness  # noqa: E402
+from monitor_config import DETECTION_LABELS  # noqa: E402
+from profiles import ResponseProfile  # noqa: E402
+from scene import DeltaStream, SceneSnapshot  # noqa: E402
+from wire_format import BinaryEncoder, encode_duty  # noqa: E402
+
+SCENES = [
+    ({}, False),
+    ({"person": (1, 0.87)}, False),
+    ({"cup": (2, 0.64)}, False),
+    ({"person": (1, 0.91), "cup": (1, 0.77)}, True),
+    ({"chair": (3, 0.5), "laptop": (1, 0.42)}, False),
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    pico_harness.install_stubs()
+    import client_core  # only importable once the stubs are in place
+    return client_core
+
+
+@pytest.fixture(scope="module")
+def encoder(client):
+    encoder = BinaryEncoder(DETECTION_LABELS)
+    assert client.decide(memoryview(bytearray(encoder.class_table))) is None
+    return encoder
+
+
+def snapshot(objects, alert):
+    all_objects = {label: {"count": count, "confidence": confidence} for label, (count, confidence) in objects.items()}
+    return SceneSnapshot(1, all_objects, {}, {}, alert=alert)
+
+
+def binary(payload):
+    return memoryview(bytearray(payload))
+
+
+def test_class_table_matches_the_labels(client, encoder):
+    assert client.class_ids == {label: class_id for class_id, label in enumerate(encoder.labels)}
+
+
+@pytest.mark.parametrize("objects, alert", SCENES)
+def test_binary_scene_decides_like_json(client, encoder, objects, alert):
+    scene = snapshot(objects, alert)
+    duty, sound, trace = client.decide(binary(encoder.scene(scene)))
+    json_duty, json_sound, json_trace = client.decide(scene.frame_payload.decode())
+    assert duty == pytest.approx(json_duty, abs=1 / 255)
+    assert bool(sound) == bool(json_sound)
+    assert trace == json_trace == scene.version
+
+
+@pytest.mark.parametrize("objects, alert", SCENES)
+def test_binary_scene_decodes_counts_and_confidences(client, encoder, objects, alert):
+    client.decide(binary(encoder.scene(snapshot(objects, alert))))
+    assert client.scene_alert == alert
+    for label in encoder.labels:
+        count, confidence = objects.get(label, (0, None))
+        assert client.scene_count[client.class_ids[label]] == count
+        if confidence is None:
+            assert client.binary_confidence(label) is None
+        else:
+            assert client.binary_confidence(label) == pytest.approx(confidence, abs=1 / 255)
+
+
+def test_binary_deltas_rebuild_the_scene(client, encoder):
+    stream = DeltaStream(epsilon=0.0, binary_encoder=encoder)
+    stream.update(snapshot(*SCENES[1]))
+    client.decide(binary(stream.keyframe("binary")))
+    for objects, alert in SCENES[2:]:
+        scene = snapshot(objects, alert)
+        assert stream.update(scene)
+        _duty, _sound, trace = client.decide(binary(stream.payload("binary")))
+        assert trace == 0  # delta sequence numbers aren't trace ids
+        assert client.scene_alert == alert
+        for label in encoder.labels:
+            assert client.scene_count[client.class_ids[label]] == objects.get(label, (0, None))[0]
+
+
+@pytest.mark.parametrize("duty, sound", [(0.0, False), (0.35, False), (1.0, True)])
+def test_duty_message(client, duty, sound):
+    decided_duty, decided_sound, trace = client.decide(binary(encode_duty(duty, sound, False, 1234)))
+    assert decided_duty == pytest.approx(duty, abs=1 / 65535)
+    assert bool(decided_sound) == sound
+    assert trace == 1234
+
+
+def test_profile_payloads_decide_the_same_in_both_encodings(client, encoder):
+    profile = ResponseProfile.from_message(json.loads(client.build_profile_message())["profile"])
+    for objects, alert in SCENES:
+        scene = snapshot(objects, alert)
+        duty, sound, trace = client.decide(binary(profile.payload(scene, "binary")))
+        json_duty, json_sound, json_trace = client.decide(profile.payload(scene).decode())
+        assert duty == pytest.approx(json_duty, abs=1 / 65535)
+        assert bool(sound) == bool(json_sound)
+        assert trace == json_trace == scene.version
@@ -0,0 +1,74 @@
+"""Zone placement tests: run with python -m pytest (the NumPy cases are skipped without NumPy)"""
+import pytest
+
+import zones
+from zones import ZoneMap, point_in_polygon, zone_polygon
+
+SQUARE = [(0, 0), (10, 0), (10, 10), (0, 10)]
+# An L shape: the square (5, 5)-(10, 10) is cut out of the 10 x 10 square
+ELL = [(0, 0), (10, 0), (10, 5), (5, 5), (5, 10), (0, 10)]
+
+ZONES = [
+    {"name": "door", "rect": [0, 0, 100, 100]},
+    {"name": "desk", "polygon": [[100, 0], [200, 0], [200, 100], [100, 100]], "alert": {"person": 1, "cup": 1}},
+]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        if zones.np is None:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(zones, "np", None)
+    return request.param
+
+
+@pytest.mark.parametrize("point, inside", [
+    ((5, 5), True), ((0.5, 9.5), True), ((-1, 5), False), ((11, 5), False), ((5, -1), False), ((5, 11), False),
+])
+def test_point_in_square(point, inside):
+    assert point_in_polygon(*point, SQUARE) is inside
+
+
+@pytest.mark.parametrize("point, inside", [((2, 2), True), ((7, 2), True), ((2, 7), True), ((7, 7), False)])
+def test_point_in_concave_polygon(point, inside):
+    assert point_in_polygon(*point, ELL) is inside
+
+
+def test_rect_becomes_a_polygon():
+    assert zone_polygon({"name": "door", "rect": [1, 2, 3, 4]}) == [(1, 2), (4, 2), (4, 6), (1, 6)]
+    with pytest.raises(ValueError):
+        zone_polygon({"name": "line", "polygon": [[0, 0], [1, 1]]})
+
+
+def test_membership_uses_the_anchor_point(backend):
+    boxes = [(40, 10, 20, 80), (140, 10, 20, 80), (40, 70, 20, 40)]
+    # The last box's bottom centre (50, 110) is below the door, its centre (50, 90) inside it
+    assert [list(row) for row in ZoneMap(ZONES).membership(boxes)] == [[True, False], [False, True], [False, False]]
+    assert [list(row) for row in ZoneMap(ZONES, anchor="center").membership(boxes)] == [
+        [True, False], [False, True], [True, False]
+    ]
+
+
+def test_evaluate_counts_per_zone(backend):
+    zone_map = ZoneMap(ZONES)
+    result = zone_map.evaluate([
+        ("person", 0.9, (110, 10, 20, 50)),
+        ("cup", 0.6, (150, 10, 10, 10)),
+        ("cup", 0.8, (160, 10, 10, 10)),
+        ("person", 0.7, (10, 10, 20, 50)),
+        ("chair", 0.5, None),  # no box: in no zone
+    ])
+    assert result["desk"]["objects"] == {"person": {"count": 1, "confidence": 0.9},
+                                         "cup": {"count": 2, "confidence": 0.7}}
+    assert result["desk"]["alert"]
+    assert result["door"]["objects"] == {"person": {"count": 1, "confidence": 0.7}}
+    assert not result["door"]["alert"]
+
+
+def test_changed_ignores_confidence(backend):
+    zone_map = ZoneMap(ZONES)
+    assert zone_map.changed(zone_map.evaluate([("person", 0.9, (10, 10, 20, 50))]))
+    assert not zone_map.changed(zone_map.evaluate([("person", 0.5, (12, 10, 20, 50))]))
+    assert zone_map.changed(zone_map.evaluate([]))
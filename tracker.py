@@ -0,0 +1,162 @@
+"""Frame-to-frame object tracking: stable ids, dwell times and debounced scene changes"""
+import itertools
+
+# Track ids are unique across every camera's tracker, so merged scenes can list them together
+_track_ids = itertools.count(1)
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, width, height) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = min(ax + aw, bx + bw) - max(ax, bx)
+    overlap_h = min(ay + ah, by + bh) - max(ay, by)
+    if overlap_w <= 0 or overlap_h <= 0:
+        return 0.0
+    overlap = overlap_w * overlap_h
+    return overlap / (aw * ah + bw * bh - overlap)
+
+
+class Track:
+    __slots__ = ("id", "label", "box", "confidence", "hits", "misses", "first_seen", "last_seen",
+                 "confirmed", "published_confidence")
+
+    def __init__(self, label, box, confidence, now):
+        self.id = next(_track_ids)
+        self.label = label
+        self.box = box
+        self.confidence = confidence
+        self.hits = 1
+        self.misses = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.confirmed = False
+        self.published_confidence = None  # confidence clients last saw for this track
+
+    def as_dict(self, now):
+        return {"id": self.id, "label": self.label, "confidence": round(self.confidence, 3),
+                "box": self.box, "dwell": round(now - self.first_seen, 2)}
+
+
+class ObjectTracker:
+    """Associates each frame's detections with existing tracks by bounding-box IoU
+
+    Matching is done per label, greedily from the best-overlapping pair down, so a
+    frame costs about (detections x tracks) of the same label - a handful in practice.
+    Detections without a box match any free track of their label.
+
+    Hysteresis: a track only counts as present after confirm_frames consecutive hits,
+    and stays present through up to drop_frames missed frames. The alert needs
+    alert_on_frames frames in a row to turn on and alert_off_frames to turn off.
+    """
+
+    def __init__(self, iou_threshold=0.3, confirm_frames=2, drop_frames=5, alert_on_frames=3,
+                 alert_off_frames=5, confidence_step=0.1, smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        self.confirm_frames = confirm_frames
+        self.drop_frames = drop_frames
+        self.alert_on_frames = alert_on_frames
+        self.alert_off_frames = alert_off_frames
+        self.confidence_step = confidence_step
+        self.smoothing = smoothing  # weight of the newest detection in a track's confidence
+        self.tracks = []
+        self.alert = False
+        self._alert_streak = 0  # consecutive frames disagreeing with the current alert state
+        self._published = None  # (confirmed track ids, alert) clients last saw
+        self.tracks_created = 0
+
+    def update(self, detections, now):
+        """Advance every track by one frame of (label, confidence, box) detections"""
+        by_label = {}
+        for detection in detections:
+            by_label.setdefault(detection[0], []).append(detection)
+        free = {}
+        for track in self.tracks:
+            free.setdefault(track.label, []).append(track)
+
+        matched = set()
+        for label, label_detections in by_label.items():
+            candidates = free.get(label, ())
+            pairs = []
+            for d_index, (_label, _confidence, box) in enumerate(label_detections):
+                for track in candidates:
+                    if box is None or track.box is None:
+                        score = self.iou_threshold  # no geometry: any track of the label will do
+                    else:
+                        score = iou(box, track.box)
+                    if score >= self.iou_threshold:
+                        pairs.append((score, track.hits, d_index, track))
+            pairs.sort(key=lambda pair: (pair[0], pair[1]), reverse=True)
+            used = set()
+            for _score, _hits, d_index, track in pairs:
+                if d_index in used or track.id in matched:
+                    continue
+                used.add(d_index)
+                matched.add(track.id)
+                _label, confidence, box = label_detections[d_index]
+                track.box = box if box is not None else track.box
+                track.confidence += self.smoothing * (confidence - track.confidence)
+                track.hits += 1
+                track.misses = 0
+                track.last_seen = now
+                if track.hits >= self.confirm_frames:
+                    track.confirmed = True
+            for d_index, (_label, confidence, box) in enumerate(label_detections):
+                if d_index not in used:
+                    track = Track(label, box, confidence, now)
+                    track.confirmed = self.confirm_frames <= 1
+                    self.tracks.append(track)
+                    matched.add(track.id)
+                    self.tracks_created += 1
+
+        kept = []
+        for track in self.tracks:
+            if track.id not in matched:
+                track.misses += 1
+                # Tentative tracks vanish at once; confirmed ones coast through short dropouts
+                if not track.confirmed or track.misses > self.drop_frames:
+                    continue
+            kept.append(track)
+        self.tracks = kept
+
+    def scene(self):
+        """all_objects from the confirmed tracks: count per label and mean track confidence"""
+        counts = {}
+        totals = {}
+        for track in self.tracks:
+            if track.confirmed:
+                label = track.label
+                counts[label] = counts.get(label, 0) + 1
+                totals[label] = totals.get(label, 0.0) + track.confidence
+        return {label: {"count": count, "confidence": totals[label] / count} for label, count in counts.items()}
+
+    def update_alert(self, raw_alert):
+        """Debounce the alert condition; returns the current (held) alert state"""
+        if raw_alert == self.alert:
+            self._alert_streak = 0
+        else:
+            self._alert_streak += 1
+            if self._alert_streak >= (self.alert_on_frames if raw_alert else self.alert_off_frames):
+                self.alert = raw_alert
+                self._alert_streak = 0
+        return self.alert
+
+    def changed(self):
+        """Whether clients need a new scene: tracks confirmed or dropped, the alert flipped,
+        or a track's confidence moved by confidence_step since it was last published"""
+        confirmed = [track for track in self.tracks if track.confirmed]
+        state = (frozenset(track.id for track in confirmed), self.alert)
+        changed = state != self._published
+        if not changed:
+            step = self.confidence_step
+            changed = any(abs(track.confidence - track.published_confidence) >= step
+                          for track in confirmed if track.published_confidence is not None)
+        if changed:
+            self._published = state
+            for track in confirmed:
+                track.published_confidence = track.confidence
+        return changed
+
+    def track_list(self, now):
+        """Confirmed tracks with ids and dwell times, for the published scene"""
+        return [track.as_dict(now) for track in self.tracks if track.confirmed]
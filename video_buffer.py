@@ -0,0 +1,242 @@
+"""Pre-event video: a fixed-size ring of the encoded H.264 stream and alert clip export"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+START_CODE = b"\x00\x00\x01"
+NAL_SPS = 7  # rpicam-vid --inline repeats SPS/PPS before every IDR frame
+
+
+class VideoRingBuffer:
+    """The last few megabytes of the Annex B byte stream in one preallocated bytearray
+
+    Nothing is decoded: the stream is only scanned for SPS start codes, which mark
+    where a decoder can start (each one begins an SPS/PPS/IDR group). Memory is
+    fixed at capacity bytes however much video goes through.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.written = 0  # total bytes ever appended; position in the ring is written % capacity
+        self.keyframes = deque()  # (absolute offset, monotonic time) of each decodable start point
+        self._tail = b""  # last bytes of the previous chunk, for start codes split across reads
+
+    def append(self, chunk, now):
+        self._scan(chunk, now)
+
+        view = memoryview(chunk)
+        if len(view) > self.capacity:
+            # Only the newest capacity bytes can be kept
+            self.written += len(view) - self.capacity
+            view = view[-self.capacity:]
+        start = self.written % self.capacity
+        first = min(len(view), self.capacity - start)
+        self.buffer[start:start + first] = view[:first]
+        if first < len(view):
+            self.buffer[:len(view) - first] = view[first:]
+        self.written += len(view)
+
+        # Forget keyframes whose bytes have been overwritten
+        oldest = self.written - self.capacity
+        keyframes = self.keyframes
+        while keyframes and keyframes[0][0] < oldest:
+            keyframes.popleft()
+
+    def _scan(self, chunk, now):
+        base = self.written
+        tail = self._tail
+        if tail:
+            # Start codes straddling the previous read
+            joined = tail + chunk[:4]
+            pos = joined.find(START_CODE)
+            while pos != -1 and pos < len(tail):
+                if pos + 3 < len(joined) and joined[pos + 3] & 0x1F == NAL_SPS:
+                    self.keyframes.append((base - len(tail) + pos, now))
+                pos = joined.find(START_CODE, pos + 1)
+        pos = chunk.find(START_CODE)
+        while pos != -1:
+            if pos + 3 < len(chunk):
+                if chunk[pos + 3] & 0x1F == NAL_SPS:
+                    self.keyframes.append((base + pos, now))
+            pos = chunk.find(START_CODE, pos + 3)
+        self._tail = chunk[-3:]
+
+    def preroll_start(self, since):
+        """Offset of the newest keyframe at or before since (else the oldest kept), or None"""
+        start = None
+        for offset, timestamp in self.keyframes:
+            if timestamp > since and start is not None:
+                break
+            start = offset
+        return start
+
+    def read(self, start):
+        """Copy of everything from absolute offset start up to the newest byte"""
+        start = max(start, self.written - self.capacity)
+        length = self.written - start
+        begin = start % self.capacity
+        if begin + length <= self.capacity:
+            return bytes(self.buffer[begin:begin + length])
+        return bytes(self.buffer[begin:]) + bytes(self.buffer[:length - (self.capacity - begin)])
+
+
+class Clip:
+    __slots__ = ("path", "started", "deadline", "truncated", "resync")
+
+    def __init__(self, path, started, deadline):
+        self.path = path
+        self.started = started
+        self.deadline = deadline
+        self.truncated = False
+        self.resync = False  # data was dropped: write nothing until the next keyframe
+
+
+class ClipRecorder:
+    """Video consumer that keeps a pre-event ring and writes pre-roll + post-roll clips on alert
+
+    feed() and trigger() run on the event loop and never touch the disk; a single
+    writer task does the file I/O in a worker thread. Bytes waiting for the writer
+    are capped at max_pending, so memory stays bounded under continuous alerts.
+    When data has to be dropped, the clip skips ahead to the next keyframe so the
+    file stays decodable; a timer closes the clip at its deadline even if the video
+    stops.
+    """
+
+    def __init__(self, directory, pre_seconds=5.0, post_seconds=5.0, max_seconds=60.0,
+                 buffer_bytes=8 * 1024 * 1024, max_pending=4 * 1024 * 1024, logger=None):
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_seconds = max_seconds
+        self.max_pending = max_pending
+        self.ring = VideoRingBuffer(buffer_bytes)
+        self.logger = logger or logging.getLogger(__name__)
+        self.clip = None
+        self._timer = None  # closes the clip at its deadline when no video arrives
+        self.jobs = asyncio.Queue()  # ("open", path) / ("data", bytes) / ("close", clip)
+        self.pending = 0  # bytes queued for the writer
+        self.clips_started = 0
+        self.clips_written = 0
+        self.bytes_dropped = 0
+
+    def feed(self, chunk):
+        """Video consumer: buffer a chunk, and pass it on while a clip is recording"""
+        now = time.monotonic()
+        ring = self.ring
+        base = ring.written
+        ring.append(chunk, now)
+        clip = self.clip
+        if clip is None:
+            return
+        if now >= clip.deadline:
+            self._close()
+            return
+        if clip.resync:
+            # Resume at the first keyframe in this chunk (it may start in the previous one)
+            start = None
+            for offset, _timestamp in reversed(ring.keyframes):
+                if offset < base - len(START_CODE):
+                    break
+                start = offset
+            if start is None:
+                self.bytes_dropped += len(chunk)
+                return
+            clip.resync = False
+            chunk = ring.read(start)
+        self._queue_data(clip, chunk)
+
+    def record_scene(self, snapshot):
+        """Scene consumer: trigger (or extend) a clip on every frame that has the alert"""
+        if snapshot.alert:
+            self.trigger()
+
+    def trigger(self):
+        """Start a clip on alert, or keep the current one running for another post-roll"""
+        now = time.monotonic()
+        clip = self.clip
+        if clip is not None:
+            clip.deadline = min(clip.started + self.max_seconds, now + self.post_seconds)
+            return
+        ring = self.ring
+        start = ring.preroll_start(now - self.pre_seconds)
+        if start is None:
+            self.logger.debug("No keyframe buffered yet - skipping clip")
+            return
+        self.clips_started += 1
+        name = f"alert_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.clips_started}.h264"
+        clip = self.clip = Clip(os.path.join(self.directory, name), now, now + self.post_seconds)
+        self.jobs.put_nowait(("open", clip.path))
+        self._timer = asyncio.get_running_loop().call_later(self.post_seconds, self._expire)
+        # A pre-roll bigger than the writer's budget starts at a later keyframe instead
+        budget = self.max_pending - self.pending
+        if ring.written - start > budget:
+            clip.truncated = True
+            later = [offset for offset, _timestamp in ring.keyframes
+                     if offset > start and ring.written - offset <= budget]
+            if not later:
+                clip.resync = True
+                self.bytes_dropped += ring.written - start
+                self.logger.info(f"🎬 Recording alert clip {clip.path} (no pre-roll - writer is behind)")
+                return
+            self.bytes_dropped += later[0] - start
+            start = later[0]
+        self._queue_data(clip, ring.read(start))
+        self.logger.info(f"🎬 Recording alert clip {clip.path}")
+
+    def _queue_data(self, clip, data):
+        if self.pending + len(data) > self.max_pending:
+            # Writer can't keep up - drop rather than grow without bound, and only resume
+            # at a keyframe: bytes after a gap inside a GOP can't be decoded
+            clip.truncated = True
+            clip.resync = True
+            self.bytes_dropped += len(data)
+            return
+        self.pending += len(data)
+        self.jobs.put_nowait(("data", data))
+
+    def _expire(self):
+        """Timer callback: close the clip at its deadline, or wait for the extended one"""
+        self._timer = None
+        clip = self.clip
+        if clip is None:
+            return
+        remaining = clip.deadline - time.monotonic()
+        if remaining > 0:
+            self._timer = asyncio.get_running_loop().call_later(remaining, self._expire)
+        else:
+            self._close()
+
+    def _close(self):
+        clip = self.clip
+        self.clip = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.jobs.put_nowait(("close", clip))
+
+    async def run(self):
+        """Writer task: the only place clip files are touched"""
+        os.makedirs(self.directory, exist_ok=True)
+        file = None
+        while True:
+            kind, item = await self.jobs.get()
+            try:
+                if kind == "open":
+                    file = await asyncio.to_thread(open, item, "wb")
+                elif kind == "data":
+                    self.pending -= len(item)
+                    if file is not None:
+                        await asyncio.to_thread(file.write, item)
+                elif file is not None:
+                    await asyncio.to_thread(file.close)
+                    file = None
+                    self.clips_written += 1
+                    note = " (truncated - writer fell behind)" if item.truncated else ""
+                    self.logger.info(f"🎬 Alert clip saved: {item.path}{note}")
+            except OSError as e:
+                self.logger.error(f"Error writing alert clip: {e}")
+                file = None
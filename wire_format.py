@@ -0,0 +1,105 @@
+"""Compact binary wire format, selected per connection through the WebSocket subprotocol
+
+Clients that don't ask for a subprotocol (or ask for peeperpam.json) keep getting JSON.
+All integers are little endian.
+
+Class table (sent once, straight after the handshake)::
+
+    u8 type = MSG_CLASS_TABLE, u8 count, then count x (u8 length, name bytes)
+
+Scene (one per broadcast)::
+
+    u8 type = MSG_SCENE, u8 flags, u8 average confidence, u8 entry count, u32 seq,
+    then entry count x (u8 class id, u8 object count, u8 confidence)
+
+Duty (one per broadcast, for clients that sent a response profile)::
+
+    u8 type = MSG_DUTY, u8 flags, u16 duty (0-65535, ready for PWM.duty_u16), u32 trace
+
+Confidences are quantized to 0-255. Class ids index the class table. seq is the scene
+version, which is also the trace id clients echo back in {"ack": seq} (on ?stream=delta
+connections it is the delta sequence instead). With FLAG_DELTA set the
+entries are changes only, and an object count of 0 means the label disappeared.
+"""
+import struct
+
+BINARY_SUBPROTOCOL = "peeperpam.bin.v1"
+JSON_SUBPROTOCOL = "peeperpam.json"
+SUBPROTOCOLS = [BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL]
+
+
+def select_subprotocol(connection, subprotocols):
+    """websockets.serve(select_subprotocol=...): our first protocol the client offers, else None
+
+    None accepts the connection without a subprotocol (plain JSON). Passing only
+    subprotocols= makes websockets 14+ reject clients that don't offer one.
+    """
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in subprotocols:
+            return subprotocol
+    return None
+
+MSG_CLASS_TABLE = 1
+MSG_SCENE = 2
+MSG_DUTY = 3
+
+FLAG_ALERT = 0x01
+FLAG_DELTA = 0x02
+FLAG_SOUND = 0x04
+
+SCENE_HEADER = struct.Struct("<BBBBI")
+SCENE_ENTRY = struct.Struct("<BBB")
+DUTY_MESSAGE = struct.Struct("<BBHI")
+
+
+def quantize(confidence):
+    """Map a 0.0-1.0 confidence to a single byte"""
+    return min(255, max(0, int(confidence * 255 + 0.5)))
+
+
+def encode_duty(duty, sound, alert, trace):
+    """Encode a profile's duty + sound flag"""
+    flags = (FLAG_ALERT if alert else 0) | (FLAG_SOUND if sound else 0)
+    return DUTY_MESSAGE.pack(MSG_DUTY, flags, min(65535, max(0, int(duty * 65535))), trace & 0xFFFFFFFF)
+
+
+class BinaryEncoder:
+    """Encode scenes against a fixed class-id table built from the label vocabulary"""
+
+    def __init__(self, labels):
+        if len(labels) > 255:
+            raise ValueError(f"Binary wire format supports at most 255 labels, got {len(labels)}")
+        self.labels = [label.lower() for label in labels]
+        self.class_ids = {label: class_id for class_id, label in enumerate(self.labels)}
+
+        table = bytearray((MSG_CLASS_TABLE, len(self.labels)))
+        for label in self.labels:
+            name = label.encode()
+            table.append(len(name))
+            table += name
+        self.class_table = bytes(table)
+
+    def encode(self, entries, seq, alert=False, average_confidence=0.0, delta=False):
+        """Encode (label, count, confidence) entries; labels outside the table are skipped"""
+        class_ids = self.class_ids
+        entries = [(class_ids[label], count, confidence) for label, count, confidence in entries
+                   if label in class_ids][:255]
+        flags = (FLAG_ALERT if alert else 0) | (FLAG_DELTA if delta else 0)
+
+        buffer = bytearray(SCENE_HEADER.size + SCENE_ENTRY.size * len(entries))
+        SCENE_HEADER.pack_into(buffer, 0, MSG_SCENE, flags, quantize(average_confidence),
+                               len(entries), seq & 0xFFFFFFFF)
+        offset = SCENE_HEADER.size
+        for class_id, count, confidence in entries:
+            SCENE_ENTRY.pack_into(buffer, offset, class_id, min(count, 255), quantize(confidence))
+            offset += SCENE_ENTRY.size
+        return bytes(buffer)
+
+    def scene(self, snapshot):
+        """Binary payload for a full snapshot, cached on the snapshot"""
+        if snapshot.binary_payload is None:
+            snapshot.binary_payload = self.encode(
+                ((label, data["count"], data["confidence"]) for label, data in snapshot.all_objects.items()),
+                snapshot.version, snapshot.alert, snapshot.average_confidence
+            )
+        return snapshot.binary_payload
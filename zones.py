@@ -0,0 +1,154 @@
+"""Per-camera zones: which zone each detected object is in, for every box and zone at once
+
+Zones are rectangles or polygons in the same pixel coordinates as the detection
+boxes. Each object is placed by one anchor point of its box (the bottom centre by
+default, i.e. where a person is standing) and tested against every zone with a
+ray-casting point-in-polygon test. With NumPy the test for all boxes x zones x
+edges of a frame is a handful of array operations; without it the same test runs
+as plain Python loops, which is fine for a few zones.
+"""
+try:
+    import numpy as np
+except ImportError:  # optional: only needed to make zone evaluation cheap at high zone/box counts
+    np = None
+
+ANCHORS = ("bottom", "center")
+
+
+def zone_polygon(zone):
+    """The zone's outline as a list of (x, y) points; raises ValueError if it has none"""
+    if "rect" in zone:
+        x, y, width, height = zone["rect"]
+        return [(x, y), (x + width, y), (x + width, y + height), (x, y + height)]
+    points = [tuple(point) for point in zone.get("polygon") or ()]
+    if len(points) < 3:
+        raise ValueError(f"Zone {zone.get('name')!r} needs a rect or a polygon of at least 3 points")
+    return points
+
+
+def anchor_point(box, anchor):
+    x, y, width, height = box
+    return x + width / 2, y + height if anchor == "bottom" else y + height / 2
+
+
+def point_in_polygon(x, y, polygon):
+    inside = False
+    x1, y1 = polygon[-1]
+    for x2, y2 in polygon:
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class ZoneMap:
+    """One camera's zones, compiled once; evaluate() runs on every frame
+
+    Each zone is {"name", "rect": [x, y, width, height]} or {"name", "polygon":
+    [[x, y], ...]}, plus an optional "alert": {label: minimum count} rule that
+    raises the zone's alert while all those labels are in it in those numbers.
+    """
+
+    def __init__(self, zones, anchor="bottom"):
+        if anchor not in ANCHORS:
+            raise ValueError(f"Zone anchor must be one of {', '.join(ANCHORS)}, got {anchor!r}")
+        self.anchor = anchor
+        self.names = []
+        self.rules = []
+        self.polygons = []
+        for zone in zones:
+            name = zone.get("name")
+            if not name:
+                raise ValueError(f"Zone without a name: {zone!r}")
+            if name in self.names:
+                raise ValueError(f"Duplicate zone name {name!r}")
+            self.names.append(name)
+            self.polygons.append(zone_polygon(zone))
+            self.rules.append({label.lower(): count for label, count in (zone.get("alert") or {}).items()})
+        self._published = None  # per-zone counts and alerts clients last saw
+        if np is not None and self.polygons:
+            self._compile()
+
+    def _compile(self):
+        """Edge arrays of shape (zones, edges), padded with horizontal edges that never cross a ray"""
+        edges = max(len(polygon) for polygon in self.polygons)
+        x1 = np.zeros((len(self.polygons), edges))
+        y1 = np.zeros_like(x1)
+        x2 = np.zeros_like(x1)
+        y2 = np.zeros_like(x1)
+        for index, polygon in enumerate(self.polygons):
+            points = np.array(polygon, dtype=float)
+            count = len(points)
+            x1[index, :count], y1[index, :count] = points[:, 0], points[:, 1]
+            x2[index, :count], y2[index, :count] = np.roll(points[:, 0], -1), np.roll(points[:, 1], -1)
+        rise = y2 - y1
+        horizontal = rise == 0
+        self._x1 = x1
+        self._y1 = y1
+        self._y2 = y2
+        self._slope = np.where(horizontal, 0.0, (x2 - x1) / np.where(horizontal, 1.0, rise))
+
+    def __len__(self):
+        return len(self.names)
+
+    def membership(self, boxes):
+        """(boxes x zones) booleans: whether each box's anchor point is inside each zone"""
+        if np is None:
+            anchor = self.anchor
+            return [[point_in_polygon(*anchor_point(box, anchor), polygon) for polygon in self.polygons]
+                    for box in boxes]
+        boxes = np.asarray(boxes, dtype=float)
+        x = (boxes[:, 0] + boxes[:, 2] / 2)[:, None, None]
+        y = (boxes[:, 1] + boxes[:, 3] * (1.0 if self.anchor == "bottom" else 0.5))[:, None, None]
+        crosses = ((self._y1 > y) != (self._y2 > y)) & (x < self._x1 + (y - self._y1) * self._slope)
+        return np.count_nonzero(crosses, axis=2) % 2 == 1
+
+    def evaluate(self, detections):
+        """{zone: {"objects": {label: {"count", "confidence"}}, "alert": bool}} for (label, confidence, box)
+        detections; objects without a box are in no zone"""
+        zones = {name: {"objects": {}, "alert": False} for name in self.names}
+        boxed = [detection for detection in detections if detection[2] is not None]
+        if not boxed or not self.names:
+            return zones
+        inside = self.membership([detection[2] for detection in boxed])
+        if np is None:
+            for (label, confidence, _box), row in zip(boxed, inside):
+                for name, hit in zip(self.names, row):
+                    if hit:
+                        objects = zones[name]["objects"]
+                        entry = objects.get(label)
+                        if entry is None:
+                            objects[label] = {"count": 1, "confidence": confidence}
+                        else:
+                            entry["count"] += 1
+                            entry["confidence"] += confidence
+        else:
+            # Per-label sums for every zone at once: (labels x boxes) one-hot times (boxes x zones)
+            labels, label_index = np.unique([detection[0] for detection in boxed], return_inverse=True)
+            onehot = np.zeros((len(labels), len(boxed)))
+            onehot[label_index, np.arange(len(boxed))] = 1.0
+            inside = inside.astype(float)
+            counts = onehot @ inside
+            confidences = (onehot * np.array([detection[1] for detection in boxed])) @ inside
+            for label, zone in zip(*np.nonzero(counts)):
+                zones[self.names[zone]]["objects"][str(labels[label])] = {
+                    "count": int(counts[label, zone]), "confidence": float(confidences[label, zone])
+                }
+        for name, rule in zip(self.names, self.rules):
+            objects = zones[name]["objects"]
+            for entry in objects.values():
+                entry["confidence"] = round(entry["confidence"] / entry["count"], 3)
+            if rule:
+                zones[name]["alert"] = all(
+                    label in objects and objects[label]["count"] >= count for label, count in rule.items()
+                )
+        return zones
+
+    def changed(self, zones):
+        """Whether a zone's object counts or alert differ from what clients last saw"""
+        state = {name: ({label: entry["count"] for label, entry in zone["objects"].items()}, zone["alert"])
+                 for name, zone in zones.items()}
+        if state == self._published:
+            return False
+        self._published = state
+        return True